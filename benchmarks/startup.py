@@ -0,0 +1,168 @@
+########################################################################################################################
+# Copyright © 2018 Esko-Kalervo Salaka.
+# All rights reserved.
+#
+#
+# Zope Public License (ZPL) Version 2.1
+#
+# A copyright notice accompanies this license document that identifies the
+# copyright holders.
+#
+# This license has been certified as open source. It has also been designated as
+# GPL compatible by the Free Software Foundation (FSF).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions in source code must retain the accompanying copyright
+# notice, this list of conditions, and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the accompanying copyright
+# notice, this list of conditions, and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Names of the copyright holders must not be used to endorse or promote
+# products derived from this software without prior written permission from the
+# copyright holders.
+#
+# 4. The right to distribute this software or to use it for any purpose does not
+# give you the right to use Servicemarks (sm) or Trademarks (tm) of the
+# copyright
+# holders. Use of them is covered by separate agreement with the copyright
+# holders.
+#
+# 5. If any files are modified, you must cause the modified files to carry
+# prominent notices stating that you changed the files and the date of any
+# change.
+#
+# Disclaimer
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY EXPRESSED
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# This software uses ZODB, a native object database for Python, which is a
+# copyright © by Zope Foundation and Contributors.
+#
+# This software uses Scryfall's rest-like API which is a copyright © by Scryfall LLC.
+#
+# This software uses rest-like API of magicthegathering.io which is a copyright © by Andrew Backes.
+#
+# This software uses the Python Imaging Library (PIL) which is a copyright © 1997-2011 by Secret Labs AB and
+# copyright © 1995-2011 by Fredrik Lundh
+#
+# All the graphical and literal information and data related to Magic: The Gathering which can be handled with this
+# software, such as card information and card images, is copyright of Wizards of the Coast LLC, a
+# Hasbro inc. subsidiary.
+#
+# This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
+# Wizards of the Coast.
+########################################################################################################################
+"""Measures how long it takes to import mtgtools and to open a database with MtgDB. Every measurement is done in a
+fresh Python process so that nothing is cached in the interpreter between the runs.
+
+Usage:
+    python benchmarks/startup.py
+    python benchmarks/startup.py path/to/large.fs --runs 20
+    python benchmarks/startup.py path/to/large.fs --importtime
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+
+start = time.perf_counter()
+from mtgtools.MtgDB import MtgDB
+imported = time.perf_counter()
+
+result = {{'import': imported - start}}
+
+if {path!r}:
+    db = MtgDB({path!r}, read_only=True)
+    opened = time.perf_counter()
+    len(db.root.scryfall_cards)
+    queried = time.perf_counter()
+    db.close()
+
+    result['open'] = opened - imported
+    result['first_len'] = queried - opened
+
+result['modules'] = sorted(name for name in ('requests', 'asyncio', 'concurrent.futures', 'PIL', 'sqlite3',
+                                             'urllib.request', 'json', 'uuid')
+                           if name in sys.modules)
+print(json.dumps(result))
+"""
+
+
+def measure(path, runs):
+    code = MEASURE.format(root=ROOT, path=path or '')
+    results = []
+
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    return results
+
+
+def import_profile(num):
+    """Returns the 'num' slowest modules imported by 'import mtgtools.MtgDB' with their cumulative times in
+    microseconds using 'python -X importtime'."""
+    code = 'import sys; sys.path.insert(0, {!r}); import mtgtools.MtgDB'.format(ROOT)
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], check=True,
+                            stderr=subprocess.PIPE, universal_newlines=True).stderr
+    modules = []
+
+    for line in stderr.splitlines():
+        parts = line.split('|')
+
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            modules.append((int(parts[1]), parts[2].rstrip()))
+
+    return sorted(modules, reverse=True)[:num]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the import time of mtgtools and the open time of MtgDB.')
+    parser.add_argument('path', nargs='?', help='A database file (.fs) to open. Preferably a large one.')
+    parser.add_argument('--runs', type=int, default=10, help='The number of fresh processes to measure.')
+    parser.add_argument('--importtime', action='store_true', help='Also show the slowest imported modules.')
+    args = parser.parse_args()
+
+    results = measure(args.path, args.runs)
+
+    for key in ('import', 'open', 'first_len'):
+        times = [result[key] * 1000 for result in results if key in result]
+
+        if times:
+            print('{:<10} median {:8.1f} ms   min {:8.1f} ms   max {:8.1f} ms'.format(
+                key, statistics.median(times), min(times), max(times)))
+
+    print('heavy modules loaded: {}'.format(', '.join(results[-1]['modules']) or 'none'))
+
+    if args.importtime:
+        print('\nslowest imports (cumulative us):')
+        for cumulative, name in import_profile(25):
+            print('{:>10}  {}'.format(cumulative, name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+########################################################################################################################
+# Copyright © 2018 Esko-Kalervo Salaka.
+# All rights reserved.
+#
+#
+# Zope Public License (ZPL) Version 2.1
+#
+# A copyright notice accompanies this license document that identifies the
+# copyright holders.
+#
+# This license has been certified as open source. It has also been designated as
+# GPL compatible by the Free Software Foundation (FSF).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions in source code must retain the accompanying copyright
+# notice, this list of conditions, and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the accompanying copyright
+# notice, this list of conditions, and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Names of the copyright holders must not be used to endorse or promote
+# products derived from this software without prior written permission from the
+# copyright holders.
+#
+# 4. The right to distribute this software or to use it for any purpose does not
+# give you the right to use Servicemarks (sm) or Trademarks (tm) of the
+# copyright
+# holders. Use of them is covered by separate agreement with the copyright
+# holders.
+#
+# 5. If any files are modified, you must cause the modified files to carry
+# prominent notices stating that you changed the files and the date of any
+# change.
+#
+# Disclaimer
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY EXPRESSED
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# This software uses ZODB, a native object database for Python, which is a
+# copyright © by Zope Foundation and Contributors.
+#
+# This software uses Scryfall's rest-like API which is a copyright © by Scryfall LLC.
+#
+# This software uses rest-like API of magicthegathering.io which is a copyright © by Andrew Backes.
+#
+# This software uses the Python Imaging Library (PIL) which is a copyright © 1997-2011 by Secret Labs AB and
+# copyright © 1995-2011 by Fredrik Lundh
+#
+# All the graphical and literal information and data related to Magic: The Gathering which can be handled with this
+# software, such as card information and card images, is copyright of Wizards of the Coast LLC, a
+# Hasbro inc. subsidiary.
+#
+# This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
+# Wizards of the Coast.
+########################################################################################################################
+from mtgtools.PCardList import CardListBase, PCardList
+
+
+class CardListView(CardListBase):
+    """CardListView is a lightweight, non-persistent list of card objects returned by the filtering, querying and
+    grouping methods of card lists, eg. PCardList.where. It has the same read API as PCardList (see CardListBase), so
+    the results can be queried further, printed and exported just like persistent lists, but creating one only wraps
+    a plain Python list: it has no 'id', no 'creation_date' and no copy of the cards in a PersistentList.
+
+    Views are not meant to be stored in the database. A view is saved by turning it into a new PCardList with
+    'persist'. Unlike PCardLists, views are considered equal only if they are the same object.
+
+    Args:
+        cards (PCardList, CardListView, list[PCard], tuple[PCard]): Initial cards of the view.
+        sideboard (PCardList, CardListView, list[PCard], tuple[PCard]): Initial cards of the sideboard of the view.
+        name (str): Name of the view
+    """
+
+    __slots__ = ('_cards', '_sideboard', 'name')
+
+    def __init__(self, cards=None, sideboard=None, name=''):
+        self._cards = list(cards.cards if isinstance(cards, CardListBase) else cards or ())
+        self._sideboard = list(sideboard.cards if isinstance(sideboard, CardListBase) else sideboard or ())
+        self.name = name
+
+    def __reduce__(self):
+        raise TypeError('CardListView objects can not be stored or pickled. Use persist() to create a PCardList.')
+
+    def __copy__(self):
+        return CardListView.wrap(list(self._cards), list(self._sideboard), self.name)
+
+    @classmethod
+    def wrap(cls, cards, sideboard=(), name=''):
+        """Returns a new view of a given list of cards without copying it. The list should not be changed afterwards.
+
+        Args:
+            cards (list[PCard]): The cards of the view.
+            sideboard (list[PCard], tuple[PCard]): The cards of the sideboard of the view.
+            name (str): Name of the view
+
+        Returns:
+            CardListView: A new view of the cards.
+        """
+        view = cls.__new__(cls)
+        view._cards = cards if type(cards) is list else list(cards)
+        view._sideboard = sideboard
+        view.name = name
+        return view
+
+    def persist(self, name=None, btree=False):
+        """Returns a new persistent list (PCardList) of the cards and the sideboard of this view, which can be saved in
+        the database.
+
+        Args:
+            name (str): Name of the new list. By default the name of this view.
+            btree (bool): If True, the cards are stored in the buckets of a BTree instead of a single PersistentList.
+
+        Returns:
+            PCardList: A new persistent list of the cards of this view.
+        """
+        return PCardList(self._cards, list(self._sideboard), self.name if name is None else name, btree)
+
+    @property
+    def cards(self):
+        return self._cards
+
+    @property
+    def sideboard(self):
+        return self._sideboard
@@ -0,0 +1,740 @@
+########################################################################################################################
+# Copyright © 2018 Esko-Kalervo Salaka.
+# All rights reserved.
+#
+#
+# Zope Public License (ZPL) Version 2.1
+#
+# A copyright notice accompanies this license document that identifies the
+# copyright holders.
+#
+# This license has been certified as open source. It has also been designated as
+# GPL compatible by the Free Software Foundation (FSF).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions in source code must retain the accompanying copyright
+# notice, this list of conditions, and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the accompanying copyright
+# notice, this list of conditions, and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Names of the copyright holders must not be used to endorse or promote
+# products derived from this software without prior written permission from the
+# copyright holders.
+#
+# 4. The right to distribute this software or to use it for any purpose does not
+# give you the right to use Servicemarks (sm) or Trademarks (tm) of the
+# copyright
+# holders. Use of them is covered by separate agreement with the copyright
+# holders.
+#
+# 5. If any files are modified, you must cause the modified files to carry
+# prominent notices stating that you changed the files and the date of any
+# change.
+#
+# Disclaimer
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY EXPRESSED
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# This software uses ZODB, a native object database for Python, which is a
+# copyright © by Zope Foundation and Contributors.
+#
+# This software uses Scryfall's rest-like API which is a copyright © by Scryfall LLC.
+#
+# This software uses rest-like API of magicthegathering.io which is a copyright © by Andrew Backes.
+#
+# This software uses the Python Imaging Library (PIL) which is a copyright © 1997-2011 by Secret Labs AB and
+# copyright © 1995-2011 by Fredrik Lundh
+#
+# All the graphical and literal information and data related to Magic: The Gathering which can be handled with this
+# software, such as card information and card images, is copyright of Wizards of the Coast LLC, a
+# Hasbro inc. subsidiary.
+#
+# This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
+# Wizards of the Coast.
+########################################################################################################################
+import operator
+import re
+
+from BTrees.IIBTree import IISet, difference, intersection, multiunion
+
+from mtgtools.PCard import EXTRA_FIELDS, STATE_FIELDS
+from mtgtools.PCardIndex import field_values, index_keys
+
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<open>\() |
+    (?P<close>\)) |
+    (?P<neg>-)(?=[^\s)]) |
+    (?P<exact>!)?(?:(?P<key>[A-Za-z_][A-Za-z_.]*)(?P<op>>=|<=|!=|:|=|>|<))?(?P<value>"[^"]*"|'[^']*'|[^\s()]+)
+)""", re.VERBOSE)
+
+_OPERATORS = {':': operator.eq, '=': operator.eq, '!=': operator.ne, '>': operator.gt, '>=': operator.ge,
+              '<': operator.lt, '<=': operator.le}
+
+COLORS = 'wubrg'
+# The colors of magicthegathering.io cards are names instead of letters
+COLOR_NAMES = {'white': 'w', 'blue': 'u', 'black': 'b', 'red': 'r', 'green': 'g'}
+COLOR_KEYS = dict((color, (color, name)) for name, color in COLOR_NAMES.items())
+RARITIES = ('common', 'uncommon', 'rare', 'special', 'mythic', 'bonus')
+RARITY_NAMES = {'c': 'common', 'u': 'uncommon', 'r': 'rare', 's': 'special', 'm': 'mythic', 'b': 'bonus',
+                'mythic rare': 'mythic'}
+
+TEXT_KEYWORDS = {'t': ('type_line', 'type'), 'type': ('type_line', 'type'), 'o': ('oracle_text', 'text'),
+                 'oracle': ('oracle_text', 'text'), 'name': ('name',), 'a': ('artist',), 'artist': ('artist',),
+                 'ft': ('flavor_text', 'flavor'), 'flavor': ('flavor_text', 'flavor'), 'm': ('mana_cost',),
+                 'mana': ('mana_cost',)}
+EXACT_KEYWORDS = {'s': 'set', 'set': 'set', 'e': 'set', 'edition': 'set', 'l': 'lang', 'lang': 'lang',
+                  'layout': 'layout', 'kw': 'keywords', 'keyword': 'keywords', 'game': 'games', 'frame': 'frame',
+                  'border': 'border_color', 'wm': 'watermark', 'watermark': 'watermark'}
+NUMBER_KEYWORDS = {'cmc': 'cmc', 'mv': 'cmc', 'manavalue': 'cmc', 'pow': 'power_num', 'power': 'power_num',
+                   'tou': 'toughness_num', 'toughness': 'toughness_num', 'loy': 'loyalty_num',
+                   'loyalty': 'loyalty_num', 'edhrec': 'edhrec_rank', 'usd': 'prices.usd',
+                   'usdfoil': 'prices.usd_foil', 'eur': 'prices.eur', 'tix': 'prices.tix'}
+COLOR_KEYWORDS = {'c': ('colors', ':'), 'color': ('colors', ':'), 'id': ('color_identity', '<='),
+                  'identity': ('color_identity', '<='), 'ci': ('color_identity', '<=')}
+LEGALITY_KEYWORDS = {'f': 'legal', 'format': 'legal', 'legal': 'legal', 'banned': 'banned',
+                     'restricted': 'restricted'}
+IS_FLAGS = {'fullart': ('full_art', True), 'spotlight': ('story_spotlight', True), 'foil': ('finishes', 'foil'),
+            'nonfoil': ('finishes', 'nonfoil'), 'etched': ('finishes', 'etched')}
+LAYOUTS = ('normal', 'split', 'flip', 'transform', 'modal_dfc', 'meld', 'leveler', 'class', 'saga', 'adventure',
+           'planar', 'scheme', 'vanguard', 'token', 'double_faced_token', 'emblem', 'augment', 'host', 'art_series',
+           'reversible_card')
+
+
+class Predicate:
+    """The base class of the nodes of compiled queries. Each node can check a single card with 'matches' and
+    split itself with 'plan' into the docids its indexed part gives and the residual part which must be checked card
+    by card.
+
+    Predicates can be combined with the operators & (and), | (or) and ~ (not) into new predicates without evaluating
+    anything, for example:
+
+        nonland_creatures = Attributes(type_line='creature') & ~Attributes(type_line='land')
+
+    The combined predicate is evaluated lazily in a single pass with 'filter' or materialized into a card list with
+    PCardList.query.
+    """
+
+    # A rough relative cost of checking a card, used for ordering the checks of a conjunction
+    cost = 1
+
+    def __and__(self, other):
+        return And(_flatten(And, (self, other)))
+
+    def __or__(self, other):
+        return Or(_flatten(Or, (self, other)))
+
+    def __invert__(self):
+        return self.node if isinstance(self, Not) else Not(self)
+
+    def matches(self, card):
+        raise NotImplementedError
+
+    def filter(self, cards):
+        """Yields the cards of a given iterable of cards matching this predicate."""
+        matches = self.matches
+
+        for card in cards:
+            if matches(card):
+                yield card
+
+    def plan(self, index):
+        """Returns a tuple (docids, residual) where docids is an IISet of the candidate cards found from the given
+        index (or None if the index can not be used) and residual is a predicate which the candidates must still
+        match (or None if the docids are exact)."""
+        return None, self
+
+
+def _flatten(node_type, nodes):
+    flat = []
+
+    for node in nodes:
+        if type(node) is node_type:
+            flat.extend(node.nodes)
+        else:
+            flat.append(node)
+
+    return flat
+
+
+class And(Predicate):
+    def __init__(self, nodes):
+        self.nodes = sorted(nodes, key=lambda node: node.cost)
+        self.cost = max(node.cost for node in self.nodes)
+
+    def __repr__(self):
+        return '(' + ' and '.join(repr(node) for node in self.nodes) + ')'
+
+    def matches(self, card):
+        return all(node.matches(card) for node in self.nodes)
+
+    def plan(self, index):
+        docids = None
+        residual = []
+
+        for node in self.nodes:
+            node_docids, node_residual = node.plan(index)
+
+            if node_docids is not None:
+                docids = node_docids if docids is None else intersection(docids, node_docids)
+            if node_residual is not None:
+                residual.append(node_residual)
+
+        if not residual:
+            return docids, None
+        else:
+            return docids, residual[0] if len(residual) == 1 else And(residual)
+
+
+class Or(Predicate):
+    def __init__(self, nodes):
+        self.nodes = sorted(nodes, key=lambda node: node.cost)
+        self.cost = max(node.cost for node in self.nodes)
+
+    def __repr__(self):
+        return '(' + ' or '.join(repr(node) for node in self.nodes) + ')'
+
+    def matches(self, card):
+        return any(node.matches(card) for node in self.nodes)
+
+    def plan(self, index):
+        plans = [node.plan(index) for node in self.nodes]
+
+        if all(docids is not None and residual is None for docids, residual in plans):
+            return multiunion([docids for docids, _ in plans]), None
+        else:
+            return None, self
+
+
+class Not(Predicate):
+    def __init__(self, node):
+        self.node = node
+        self.cost = node.cost
+
+    def __repr__(self):
+        return 'not ' + repr(self.node)
+
+    def matches(self, card):
+        return not self.node.matches(card)
+
+    def plan(self, index):
+        docids, residual = self.node.plan(index)
+
+        if docids is not None and residual is None:
+            return difference(index.docids(), docids), None
+        else:
+            return None, self
+
+
+class Attributes(Predicate):
+    """Matches cards the way PCardList.where and PCardList.where_exactly do: with 'exact' disabled a card matches
+    if any of the given attributes matches partly (see PCard.matches_any) and with 'exact' enabled if all of them
+    match completely (see PCard.matches_all).
+
+    Args:
+        exact (bool): If enabled, all the attributes must match completely.
+        search_all_faces (bool): If enabled, all the faces of the cards are searched.
+        **kwargs: The attributes to match.
+    """
+    cost = 2
+
+    def __init__(self, exact=False, search_all_faces=False, **kwargs):
+        self.exact = exact
+        self.search_all_faces = search_all_faces
+        self.kwargs = kwargs
+
+    def __repr__(self):
+        return '{}({})'.format('where_exactly' if self.exact else 'where',
+                               ', '.join('{}={!r}'.format(key, value) for key, value in self.kwargs.items()))
+
+    def matches(self, card):
+        if self.exact:
+            return card.matches_all(self.search_all_faces, **self.kwargs)
+        else:
+            return card.matches_any(self.search_all_faces, **self.kwargs)
+
+
+class Text(Predicate):
+    """Matches cards for which any of the given fields contains a text (case-insensitive)."""
+    cost = 2
+
+    def __init__(self, fields, text):
+        self.fields = fields
+        self.text = text.lower()
+
+    def __repr__(self):
+        return '{} contains {!r}'.format('/'.join(self.fields), self.text)
+
+    def matches(self, card):
+        for field in self.fields:
+            for value in field_values(card, field):
+                if isinstance(value, str) and self.text in value.lower():
+                    return True
+
+        return False
+
+
+class Match(Predicate):
+    """Matches cards having any of the given index keys for a field (see PCardIndex.index_keys)."""
+
+    def __init__(self, field, keys):
+        self.field = field
+        self.keys = set(keys)
+        self.cost = 3 if field.split('.')[0] in EXTRA_FIELDS else 1
+
+    def __repr__(self):
+        return '{} in {!r}'.format(self.field, sorted(self.keys, key=repr))
+
+    def matches(self, card):
+        return not self.keys.isdisjoint(index_keys(card, self.field))
+
+    def plan(self, index):
+        if self.field in index:
+            return index.lookup(self.field, self.keys), None
+        else:
+            return None, self
+
+
+class Compare(Predicate):
+    """Matches cards for which any value of a field compares with a given value (or with a value of another field)
+    the way the operator tells. Numbers are compared as floats and other values as lower case strings."""
+
+    def __init__(self, field, op, value, other_field=None):
+        self.field = field
+        self.op = op
+        self.value = value
+        self.other_field = other_field
+        self.cost = 3 if field.split('.')[0] in EXTRA_FIELDS else 1
+
+    def __repr__(self):
+        return '{} {} {!r}'.format(self.field, self.op, self.other_field or self.value)
+
+    def _values(self, card, field, numeric):
+        for value in field_values(card, field):
+            if numeric:
+                if isinstance(value, bool):
+                    continue
+                try:
+                    yield float(value)
+                except (TypeError, ValueError):
+                    continue
+            elif isinstance(value, str):
+                yield value.lower()
+
+    def matches(self, card):
+        compare = _OPERATORS[self.op]
+
+        if self.other_field is not None:
+            others = list(self._values(card, self.other_field, True))
+            return any(compare(value, other) for value in self._values(card, self.field, True) for other in others)
+
+        numeric = isinstance(self.value, float)
+        return any(compare(value, self.value) for value in self._values(card, self.field, numeric))
+
+    def plan(self, index):
+        if self.other_field is not None or self.field not in index:
+            return None, self
+
+        key_type = index.key_type(self.field)
+
+        if key_type is None:
+            return IISet(), None
+        elif key_type is not type(self.value):
+            # Eg. numbers compared with a field of strings are converted card by card
+            return None, self
+        elif self.op in (':', '='):
+            return index.lookup(self.field, (self.value,)), None
+        elif self.op in ('>', '>='):
+            return index.docids_between(self.field, low=self.value, exclude_low=self.op == '>'), None
+        else:
+            return index.docids_between(self.field, high=self.value, exclude_high=self.op == '<'), None
+
+
+class Colors(Predicate):
+    """Matches cards by comparing the set of the colors in a color field with a given set of colors. The operator
+    ':' or '>=' means that the card has all the given colors, '<=' that it has no other colors and '=' that it has
+    exactly the given colors. A color set of None means multicolored cards."""
+
+    def __init__(self, field, op, colors):
+        self.field = field
+        self.op = op
+        self.colors = colors
+
+    def __repr__(self):
+        return '{} {} {!r}'.format(self.field, self.op, 'multicolor' if self.colors is None else self.colors)
+
+    def matches(self, card):
+        colors = set(COLOR_NAMES.get(color, color) for color in index_keys(card, self.field))
+
+        if self.colors is None:
+            return len(colors) > 1 if self.op in (':', '=', '>=') else len(colors) <= 1
+        elif self.op in (':', '>='):
+            return colors >= self.colors
+        else:
+            return _OPERATORS[self.op](colors, self.colors)
+
+    def plan(self, index):
+        if self.colors is None or self.field not in index:
+            return None, self
+
+        every = index.docids()
+        has_all = every
+        for color in self.colors:
+            has_all = intersection(has_all, index.lookup(self.field, COLOR_KEYS[color]))
+
+        others = index.lookup(self.field, [key for color in set(COLORS) - self.colors for key in COLOR_KEYS[color]])
+        has_no_others = difference(every, others)
+        exactly = intersection(has_all, has_no_others)
+
+        if self.op in (':', '>='):
+            return has_all, None
+        elif self.op == '<=':
+            return has_no_others, None
+        elif self.op == '=':
+            return exactly, None
+        elif self.op == '>':
+            return difference(has_all, exactly), None
+        elif self.op == '<':
+            return difference(has_no_others, exactly), None
+        else:
+            return difference(every, exactly), None
+
+
+def _tokenize(query):
+    tokens = []
+    position = 0
+
+    while query[position:].strip():
+        match = _TOKEN.match(query, position)
+
+        if match is None:
+            raise ValueError('Invalid query syntax at --{}--'.format(query[position:]))
+
+        position = match.end()
+
+        if match.group('open'):
+            tokens.append(('open', None))
+        elif match.group('close'):
+            tokens.append(('close', None))
+        elif match.group('neg'):
+            tokens.append(('neg', None))
+        else:
+            value = match.group('value')
+            quoted = value[0] in '"\'' and value[-1] == value[0] and len(value) > 1
+            value = value[1:-1] if quoted else value
+
+            if not quoted and match.group('key') is None and value.lower() in ('or', 'and'):
+                tokens.append((value.lower(), None))
+            else:
+                tokens.append(('term', (match.group('key'), match.group('op'), value, bool(match.group('exact')))))
+
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def next(self):
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def parse(self):
+        node = self.parse_or()
+
+        if self.peek() is not None:
+            raise ValueError('Unbalanced parentheses in the query.')
+
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+
+        while self.peek() == 'or':
+            self.next()
+            nodes.append(self.parse_and())
+
+        return nodes[0] if len(nodes) == 1 else Or(nodes)
+
+    def parse_and(self):
+        nodes = []
+
+        while self.peek() not in (None, 'close', 'or'):
+            if self.peek() == 'and':
+                self.next()
+            else:
+                nodes.append(self.parse_unary())
+
+        if not nodes:
+            raise ValueError('Empty query or query part.')
+
+        return nodes[0] if len(nodes) == 1 else And(nodes)
+
+    def parse_unary(self):
+        kind, data = self.next()
+
+        if kind == 'neg':
+            if self.peek() in (None, 'close', 'or', 'and'):
+                raise ValueError('Nothing to negate in the query.')
+            return Not(self.parse_unary())
+        elif kind == 'open':
+            node = self.parse_or()
+
+            if self.peek() != 'close':
+                raise ValueError('Unbalanced parentheses in the query.')
+
+            self.next()
+            return node
+        elif kind == 'term':
+            return _term(*data)
+        else:
+            raise ValueError('Unexpected "{}" in the query.'.format(kind))
+
+
+def _number(value, keyword):
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError('The value of "{}" must be a number, not --{}--.'.format(keyword, value))
+
+
+def _colors(value):
+    value = value.lower()
+
+    if value in ('m', 'multicolor'):
+        return None
+
+    value = '' if value in ('c', 'colorless') else COLOR_NAMES.get(value, value)
+
+    if set(value) - set(COLORS):
+        raise ValueError('Invalid colors --{}--. Use the letters WUBRG or color names.'.format(value))
+
+    return set(value)
+
+
+def _rarities(op, value):
+    rarity = RARITY_NAMES.get(value.lower(), value.lower())
+
+    if rarity not in RARITIES:
+        raise ValueError('Invalid rarity --{}--.'.format(value))
+
+    rank = RARITIES.index(rarity)
+    rarities = [name for i, name in enumerate(RARITIES) if _OPERATORS[op](i, rank)]
+
+    # The rarities of magicthegathering.io cards are capitalized and mythics are 'Mythic Rare'
+    if 'mythic' in rarities:
+        rarities.append('mythic rare')
+
+    return rarities
+
+
+def _years(op, value):
+    year = int(_number(value, 'year'))
+    first, last = '{:04d}-01-01'.format(year), '{:04d}-12-31'.format(year)
+
+    if op in (':', '='):
+        return And([Compare('released_at', '>=', first), Compare('released_at', '<=', last)])
+    elif op in ('>', '<='):
+        return Compare('released_at', op, last)
+    else:
+        return Compare('released_at', op, first)
+
+
+def _term(key, op, value, exact):
+    if key is None:
+        return Match('name', (value.lower(),)) if exact else Text(('name',), value)
+
+    keyword = key.lower()
+
+    if op == '!=' and keyword not in COLOR_KEYWORDS:
+        return Not(_term(key, ':', value, exact))
+
+    if keyword in TEXT_KEYWORDS:
+        if keyword in ('m', 'mana') and '{' not in value:
+            value = ''.join('{' + symbol + '}' for symbol in value.upper())
+        return Text(TEXT_KEYWORDS[keyword], value)
+
+    elif keyword in EXACT_KEYWORDS:
+        return Match(EXACT_KEYWORDS[keyword], (value.lower(),))
+
+    elif keyword in ('r', 'rarity'):
+        return Match('rarity', _rarities(op, value))
+
+    elif keyword in NUMBER_KEYWORDS:
+        field = NUMBER_KEYWORDS[keyword]
+
+        if value.lower() in NUMBER_KEYWORDS:
+            return Compare(field, '=' if op == ':' else op, None, other_field=NUMBER_KEYWORDS[value.lower()])
+
+        return Compare(field, op, _number(value, keyword))
+
+    elif keyword in COLOR_KEYWORDS:
+        field, default_op = COLOR_KEYWORDS[keyword]
+        colors = _colors(value)
+
+        # Colorless means no colors at all instead of any colors
+        if op == ':':
+            op = '=' if colors == set() else default_op
+
+        return Colors(field, op, colors)
+
+    elif keyword in LEGALITY_KEYWORDS:
+        return Match('legalities', ('{}:{}'.format(value.lower(), LEGALITY_KEYWORDS[keyword]),))
+
+    elif keyword in ('is', 'not'):
+        flag = value.lower()
+
+        if flag in IS_FLAGS:
+            field, key_value = IS_FLAGS[flag]
+        elif flag in LAYOUTS:
+            field, key_value = 'layout', flag
+        elif flag in STATE_FIELDS:
+            field, key_value = flag, True
+        else:
+            raise ValueError('Unknown flag --{}:{}--.'.format(keyword, value))
+
+        node = Match(field, (key_value,))
+        return node if keyword == 'is' else Not(node)
+
+    elif keyword == 'year':
+        return _years(op, value)
+
+    elif keyword == 'date':
+        return Compare('released_at', op, value.lower())
+
+    elif keyword in STATE_FIELDS or '.' in keyword and keyword.split('.')[0] in STATE_FIELDS:
+        if op in (':', '='):
+            keys = {value.lower()}
+            try:
+                keys.add(float(value))
+            except ValueError:
+                pass
+            if value.lower() in ('true', 'false'):
+                keys.add(value.lower() == 'true')
+            return Match(keyword, keys)
+
+        try:
+            return Compare(keyword, op, float(value))
+        except ValueError:
+            return Compare(keyword, op, value.lower())
+
+    else:
+        raise ValueError('Unknown search keyword --{}--.'.format(key))
+
+
+def parse(query):
+    """Parses a query string into a tree of predicates (see Predicate)."""
+    return _Parser(_tokenize(query)).parse()
+
+
+class CardQuery:
+    """CardQuery is a card search query written in a syntax similar to the one of Scryfall
+    (https://scryfall.com/docs/syntax), for example:
+
+        t:creature c>=rg cmc<=3 o:"draw a card" r:mythic -is:digital
+
+    The query is compiled once and can be run on any list of cards. When run on a PCardList with an index (see
+    PCardList.create_index), the predicates on the indexed fields are answered from the index first and only the
+    remaining predicates are checked card by card on the candidates, in a single pass. Without an index, every card is
+    checked once against the whole query.
+
+    The terms of the query are combined with 'and' by default. Terms can be combined with 'or', grouped with
+    parentheses and negated with a '-' prefix. Values with spaces are quoted. The supported keywords are:
+
+        bare words          The name contains the word, eg. 'mongrel'. '!"Wild Mongrel"' matches the exact name.
+        t, type             The type line contains the text
+        o, oracle           The oracle text contains the text
+        name, a, artist,    The name, artist, flavor text or mana cost contains the text. Mana costs can be
+        ft, flavor, m, mana written as {G}{G} or simply as gg
+        c, color            The colors, eg. c:rg (red and green and possibly others), c=rg, c<=rg, c:colorless,
+                            c:multicolor. Colors are WUBRG letters or names like 'red'
+        id, identity, ci    The color identity. id:rg means red, green, red-green or colorless, like in Scryfall
+        cmc, mv, pow, tou,  Numeric comparisons with ':', '=', '!=', '>', '>=', '<' and '<=', eg. 'cmc<=3'. The
+        loy, edhrec, usd,   value can also be another of these keywords, eg. 'pow>tou'. Comparisons on indexed
+        eur, tix            fields only visit the index keys in the range
+        r, rarity           The rarity, eg. r:mythic or r>=rare
+        s, set, e, l, lang, Exact matches of the set code, language, layout, keywords, games and so on
+        layout, kw, game
+        f, format, banned,  The legality in a format, eg. f:modern
+        restricted
+        is, not             Flags like is:digital, is:promo, is:reprint, is:foil, is:fullart or layouts like
+                            is:transform
+        year, date          The release year or date, eg. year>=2019 or date<2020-06-01
+
+    Any other card attribute can also be used as a keyword with its exact value, eg. 'set_type:expansion'. All the
+    values are case-insensitive and the values of all the faces of the cards are searched.
+
+    Instead of a string, a query can also be given as a predicate built with the operators &, | and ~ from
+    predicates like Attributes (see Predicate).
+
+    Args:
+        query (str, Predicate): The query string or predicate.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.node = parse(query) if isinstance(query, str) else query
+
+    def __repr__(self):
+        return 'CardQuery({!r})'.format(self.query)
+
+    def matches(self, card):
+        """Returns True if a given card matches the query."""
+        return self.node.matches(card)
+
+    def plan(self, cards):
+        """Returns a tuple (docids, residual) telling how the query is run on a given list of cards: the docids of
+        the candidate cards found from the index of the list (or None if every card has to be checked) and the
+        predicate the candidates still have to match (or None if the index answers the whole query)."""
+        index = getattr(cards, '_index', None)
+
+        if index is None:
+            return None, self.node
+
+        return self.node.plan(index)
+
+    def iterate(self, cards):
+        """Yields the cards of a given list of cards matching the query."""
+        docids, residual = self.plan(cards)
+        source = cards if docids is None else cards._index.cards(docids)
+
+        if residual is None:
+            yield from source
+        else:
+            matches = residual.matches
+
+            for card in source:
+                if matches(card):
+                    yield card
+
+    def explain(self, cards):
+        """Returns a description of how the query is run on a given list of cards."""
+        docids, residual = self.plan(cards)
+        lines = ['query: {}'.format(self.node)]
+
+        if docids is None:
+            lines.append('index: not used, all {} cards are checked'.format(len(cards)))
+        else:
+            lines.append('index: {} candidate cards'.format(len(docids)))
+
+        lines.append('checked card by card: {}'.format(residual if residual is not None else 'nothing'))
+
+        return '\n'.join(lines)
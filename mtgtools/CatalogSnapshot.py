@@ -0,0 +1,431 @@
+########################################################################################################################
+# Copyright © 2018 Esko-Kalervo Salaka.
+# All rights reserved.
+#
+#
+# Zope Public License (ZPL) Version 2.1
+#
+# A copyright notice accompanies this license document that identifies the
+# copyright holders.
+#
+# This license has been certified as open source. It has also been designated as
+# GPL compatible by the Free Software Foundation (FSF).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions in source code must retain the accompanying copyright
+# notice, this list of conditions, and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the accompanying copyright
+# notice, this list of conditions, and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Names of the copyright holders must not be used to endorse or promote
+# products derived from this software without prior written permission from the
+# copyright holders.
+#
+# 4. The right to distribute this software or to use it for any purpose does not
+# give you the right to use Servicemarks (sm) or Trademarks (tm) of the
+# copyright
+# holders. Use of them is covered by separate agreement with the copyright
+# holders.
+#
+# 5. If any files are modified, you must cause the modified files to carry
+# prominent notices stating that you changed the files and the date of any
+# change.
+#
+# Disclaimer
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY EXPRESSED
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# This software uses ZODB, a native object database for Python, which is a
+# copyright © by Zope Foundation and Contributors.
+#
+# This software uses Scryfall's rest-like API which is a copyright © by Scryfall LLC.
+#
+# This software uses rest-like API of magicthegathering.io which is a copyright © by Andrew Backes.
+#
+# This software uses the Python Imaging Library (PIL) which is a copyright © 1997-2011 by Secret Labs AB and
+# copyright © 1995-2011 by Fredrik Lundh
+#
+# All the graphical and literal information and data related to Magic: The Gathering which can be handled with this
+# software, such as card information and card images, is copyright of Wizards of the Coast LLC, a
+# Hasbro inc. subsidiary.
+#
+# This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
+# Wizards of the Coast.
+########################################################################################################################
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+
+SNAPSHOT_MAGIC = b'MTGSNAP\0'
+SNAPSHOT_VERSION = 1
+
+# The column types are 'd' (float64, NaN for null), 'q' (int64), 'b' (int8 booleans, -1 for null) and 's' (uint32
+# indexes to the string table)
+SNAPSHOT_COLUMNS = (('id', 's'), ('oracle_id', 's'), ('name', 's'), ('lang', 's'), ('layout', 's'),
+                    ('mana_cost', 's'), ('cmc', 'd'), ('type_line', 's'), ('oracle_text', 's'), ('power', 's'),
+                    ('toughness', 's'), ('loyalty', 's'), ('power_num', 'd'), ('toughness_num', 'd'),
+                    ('loyalty_num', 'd'), ('rarity', 's'), ('set', 's'), ('set_name', 's'),
+                    ('collector_number', 's'), ('released_at', 's'), ('artist', 's'), ('edhrec_rank', 'q'),
+                    ('reserved', 'b'), ('digital', 'b'), ('promo', 'b'), ('reprint', 'b'))
+
+NULL_STRING = 0xFFFFFFFF
+NULL_INT = -2 ** 63
+
+_HEADER = struct.Struct('<8sIII')
+_COLUMN = struct.Struct('<32scxxxQ')
+_SECTION = struct.Struct('<QQ')
+
+
+def _align(buffer):
+    buffer.extend(b'\0' * (-len(buffer) % 8))
+
+
+def _typed_array(type_code, values):
+    data = array('I' if type_code == 's' else type_code, values)
+
+    if sys.byteorder != 'little':
+        data.byteswap()
+
+    return data.tobytes()
+
+
+def write_snapshot(path, cards):
+    """Writes an immutable binary snapshot of the given cards in a file which can be opened with CatalogSnapshot.
+    The file is first written under a temporary name and then moved in place, so readers never see a partial file.
+
+    The file consists of a header, a directory of the columns, the fixed-width columns, a table of the unique strings
+    and the whole cards as json. All the numbers are little-endian and every section is aligned to 8 bytes.
+
+    Args:
+        path (str): The path of the snapshot file.
+        cards (PCardList, list[PCard]): The cards to write.
+
+    Returns:
+        int: The number of cards written.
+    """
+    strings = {}
+    columns = dict((name, []) for name, _ in SNAPSHOT_COLUMNS)
+    documents = []
+
+    for card in cards:
+        for name, type_code in SNAPSHOT_COLUMNS:
+            value = getattr(card, name, None)
+
+            if type_code == 's':
+                if value is None:
+                    columns[name].append(NULL_STRING)
+                else:
+                    columns[name].append(strings.setdefault(str(value), len(strings)))
+            elif type_code == 'd':
+                columns[name].append(float('nan') if value is None else float(value))
+            elif type_code == 'q':
+                columns[name].append(NULL_INT if value is None else int(value))
+            else:
+                columns[name].append(-1 if value is None else int(bool(value)))
+
+        document = card.as_dict() if hasattr(card, 'as_dict') else dict(card.__dict__)
+        documents.append(json.dumps(document, default=str, separators=(',', ':')).encode('utf-8'))
+
+    num_cards = len(documents)
+    body = bytearray()
+    directory = []
+
+    for name, type_code in SNAPSHOT_COLUMNS:
+        directory.append((name, type_code, len(body)))
+        body.extend(_typed_array(type_code, columns[name]))
+        _align(body)
+
+    string_blob = bytearray()
+    string_offsets = [0]
+    for string in strings:
+        string_blob.extend(string.encode('utf-8'))
+        string_offsets.append(len(string_blob))
+
+    strings_section = len(body)
+    body.extend(_typed_array('Q', string_offsets))
+    body.extend(string_blob)
+    _align(body)
+
+    document_offsets = [0]
+    for document in documents:
+        document_offsets.append(document_offsets[-1] + len(document))
+
+    documents_section = len(body)
+    body.extend(_typed_array('Q', document_offsets))
+    for document in documents:
+        body.extend(document)
+
+    header = bytearray(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, num_cards, len(SNAPSHOT_COLUMNS)))
+    for name, type_code, offset in directory:
+        header.extend(_COLUMN.pack(name.encode('utf-8'), type_code.encode('ascii'), offset))
+    header.extend(_SECTION.pack(strings_section, len(strings)))
+    header.extend(_SECTION.pack(documents_section, num_cards))
+    _align(header)
+
+    temp_path = '{}.tmp{}'.format(path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+    os.replace(temp_path, path)
+
+    return num_cards
+
+
+class CatalogSnapshot:
+    """CatalogSnapshot is a read-only view of a card snapshot file written with write_snapshot or
+    MtgDB.export_snapshot. The file is memory-mapped, so opening a snapshot only reads its small header and the
+    columns are accessed directly from the shared page cache without copying or unpickling anything. Any number of
+    processes can open the same snapshot and they all share one copy of it in memory. This module does not need ZODB.
+
+    The scalar attributes of the cards (see SNAPSHOT_COLUMNS) are stored in fixed-width columns and can be searched
+    quickly with 'where' and 'where_exactly', which return the indexes of the matching cards. The attributes of a card
+    at an index can be read with 'row', or all of its attributes as a dictionary with 'card'.
+
+    Examples:
+        snapshot = CatalogSnapshot('cards.snapshot')
+        for index in snapshot.where_exactly(name='Wild Mongrel'):
+            print(snapshot.row(index)['set'])
+
+    args:
+        path (str): The path of the snapshot file.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._view = memoryview(self._mmap)
+        magic, self.version, self._num_cards, num_columns = _HEADER.unpack_from(self._mmap, 0)
+
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('{} is not a card snapshot file.'.format(self.path))
+        if self.version != SNAPSHOT_VERSION:
+            raise ValueError('Unsupported snapshot version {} in {}.'.format(self.version, self.path))
+
+        position = _HEADER.size
+        directory = []
+        for _ in range(num_columns):
+            name, type_code, offset = _COLUMN.unpack_from(self._mmap, position)
+            directory.append((name.rstrip(b'\0').decode('utf-8'), type_code.decode('ascii'), offset))
+            position += _COLUMN.size
+
+        strings_offset, self._num_strings = _SECTION.unpack_from(self._mmap, position)
+        documents_offset, _ = _SECTION.unpack_from(self._mmap, position + _SECTION.size)
+        position += 2 * _SECTION.size
+        body = position + (-position % 8)
+
+        self._types = {}
+        self._columns = {}
+        for name, type_code, offset in directory:
+            self._types[name] = type_code
+            self._columns[name] = self._cast(body + offset, 'I' if type_code == 's' else type_code, self._num_cards)
+
+        self._string_offsets = self._cast(body + strings_offset, 'Q', self._num_strings + 1)
+        self._strings_start = body + strings_offset + 8 * (self._num_strings + 1)
+        self._document_offsets = self._cast(body + documents_offset, 'Q', self._num_cards + 1)
+        self._documents_start = body + documents_offset + 8 * (self._num_cards + 1)
+
+    def __len__(self):
+        return self._num_cards
+
+    def close(self):
+        """Closes the memory map of the snapshot."""
+        views = list(self._columns.values()) + [self._string_offsets, self._document_offsets, self._view]
+
+        for view in views:
+            if isinstance(view, memoryview):
+                view.release()
+
+        self._columns = {}
+        self._mmap.close()
+
+    @property
+    def columns(self):
+        return tuple(self._types)
+
+    def column(self, name):
+        """Returns a whole column of the snapshot. Numerical columns are returned as zero-copy memoryviews (NaN for
+        null floats, -2**63 for null integers, -1 for null booleans) and string columns as lists of strings.
+
+        Args:
+            name (str): The name of the column.
+
+        Returns:
+            A memoryview of the numerical values or a list of the strings of the column.
+        """
+        if self._types[name] == 's':
+            return [self._string(index) for index in self._columns[name]]
+
+        return self._columns[name]
+
+    def value(self, index, name):
+        """Returns the value of a column for the card at a given index.
+
+        Args:
+            index (int): The index of the card.
+            name (str): The name of the column.
+
+        Returns:
+            The value or None if the card has no value.
+        """
+        raw = self._columns[name][index]
+        type_code = self._types[name]
+
+        if type_code == 's':
+            return self._string(raw)
+        elif type_code == 'd':
+            return None if math.isnan(raw) else raw
+        elif type_code == 'q':
+            return None if raw == NULL_INT else raw
+        else:
+            return None if raw < 0 else bool(raw)
+
+    def row(self, index):
+        """Returns the values of all the columns for the card at a given index.
+
+        Args:
+            index (int): The index of the card.
+
+        Returns:
+            dict: A dictionary of the column values of the card.
+        """
+        return dict((name, self.value(index, name)) for name in self._types)
+
+    def card(self, index):
+        """Returns all the attributes of the card at a given index, including the nested ones.
+
+        Args:
+            index (int): The index of the card.
+
+        Returns:
+            dict: A dictionary of the attributes of the card.
+        """
+        start = self._documents_start + self._document_offsets[index]
+        end = self._documents_start + self._document_offsets[index + 1]
+
+        return json.loads(bytes(self._view[start:end]).decode('utf-8'))
+
+    def where(self, invert=False, **kwargs):
+        """Returns the indexes of the cards for which any of the given keyword arguments match partly or completely.
+        Strings match case-insensitively as substrings and numbers match if the argument is larger or equal to the
+        value of the card, like in PCardList.where.
+
+        Args:
+            invert (bool): If True, the indexes of the cards NOT matching are returned.
+            **kwargs: Column names and values to match.
+
+        Returns:
+            list[int]: The indexes of the matching cards.
+        """
+        matching = set()
+
+        for name, val in kwargs.items():
+            column, match = self._matches(name, val, exactly=False)
+            matching.update(index for index, value in enumerate(column) if match(value))
+
+        if invert:
+            return [index for index in range(self._num_cards) if index not in matching]
+
+        return sorted(matching)
+
+    def where_exactly(self, invert=False, **kwargs):
+        """Returns the indexes of the cards for which all the given keyword arguments match completely. Strings match
+        case-insensitively.
+
+        Args:
+            invert (bool): If True, the indexes of the cards NOT matching are returned.
+            **kwargs: Column names and values to match.
+
+        Returns:
+            list[int]: The indexes of the matching cards.
+        """
+        indexes = range(self._num_cards)
+
+        # Each argument only checks the cards which matched the previous ones
+        for name, val in kwargs.items():
+            column, match = self._matches(name, val, exactly=True)
+            indexes = [index for index in indexes if match(column[index])]
+
+        if invert:
+            matching = set(indexes)
+            return [index for index in range(self._num_cards) if index not in matching]
+
+        return list(indexes)
+
+    def _cast(self, offset, type_code, length):
+        size = array(type_code).itemsize * length
+
+        if sys.byteorder == 'little':
+            return self._view[offset:offset + size].cast(type_code)
+
+        # The snapshots are little-endian, so big-endian hosts need a copy
+        data = array(type_code, bytes(self._view[offset:offset + size]))
+        data.byteswap()
+        return data
+
+    def _string(self, index):
+        if index == NULL_STRING:
+            return None
+
+        return self._encoded_string(index).decode('utf-8')
+
+    def _encoded_string(self, index):
+        # The strings are not cached, so that the processes sharing the snapshot do not copy the string table
+        start = self._strings_start + self._string_offsets[index]
+        return self._mmap[start:self._strings_start + self._string_offsets[index + 1]]
+
+    def _matching_strings(self, val, exactly):
+        # Returns the indexes of the strings of the string table matching a lower case string. The encoded strings
+        # are compared as they are, and only the strings with other than ASCII characters are decoded to get them
+        # in lower case.
+        val = val.encode('utf-8')
+        matching = set()
+
+        for index in range(self._num_strings):
+            string = self._encoded_string(index)
+            string = string.lower() if string.isascii() else string.decode('utf-8').lower().encode('utf-8')
+
+            if string == val if exactly else val in string:
+                matching.add(index)
+
+        return matching
+
+    def _matches(self, name, val, exactly):
+        if name not in self._types:
+            raise KeyError('Unknown snapshot column {}. The columns are: {}'.format(name, ', '.join(self._types)))
+
+        column = self._columns[name]
+        type_code = self._types[name]
+
+        if type_code == 's':
+            # The strings are matched once in the string table and the column is then matched by string indexes
+            matching = self._matching_strings(str(val).lower(), exactly)
+            return column, matching.__contains__
+        elif type_code == 'b':
+            return column, int(bool(val)).__eq__
+        elif exactly:
+            return column, lambda value: value == val
+        else:
+            null = NULL_INT if type_code == 'q' else None
+            return column, lambda value: value != null and value <= val
@@ -0,0 +1,171 @@
+########################################################################################################################
+# Copyright © 2018 Esko-Kalervo Salaka.
+# All rights reserved.
+#
+#
+# Zope Public License (ZPL) Version 2.1
+#
+# A copyright notice accompanies this license document that identifies the
+# copyright holders.
+#
+# This license has been certified as open source. It has also been designated as
+# GPL compatible by the Free Software Foundation (FSF).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions in source code must retain the accompanying copyright
+# notice, this list of conditions, and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the accompanying copyright
+# notice, this list of conditions, and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Names of the copyright holders must not be used to endorse or promote
+# products derived from this software without prior written permission from the
+# copyright holders.
+#
+# 4. The right to distribute this software or to use it for any purpose does not
+# give you the right to use Servicemarks (sm) or Trademarks (tm) of the
+# copyright
+# holders. Use of them is covered by separate agreement with the copyright
+# holders.
+#
+# 5. If any files are modified, you must cause the modified files to carry
+# prominent notices stating that you changed the files and the date of any
+# change.
+#
+# Disclaimer
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY EXPRESSED
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# This software uses ZODB, a native object database for Python, which is a
+# copyright © by Zope Foundation and Contributors.
+#
+# This software uses Scryfall's rest-like API which is a copyright © by Scryfall LLC.
+#
+# This software uses rest-like API of magicthegathering.io which is a copyright © by Andrew Backes.
+#
+# This software uses the Python Imaging Library (PIL) which is a copyright © 1997-2011 by Secret Labs AB and
+# copyright © 1995-2011 by Fredrik Lundh
+#
+# All the graphical and literal information and data related to Magic: The Gathering which can be handled with this
+# software, such as card information and card images, is copyright of Wizards of the Coast LLC, a
+# Hasbro inc. subsidiary.
+#
+# This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
+# Wizards of the Coast.
+########################################################################################################################
+
+
+def check_set(pset):
+    """Checks the cards of a single set. Returns a dictionary with the 'code' of the set, the 'ids' of its cards in
+    order, the ids of its 'duplicates', the ids of its 'misplaced' cards which belong to other sets and its
+    'card_count'."""
+    code = pset.code
+    ids = []
+    seen = set()
+    duplicates = []
+    misplaced = []
+
+    for card in pset.cards:
+        card_id = card.id
+
+        if card_id in seen:
+            duplicates.append(card_id)
+        else:
+            seen.add(card_id)
+
+        if card.set != code:
+            misplaced.append(card_id)
+
+        ids.append(card_id)
+
+    return {'code': code, 'ids': ids, 'duplicates': duplicates, 'misplaced': misplaced,
+            'card_count': pset.card_count}
+
+
+class IntegrityReport:
+    """IntegrityReport holds the results of checking the integrity of the Scryfall cards and sets of a database with
+    MtgDB.verify_scryfall_integrity. The database is fine if 'ok' is True. Otherwise the problems found are in the
+    attributes below, and 'problems' lists them as readable strings. All the cards and sets are given by their ids.
+
+        card_count:          The number of cards in the card database
+        set_card_count:      The total number of cards in the card lists of the sets
+        duplicate_cards:     Cards found more than once in the card database
+        duplicate_sets:      Sets found more than once in the set database
+        duplicate_set_cards: Cards found more than once in a set, by the set codes
+        misplaced_cards:     Cards in the card list of a set they do not belong to, by the set codes
+        missing_cards:       Cards of the card database which are missing from the card list of their set, by the set
+                             codes
+        unlisted_cards:      Cards in the card lists of the sets which are not in the card database, by the set codes
+        orphan_cards:        Cards of the card database whose set is not in the set database
+        count_mismatches:    Sets whose 'card_count' does not match the number of their cards as tuples
+                             (card_count, number of cards), by the set codes
+        repaired:            Whether the problems were repaired
+    """
+
+    def __init__(self):
+        self.card_count = 0
+        self.set_card_count = 0
+        self.duplicate_cards = []
+        self.duplicate_sets = []
+        self.duplicate_set_cards = {}
+        self.misplaced_cards = {}
+        self.missing_cards = {}
+        self.unlisted_cards = {}
+        self.orphan_cards = []
+        self.count_mismatches = {}
+        self.repaired = False
+
+    def __str__(self):
+        if self.ok:
+            return 'The database has no integrity problems. Checked {} cards.'.format(self.card_count)
+
+        return 'The database has {} integrity problems{}:\n{}'.format(
+            len(self.problems()), ' (repaired)' if self.repaired else '', '\n'.join(self.problems()))
+
+    def __repr__(self):
+        return '<IntegrityReport ok={} problems={} repaired={}>'.format(self.ok, len(self.problems()), self.repaired)
+
+    @property
+    def ok(self):
+        return not self.problems()
+
+    def problems(self):
+        """Returns the problems found as a list of readable strings.
+
+        Returns:
+            list[str]: The problems.
+        """
+        problems = []
+
+        if self.card_count != self.set_card_count:
+            problems.append('The card database has {} cards but the sets have {} cards'.format(
+                self.card_count, self.set_card_count))
+
+        problems += ['Duplicate card {}'.format(card_id) for card_id in self.duplicate_cards]
+        problems += ['Duplicate set {}'.format(set_id) for set_id in self.duplicate_sets]
+        problems += ['Orphan card {} has no set'.format(card_id) for card_id in self.orphan_cards]
+
+        for description, cards_by_set in (('Duplicate card {} in set {}', self.duplicate_set_cards),
+                                          ('Misplaced card {} in set {}', self.misplaced_cards),
+                                          ('Card {} missing from set {}', self.missing_cards),
+                                          ('Card {} of set {} is not in the card database', self.unlisted_cards)):
+            for code, card_ids in cards_by_set.items():
+                problems += [description.format(card_id, code) for card_id in card_ids]
+
+        problems += ['Set {} has card_count {} but {} cards'.format(code, card_count, num)
+                     for code, (card_count, num) in self.count_mismatches.items()]
+
+        return problems
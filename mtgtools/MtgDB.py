@@ -66,6 +66,7 @@
 # This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
 # Wizards of the Coast.
 ########################################################################################################################
+import contextlib
 import datetime
 import sys
 import time
@@ -74,11 +75,17 @@ import ZODB
 import ZODB.FileStorage
 import transaction
 from warnings import warn
+from BTrees.IOBTree import IOBTree
+from ZODB.interfaces import IMVCCStorage
+from ZODB.utils import p64, u64
 
 from mtgtools.PSetList import PSetList
 from mtgtools.PCardList import PCardList
-from .util.api_requests import process_scryfall_cards, process_scryfall_sets, get_tot_mtgio_cards, process_mtgio_sets, \
-    process_mtgio_cards, get_scryfall_card_bulks, download_scryfall_bulk_data, process_cards_bulk
+from mtgtools.PriceHistory import PriceHistory
+from mtgtools.RulingsIndex import RulingsIndex
+from .util.storage import open_storage
+from .util.history import changed_oids, tid_after, tid_from_time
+from .util.instrumentation import InstrumentedStorage, write_prometheus
 
 
 class MtgDB:
@@ -97,6 +104,11 @@ class MtgDB:
     self.root.scryfall_cards and the sets can be accessed with self.root.scryfall_sets. For magicthegathering.io
     self.root.mtgio_cards and self.root.mtgio_sets.
 
+    Every Scryfall update also records the current prices of the cards in self.root.scryfall_price_history
+    (PriceHistory), so that the price history of the cards is kept even though the prices of the cards themselves are
+    overwritten. The rulings of the Scryfall cards are kept in self.root.scryfall_rulings (RulingsIndex) by their
+    oracle ids, and they can be accessed simply with PCard.get_rulings without sending any requests to Scryfall.
+
     The persistent card lists (PCardList objects) and persistent set lists (PSetList objects) have their own handy ways
     for querying for certain objects. The PCardLists further contain persistent card objects (PCard) and PsetLists
     contain persistent set objects (PSet) which can be easily stored in the database under your own indexes in the
@@ -122,8 +134,15 @@ class MtgDB:
     set the database as read_only. You can find the whole documentation here:
     https://zodb.org/en/latest/_modules/ZODB/FileStorage/FileStorage.html
 
+    Instead of a local file, the database can also be opened from a storage uri like
+    MtgDB('zeo://localhost:8100?cache_size=200MB&client=worker'). This way many processes can share one database
+    served by a ZEO server, each keeping their own local client cache. Changes committed by other processes are seen
+    after a transaction boundary, for example after calling 'sync'. Any other ZODB storage can be used by giving a
+    storage object or a function which creates one with 'storage'. See mtgtools.util.storage.open_storage for the
+    supported uris.
+
     Args:
-        file_name: str: A path to a ZODB storage to open. If no storage is found, a new one is created.
+        file_name: str: A path to a ZODB storage to open or a storage uri. If no storage is found, a new one is created.
 
     Keyword Args:
         create: bool = False : Flag indicating whether a file should be created even if it already exists.
@@ -137,48 +156,112 @@ class MtgDB:
         ``.old`` file.
         packer: Any = None : An alternative
         blob_dir: str : A blob-directory path name. Blobs will be supported if this option is provided.
+        pool_size: int = 7 : The number of connections kept open in the connection pool of the database. More
+        connections than this can be opened but only this many are kept for reuse after they are closed.
+        cache_size: int = 400 : The maximum number of objects kept in the object cache of each connection.
+        cache_size_bytes: int = 0 : The maximum estimated total size in bytes of the objects kept in the object cache
+        of each connection. 0 means no limit.
+        pin_catalog: bool = False : Flag indicating whether all the cards of the database should be loaded once and
+        kept in the object cache of each connection. See 'pin_catalog'.
+        storage: Any = None : A ZODB storage or a function returning one to use instead of opening a FileStorage. The
+        FileStorage arguments are ignored if this is given.
+        sqlite_mirror: str = None : A path to a SQLite database file where a mirror of the Scryfall cards and sets is
+        kept for fast indexed and SQL queries. See SQLiteMirror and 'refresh_sqlite_mirror'.
+        instrument: bool = True : Flag indicating whether the loads, stores, commits and packs of the storage are
+        counted and timed. See 'stats'.
+        metrics_file: str = None : A path to a Prometheus text file where the statistics of the database are written
+        after every update and when the database is closed. See 'write_metrics'.
+
+    The connection in self.connection (and self.root) uses the default thread-local transaction manager, so it should
+    only be used from the thread which opened the database. To serve queries from multiple threads, each thread or
+    request can get its own connection from the connection pool with 'open_connection':
+
+        with mtg_db.open_connection() as root:
+            root.scryfall_cards.where(name='Wild Mongrel')
     """
 
     def __init__(self, file_name, create=False, read_only=False, stop=None,
                  quota=None, pack_gc=True, pack_keep_old=True, packer=None,
-                 blob_dir=None):
-        self.storage = ZODB.FileStorage.FileStorage(file_name, create=create, read_only=read_only, stop=stop,
-                                                    quota=quota, pack_gc=pack_gc, pack_keep_old=pack_keep_old,
-                                                    packer=packer,
-                                                    blob_dir=blob_dir)
-        self.database = ZODB.DB(self.storage)
+                 blob_dir=None, pool_size=7, cache_size=400, cache_size_bytes=0, pin_catalog=False, storage=None,
+                 sqlite_mirror=None, instrument=True, metrics_file=None):
+        if storage is not None:
+            self.storage = storage() if callable(storage) else storage
+        elif '://' in str(file_name):
+            self.storage = open_storage(str(file_name), read_only=read_only)
+        else:
+            self.storage = ZODB.FileStorage.FileStorage(file_name, create=create, read_only=read_only, stop=stop,
+                                                        quota=quota, pack_gc=pack_gc, pack_keep_old=pack_keep_old,
+                                                        packer=packer,
+                                                        blob_dir=blob_dir)
+
+        # Storages which give each connection its own instance (eg. RelStorage) can not be wrapped
+        if instrument and not IMVCCStorage.providedBy(self.storage):
+            self.storage = InstrumentedStorage(self.storage)
+
+        self.metrics_file = metrics_file
+        self.database = ZODB.DB(self.storage, pool_size=pool_size, cache_size=cache_size,
+                                cache_size_bytes=cache_size_bytes)
+        self.catalog_pinned = False
         self.connection = self.database.open()
         self.root = self.connection.root
 
         try:
             self.root.scryfall_cards
         except (AttributeError, KeyError):
-            self.root.scryfall_cards = PCardList()
+            self.root.scryfall_cards = PCardList(btree=True)
 
         try:
             self.root.scryfall_sets
         except (AttributeError, KeyError):
             self.root.scryfall_sets = PSetList()
 
+        try:
+            self.root.scryfall_price_history
+        except (AttributeError, KeyError):
+            self.root.scryfall_price_history = PriceHistory()
+
+        try:
+            self.root.scryfall_rulings
+        except (AttributeError, KeyError):
+            self.root.scryfall_rulings = RulingsIndex()
+
+        try:
+            self.root.update_runs
+        except (AttributeError, KeyError):
+            self.root.update_runs = IOBTree()
+
         try:
             self.root.mtgio_cards
         except (AttributeError, KeyError):
-            self.root.mtgio_cards = PCardList()
+            self.root.mtgio_cards = PCardList(btree=True)
 
         try:
             self.root.mtgio_sets
         except (AttributeError, KeyError):
             self.root.mtgio_sets = PSetList()
 
-    def scryfall_update(self, verbose=True, workers=8):
+        if pin_catalog:
+            self.pin_catalog()
+
+        self.sqlite_mirror = None
+
+        if sqlite_mirror:
+            from mtgtools.SQLiteMirror import SQLiteMirror
+            self.sqlite_mirror = SQLiteMirror(sqlite_mirror, self.connection)
+
+    def scryfall_update(self, verbose=True, workers=8, update_rulings=True):
         """Completely updates the database from scryfall downloading new sets and cards and also
         updating the current objects if there are any changes.
 
         Args:
             verbose (bool): If enabled, prints out progression messages during the updating process.
             workers (int): Maximum numbers fo threads for the updating.
+            update_rulings (bool): If enabled, also the rulings are updated if they have changed since the last update.
         """
+        from .util.api_requests import process_scryfall_cards, process_scryfall_sets, get_scryfall_card_bulks
+
         start = round(time.time())
+        run_counters = self._run_counters()
 
         current_sets = self.root.scryfall_sets
         current_cards = self.root.scryfall_cards
@@ -204,6 +287,9 @@ class MtgDB:
         # Update cards
         process_scryfall_cards(current_sets, current_cards, verbose=verbose, workers=workers)
 
+        if update_rulings:
+            self._update_scryfall_rulings(get_scryfall_card_bulks()['data'], verbose=verbose)
+
         # Transfer cards from obsolete sets to new ones
         for obsolete_set in obsolete_sets:
             cards = obsolete_set.cards
@@ -212,17 +298,34 @@ class MtgDB:
                 if len(pset):
                     pset[0].extend(cards)
 
+        # The cards updated in place have to be reindexed if the card list is indexed
+        current_cards.reindex()
+
+        if verbose:
+            sys.stdout.write('\rRecording prices...')
+
+        self.root.scryfall_price_history.record(current_cards)
+
         if verbose:
             sys.stdout.write('\rSaving and committing...')
 
+        transaction.get().note('mtgtools: Scryfall update')
         transaction.commit()
+
+        if self.sqlite_mirror is not None:
+            if verbose:
+                sys.stdout.write('\rRefreshing the SQLite mirror...')
+
+            self.refresh_sqlite_mirror()
+
         self.database.pack()
+        self._record_update_run('scryfall_update', run_counters)
 
         if verbose:
             update_str = '\rThe Scryfall database is now up to date! \nElapsed time: {}'
             sys.stdout.write(update_str.format(datetime.timedelta(seconds=round(time.time()) - start)))
 
-    def scryfall_bulk_update(self, bulk_type="default_cards", verbose=True):
+    def scryfall_bulk_update(self, bulk_type="default_cards", verbose=True, update_rulings=True):
         """Completely updates the database from scryfall downloading new sets and cards and also
         updating the current objects if there are any changes. The sets are downloaded from the
         API as usual but the cards are downloaded from bulk data provided by scryfall.
@@ -234,8 +337,13 @@ class MtgDB:
             bulk_type (str): Which type of bulk data downloaded, either 'oracle_cards', 'unique_artwork',
                 'default_cards' or 'all_cards'
             verbose (bool): If enabled, prints out progression messages during the updating process.
+            update_rulings (bool): If enabled, also the rulings are updated if they have changed since the last update.
         """
+        from .util.api_requests import process_scryfall_sets, get_scryfall_card_bulks, download_scryfall_bulk_data, \
+            process_cards_bulk
+
         start = round(time.time())
+        run_counters = self._run_counters()
 
         current_sets = self.root.scryfall_sets
         current_cards = self.root.scryfall_cards
@@ -277,6 +385,9 @@ class MtgDB:
 
         process_cards_bulk(current_sets, current_cards, bulk_card_data, verbose)
 
+        if update_rulings:
+            self._update_scryfall_rulings(scryfall_card_bulks, verbose=verbose)
+
         # Transfer cards from obsolete sets to new ones
         for obsolete_set in obsolete_sets:
             cards = obsolete_set.cards
@@ -285,16 +396,73 @@ class MtgDB:
                 if len(pset):
                     pset[0].extend(cards)
 
+        # The cards updated in place have to be reindexed if the card list is indexed
+        current_cards.reindex()
+
+        if verbose:
+            sys.stdout.write('\rRecording prices...')
+
+        self.root.scryfall_price_history.record(current_cards)
+
         if verbose:
             sys.stdout.write('\rSaving and committing...')
 
+        transaction.get().note('mtgtools: Scryfall bulk update')
         transaction.commit()
+
+        if self.sqlite_mirror is not None:
+            if verbose:
+                sys.stdout.write('\rRefreshing the SQLite mirror...')
+
+            self.refresh_sqlite_mirror()
+
         self.database.pack()
+        self._record_update_run('scryfall_bulk_update', run_counters)
 
         if verbose:
             update_str = '\rThe Scryfall database is now up to date! \nElapsed time: {}'
             sys.stdout.write(update_str.format(datetime.timedelta(seconds=round(time.time()) - start)))
 
+    def scryfall_rulings_update(self, verbose=True, force=False):
+        """Updates the rulings of the Scryfall cards from the rulings bulk data provided by Scryfall. The rulings are
+        only downloaded if they have been updated since the last time, unless 'force' is enabled.
+
+        Args:
+            verbose (bool): If enabled, prints out progression messages during the updating process.
+            force (bool): If enabled, the rulings are downloaded even if they have not been updated.
+        """
+        if verbose:
+            print('querying Scryfall API for bulk data...')
+
+        from .util.api_requests import get_scryfall_card_bulks
+
+        self._update_scryfall_rulings(get_scryfall_card_bulks()['data'], verbose=verbose, force=force)
+        transaction.commit()
+
+    def _update_scryfall_rulings(self, scryfall_bulks, verbose=True, force=False):
+        from .util.api_requests import download_scryfall_bulk_data
+
+        rulings = self.root.scryfall_rulings
+        rulings_bulk = next((bulk for bulk in scryfall_bulks if bulk['type'] == 'rulings'), None)
+
+        if rulings_bulk is None:
+            if verbose:
+                print('\nNo rulings bulk data found from Scryfall.')
+            return
+
+        if not force and rulings.updated_at == rulings_bulk['updated_at']:
+            if verbose:
+                print('\nThe rulings are already up to date.')
+            return
+
+        if verbose:
+            print('\nDownloading rulings updated at: %s ' % rulings_bulk['updated_at'])
+
+        changed = rulings.load(download_scryfall_bulk_data(rulings_bulk['download_uri']), rulings_bulk['updated_at'])
+
+        if verbose:
+            print('Updated the rulings of {} cards.'.format(changed))
+
     def mtgio_update(self, verbose=True, workers=8):
         """Completely updates the database from magicthegathering.io downloading new sets and cards and also
         updating the current objects if there are any changes.
@@ -303,7 +471,10 @@ class MtgDB:
             verbose (bool): If enabled, prints out progression messages during the updating process.
             workers (int): Maximum numbers fo threads for the updating.
         """
+        from .util.api_requests import get_tot_mtgio_cards, process_mtgio_sets, process_mtgio_cards
+
         start = round(time.time())
+        run_counters = self._run_counters()
         current_cards = self.root.mtgio_cards
         current_sets = self.root.mtgio_sets
         old_set_count = len(current_sets)
@@ -338,8 +509,12 @@ class MtgDB:
         if verbose:
             sys.stdout.write('\rSaving and committing...')
 
+        current_cards.reindex()
+
+        transaction.get().note('mtgtools: magicthegathering.io update')
         transaction.commit()
         self.database.pack()
+        self._record_update_run('mtgio_update', run_counters)
 
         if verbose:
             update_str = '\rThe magicthegathering.io database is now up to date!\nElapsed time: {}'
@@ -373,18 +548,561 @@ class MtgDB:
 
         if answer == 'y' or answer == 'yes':
             self.root.scryfall_sets = PSetList()
-            self.root.scryfall_cards = PCardList()
+            self.root.scryfall_cards = PCardList(btree=True)
+            self.root.scryfall_price_history = PriceHistory()
+            self.root.scryfall_rulings = RulingsIndex()
             self.root.mtgio_sets = PSetList()
-            self.root.mtgio_cards = PCardList()
+            self.root.mtgio_cards = PCardList(btree=True)
+            self.root.update_runs = IOBTree()
+            transaction.commit()
+            self.database.pack()
+
+    def bulk_load(self, cards_path, sets_path=None, chunk_size=20000, verbose=True, pack=True):
+        """Rebuilds the Scryfall cards and sets of the database offline from local files, without any network access.
+        The current Scryfall cards and sets are replaced with new ones read from the files. The cards are read as a
+        stream and added in chunks of 'chunk_size' cards, each chunk sorted by the sets of the cards and added to the
+        card lists of the sets at once. Each chunk is committed in a single transaction and the database is packed once
+        at the end.
+
+        'cards_path' can be a newline-delimited json export of cards (see PCardList.to_ndjson), a Scryfall bulk data
+        file or a directory written by PSetList.to_ndjson_shards, in which case the sets are also read from it. Any of
+        the files can be gzip-compressed. 'sets_path' can be a newline-delimited json export of sets or a response of
+        the Scryfall sets API. If no sets are given, the sets are created from the set attributes of the cards.
+
+        The price history and the rulings are not changed. The change is recorded as an update run, see
+        'update_runs'.
+
+        Args:
+            cards_path (str): The path to the cards file or to a directory of sharded files.
+            sets_path (str): The path to the sets file.
+            chunk_size (int): The number of cards added in each transaction.
+            verbose (bool): If enabled, prints out the progress.
+            pack (bool): If enabled, the database is packed after loading.
+
+        Returns:
+            int: The number of cards loaded.
+        """
+        import glob
+        import os
+
+        from itertools import groupby
+        from mtgtools.PCard import PCard
+        from mtgtools.PSet import PSet
+        from .util.export import read_records
+
+        start = round(time.time())
+        run_counters = self._run_counters()
+        card_paths = [cards_path]
+
+        if os.path.isdir(cards_path):
+            card_paths = sorted(glob.glob(os.path.join(cards_path, 'cards-*.ndjson*')))
+            sets_path = sets_path or next(iter(sorted(glob.glob(os.path.join(cards_path, 'sets.ndjson*')))), None)
+
+        set_index = {}
+
+        if sets_path is not None:
+            for set_record in read_records(sets_path):
+                set_index[set_record['code']] = PSet(set_record, btree=True)
+
+        index_fields = self.root.scryfall_cards.indexed_fields
+        name_index = self.root.scryfall_cards.has_name_index
+        cards = PCardList(btree=True)
+        self.root.scryfall_cards = cards
+        loaded = 0
+
+        def add_chunk(chunk):
+            chunk.sort(key=lambda card: card.set or '')
+            cards.extend(chunk)
+
+            for code, set_cards in groupby(chunk, key=lambda card: card.set):
+                set_cards = list(set_cards)
+                pset = set_index.get(code)
+
+                if pset is None:
+                    card = set_cards[0]
+                    pset = PSet({'id': card.set_id, 'code': code, 'name': card.set_name, 'set_type': card.set_type,
+                                 'uri': card.set_uri, 'scryfall_uri': card.scryfall_set_uri,
+                                 'search_uri': card.set_search_uri, 'released_at': card.released_at}, btree=True)
+                    set_index[code] = pset
+
+                pset.extend(set_cards)
+
+            transaction.get().note('mtgtools: bulk load')
             transaction.commit()
+            self.connection.cacheMinimize()
+
+        chunk = []
+        for path in card_paths:
+            for card_record in read_records(path):
+                chunk.append(PCard(card_record))
+
+                if len(chunk) >= chunk_size:
+                    add_chunk(chunk)
+                    loaded += len(chunk)
+                    chunk = []
+
+                    if verbose:
+                        sys.stdout.write('\rLoading cards: {}'.format(loaded))
+
+        if chunk:
+            add_chunk(chunk)
+            loaded += len(chunk)
+
+        # The new card list is indexed by the same attributes as the old one in a single pass
+        if index_fields:
+            cards.create_index(*index_fields)
+
+        if name_index:
+            cards.create_name_index()
+
+        for pset in set_index.values():
+            if pset.card_count is None:
+                pset.card_count = len(pset)
+
+        self.root.scryfall_sets = PSetList(sorted(set_index.values(), key=lambda pset: pset.released_at or '',
+                                                  reverse=True))
+
+        if verbose:
+            sys.stdout.write('\rSaving and committing...')
+
+        transaction.get().note('mtgtools: bulk load')
+        transaction.commit()
+
+        if self.sqlite_mirror is not None:
+            self.refresh_sqlite_mirror(full=True)
+
+        if pack:
+            if verbose:
+                sys.stdout.write('\rPacking the database...')
+
             self.database.pack()
 
+        self._record_update_run('bulk_load', run_counters)
+
+        if verbose:
+            print('\rLoaded {} cards and {} sets. Elapsed time: {}'.format(
+                loaded, len(set_index), datetime.timedelta(seconds=round(time.time()) - start)))
+
+        return loaded
+
+    def rewrite_cards(self, verbose=True, chunk_size=10000):
+        """Rewrites all the cards of the database in the current storage format and packs the database. Cards stored in
+        older formats are read normally, so this is never required, but rewriting them shrinks the database and speeds
+        up loading the cards.
+
+        Args:
+            verbose (bool): If enabled, prints out the progress.
+            chunk_size (int): The number of cards rewritten in each transaction.
+        """
+        for cards in (self.root.scryfall_cards, self.root.mtgio_cards):
+            for i, card in enumerate(cards, 1):
+                card._p_activate()
+                card._p_changed = True
+
+                if card._extras is not None and card._extras._card is None:
+                    card._extras._card = card
+
+                if i % chunk_size == 0:
+                    transaction.commit()
+                    self.connection.cacheMinimize()
+
+                    if verbose:
+                        sys.stdout.write('\rRewriting cards: [{} / {}]'.format(i, len(cards)))
+
+            transaction.commit()
+
+        if verbose:
+            print('\nPacking the database...')
+
+        self.database.pack()
+
+    def update_runs(self):
+        """Returns the update runs of the database from the oldest to the newest. Every update (eg. 'scryfall_update')
+        is recorded as a run with an increasing integer id which can be given to 'changed_cards'. The runs are
+        dictionaries:
+
+            'run':  The id of the run
+            'kind': The name of the update method, eg. 'scryfall_update'
+            'tid':  The id of the transaction which committed the changes of the update (as a hex string)
+            'time': The time of the update as a datetime
+            'stats': The storage loads, stores, commits and packs during the update and their durations, and the total
+                     duration of the update in 'seconds' (see 'stats')
+
+        Returns:
+            list[dict]: The update runs.
+        """
+        return [dict(run, run=run_id, tid=run['tid'].hex()) for run_id, run in self.root.update_runs.items()]
+
+    def changed_cards(self, start, end=None):
+        """Returns the cards whose records have been changed or created after 'start' and until 'end'. The changes are
+        found from the transaction records of the storage instead of comparing the cards, so the time taken depends on
+        the number of changes and not on the size of the database. For example, the cards changed during the last week:
+
+            mtg_db.changed_cards(datetime.datetime.now() - datetime.timedelta(days=7))
+
+        The points can be given as transaction ids (bytes or hex strings), as times (datetime or unix timestamps as
+        floats) or as the integer ids of update runs (see 'update_runs'). An update run means the state of the
+        database right after the update, so changed_cards(3, 4) gives the cards changed by the update run 4.
+
+        Note that packing the database removes the older revisions of the records. Ranges which end at the present are
+        always complete, but for ranges ending before the last pack only the cards whose current revisions were written
+        in the range are found. Cards which are removed from the card lists are not included.
+
+        Args:
+            start: The point after which the changes are looked for.
+            end: The last point included. By default the changes are looked for up to the present.
+
+        Returns:
+            PCardList: The changed cards.
+        """
+        start, end = self._tid(start), self._tid(end)
+        oids = changed_oids(self.storage, tid_after(start) if start is not None else None, end)
+
+        if oids is None:
+            raise ValueError('The storage of the database does not support iterating over its transactions.')
+
+        cards = dict((oid, self.connection.get(p64(oid))) for oid in oids['PCard'])
+        orphan_extras = set()
+
+        for oid in oids['PCardExtras']:
+            card = self.connection.get(p64(oid))._card
+
+            if card is not None:
+                cards[u64(card._p_oid)] = card
+            else:
+                orphan_extras.add(oid)
+
+        # Extras saved by older versions have no reference to their card, so their cards have to be searched
+        if orphan_extras:
+            for catalog in (self.root.scryfall_cards, self.root.mtgio_cards):
+                for card in catalog:
+                    extras = card._extras
+
+                    if extras is not None and extras._p_oid is not None and u64(extras._p_oid) in orphan_extras:
+                        cards[u64(card._p_oid)] = card
+
+        return PCardList([cards[oid] for oid in sorted(cards)])
+
+    def _run_counters(self):
+        counters = self.storage.counters() if isinstance(self.storage, InstrumentedStorage) else {}
+        counters['started'] = time.perf_counter()
+
+        return counters
+
+    def _record_update_run(self, kind, run_counters=None):
+        run = {'kind': kind, 'tid': self.storage.lastTransaction(), 'time': datetime.datetime.now()}
+
+        if run_counters is not None:
+            counters = self.storage.counters() if isinstance(self.storage, InstrumentedStorage) else {}
+            run['stats'] = dict((name, value - run_counters[name]) for name, value in counters.items())
+            run['stats']['seconds'] = time.perf_counter() - run_counters['started']
+
+        runs = self.root.update_runs
+        run_id = runs.maxKey() + 1 if runs else 1
+        runs[run_id] = run
+
+        transaction.get().note('mtgtools: recorded update run {}'.format(run_id))
+        transaction.commit()
+
+        if self.metrics_file:
+            self.write_metrics()
+
+        return run_id
+
+    def _tid(self, point):
+        if point is None or isinstance(point, bytes):
+            return point
+        elif isinstance(point, str):
+            return bytes.fromhex(point)
+        elif isinstance(point, int):
+            try:
+                return self.root.update_runs[point]['tid']
+            except KeyError:
+                raise ValueError('No update run with the id {}.'.format(point))
+        else:
+            return tid_from_time(point)
+
+    @contextlib.contextmanager
+    def open_connection(self, read_only=True):
+        """Opens a new connection to the database from the connection pool and returns a context manager which
+        gives the root of the connection. The connection has its own transaction manager, so each thread (or each
+        request in a web service) can safely use its own connection at the same time. The connection is closed and
+        returned to the pool when the context exits.
+
+        All the objects accessed through the connection show a consistent snapshot of the database as it was when
+        the connection was opened, even if the database is updated meanwhile.
+
+        By default the connection is read-only: any changes made through it are discarded when the context exits and
+        trying to commit them raises an error. If 'read_only' is disabled, the changes are committed when the context
+        exits normally and aborted if an exception is raised.
+
+        Args:
+            read_only (bool): If enabled, changes made through the connection can not be committed.
+
+        Returns:
+            The root of the connection.
+
+        Examples:
+            with mtg_db.open_connection() as root:
+                creatures = root.scryfall_cards.creatures()
+        """
+        transaction_manager = transaction.TransactionManager()
+        connection = self.database.open(transaction_manager=transaction_manager)
+
+        if self.catalog_pinned and not getattr(connection, 'mtgtools_catalog_loaded', False):
+            self._load_catalog(connection.root)
+            connection.mtgtools_catalog_loaded = True
+
+        try:
+            current_transaction = transaction_manager.begin()
+
+            if read_only:
+                current_transaction.doom()
+
+            yield connection.root
+
+            if read_only:
+                transaction_manager.abort()
+            else:
+                transaction_manager.commit()
+        except BaseException:
+            transaction_manager.abort()
+            raise
+        finally:
+            connection.close()
+
+    def pin_catalog(self):
+        """Loads all the cards of the database into the object cache and raises the object cache limits of the
+        connections so that the cards are never evicted from the cache. After this, queries over the whole card
+        database never need to load cards from the disk, unless the cards are changed by other connections. The
+        connections opened with 'open_connection' load the cards the first time they are opened.
+
+        Note that this needs enough memory to keep the whole card database in memory.
+        """
+        try:
+            object_count = self.database.objectCount()
+        except Exception:
+            object_count = 0
+
+        catalog_size = len(self.root.scryfall_cards) + len(self.root.mtgio_cards)
+        cache_size = max(self.database.getCacheSize(), object_count, 2 * catalog_size) + 1000
+
+        self.database.setCacheSize(cache_size)
+        self.database.setCacheSizeBytes(0)
+        self.connection._cache.cache_size = cache_size
+        self.connection._cache.cache_size_bytes = 0
+
+        self._load_catalog(self.root)
+        self.catalog_pinned = True
+
+    def cache_stats(self, reset=False):
+        """Returns statistics of the object cache of the main connection (self.connection) as a dictionary:
+
+            'misses':        The number of objects loaded from the storage since the last reset
+            'resident_cards': The number of cards which are loaded in the cache
+            'stores':        The number of objects stored to the storage since the last reset
+            'objects':       The number of objects in the cache, including ghosts
+            'resident':      The number of objects in the cache with their data loaded
+            'estimated_bytes': The estimated total size of the objects in the cache
+            'cache_size':    The object count limit of the cache
+            'cache_size_bytes': The byte size limit of the cache
+            'catalog_pinned': Whether the card database is pinned in the cache
+
+        ZODB only counts the objects it has to load from the storage (cache misses) and not the objects found in the
+        cache. 'resident_cards' tells how many of the cards a full scan of the card database would find in the cache
+        without loading anything.
+
+        Args:
+            reset (bool): If enabled, the load and store counters are reset after reading them.
+
+        Returns:
+            dict: The cache statistics.
+        """
+        cache = self.connection._cache
+        loads, stores = self.connection.getTransferCounts(reset)
+        catalog = (self.root.scryfall_cards, self.root.mtgio_cards)
+
+        return {'misses': loads,
+                'resident_cards': sum(1 for cards in catalog for card in cards.cards if card._p_status != 'ghost'),
+                'stores': stores,
+                'objects': len(cache),
+                'resident': cache.cache_non_ghost_count,
+                'estimated_bytes': cache.total_estimated_size,
+                'cache_size': cache.cache_size,
+                'cache_size_bytes': cache.cache_size_bytes,
+                'catalog_pinned': self.catalog_pinned}
+
+    def stats(self, reset=False):
+        """Returns the counters and timings of the storage and the object caches of the database as a dictionary:
+
+            'loads':           The number of objects loaded from the storage, that is, the cache misses of all the
+                               connections
+            'load_bytes':      The number of bytes loaded from the storage
+            'load_seconds':    The total time spent on loading objects from the storage
+            'stores':          The number of objects written to the storage
+            'store_bytes':     The number of bytes written to the storage
+            'commits':         The number of transactions committed
+            'commit_seconds':  The total time spent on committing, from the beginning of the two-phase commit of the
+                               storage to its end
+            'packs':           The number of times the database has been packed
+            'pack_seconds':    The total time spent on packing
+            'last_pack_seconds': The duration of the last pack or None if the database has not been packed
+            'cache_misses':    The number of objects loaded by the main connection (self.connection)
+            'cache_objects':   The number of objects in the cache of the main connection, including ghosts
+            'cache_resident':  The number of objects in the cache of the main connection with their data loaded
+            'cache_estimated_bytes': The estimated total size of the objects in the cache of the main connection
+            'pool_cache_objects': The number of objects in the caches of all the connections
+            'update_runs':     The number of recorded update runs
+            'last_update_run': The last update run with its own totals (see 'update_runs') or None
+
+        The storage counters count everything since the database was opened (or since the last reset) and they are
+        None if the storage is not instrumented (see the 'instrument' argument). ZODB only sees the objects it has to
+        load, so cache hits are not counted: a slow query with few loads is spending its time in Python and a query
+        with many loads is waiting for the storage. Comparing 'stats' before and after a query tells which one it is.
+
+        Args:
+            reset (bool): If enabled, the storage counters and the load counter of the main connection are reset after
+                reading them.
+
+        Returns:
+            dict: The statistics.
+        """
+        if isinstance(self.storage, InstrumentedStorage):
+            stats = self.storage.counters(reset)
+            stats['last_pack_seconds'] = self.storage.last_pack_seconds
+        else:
+            stats = dict.fromkeys(('loads', 'load_bytes', 'load_seconds', 'stores', 'store_bytes', 'commits',
+                                   'commit_seconds', 'packs', 'pack_seconds', 'last_pack_seconds'))
+
+        cache = self.connection._cache
+        runs = self.root.update_runs
+        last_run = runs.maxKey() if runs else None
+
+        stats.update({'cache_misses': self.connection.getTransferCounts(reset)[0],
+                      'cache_objects': len(cache),
+                      'cache_resident': cache.cache_non_ghost_count,
+                      'cache_estimated_bytes': cache.total_estimated_size,
+                      'pool_cache_objects': self.database.cacheSize(),
+                      'update_runs': len(runs),
+                      'last_update_run': dict(runs[last_run], run=last_run, tid=runs[last_run]['tid'].hex())
+                      if last_run is not None else None})
+
+        return stats
+
+    def write_metrics(self, path=None):
+        """Writes the statistics of the database (see 'stats') in a Prometheus text file, eg. for the textfile
+        collector of the node exporter. The file is replaced atomically. The durations and statistics of the latest
+        update run of each kind are labeled with the kind of the run. If the database was opened with 'metrics_file',
+        the file is written automatically after every update and when the database is closed.
+
+        Args:
+            path (str): The path of the file. By default the 'metrics_file' of the database is used.
+        """
+        path = path or self.metrics_file
+
+        if not path:
+            raise ValueError('No path given for the metrics file.')
+
+        stats = self.stats()
+        last_runs = {}
+        for run in self.root.update_runs.values():
+            last_runs[run['kind']] = run
+
+        metrics = [(name, metric_type, help_text, stats[key]) for key, name, metric_type, help_text in (
+            ('loads', 'storage_loads_total', 'counter', 'Objects loaded from the storage.'),
+            ('load_bytes', 'storage_load_bytes_total', 'counter', 'Bytes loaded from the storage.'),
+            ('load_seconds', 'storage_load_seconds_total', 'counter', 'Time spent on loading objects.'),
+            ('stores', 'storage_stores_total', 'counter', 'Objects written to the storage.'),
+            ('store_bytes', 'storage_store_bytes_total', 'counter', 'Bytes written to the storage.'),
+            ('commits', 'storage_commits_total', 'counter', 'Transactions committed.'),
+            ('commit_seconds', 'storage_commit_seconds_total', 'counter', 'Time spent on committing.'),
+            ('packs', 'storage_packs_total', 'counter', 'Packs of the database.'),
+            ('pack_seconds', 'storage_pack_seconds_total', 'counter', 'Time spent on packing.'),
+            ('last_pack_seconds', 'storage_last_pack_seconds', 'gauge', 'Duration of the last pack.'),
+            ('cache_misses', 'cache_misses_total', 'counter', 'Objects loaded by the main connection.'),
+            ('cache_objects', 'cache_objects', 'gauge', 'Objects in the cache of the main connection.'),
+            ('cache_resident', 'cache_resident_objects', 'gauge', 'Non-ghost objects in the cache of the main '
+                                                                  'connection.'),
+            ('cache_estimated_bytes', 'cache_estimated_bytes', 'gauge', 'Estimated size of the cache of the main '
+                                                                       'connection.'),
+            ('pool_cache_objects', 'pool_cache_objects', 'gauge', 'Objects in the caches of all the connections.'),
+            ('update_runs', 'update_runs_total', 'counter', 'Recorded update runs.'))
+            if stats[key] is not None]
+
+        metrics.append(('last_update_run_timestamp_seconds', 'gauge', 'Time of the last update run of each kind.',
+                        [({'kind': kind}, run['time'].timestamp()) for kind, run in sorted(last_runs.items())]))
+
+        for key, help_text in (('seconds', 'Duration of'), ('loads', 'Objects loaded during'),
+                               ('store_bytes', 'Bytes written during'), ('commits', 'Transactions committed during')):
+            samples = [({'kind': kind}, run['stats'][key]) for kind, run in sorted(last_runs.items())
+                       if key in run.get('stats', {})]
+            if samples:
+                metrics.append(('last_update_run_' + key, 'gauge', help_text + ' the last update run of each kind.',
+                                samples))
+
+        write_prometheus(path, metrics)
+
+    @staticmethod
+    def _load_catalog(root):
+        for psets in (root.scryfall_sets, root.mtgio_sets):
+            for pset in psets:
+                pset._p_activate()
+
+        for cards in (root.scryfall_cards, root.mtgio_cards):
+            for card in cards:
+                card._p_activate()
+
+    def refresh_sqlite_mirror(self, full=False):
+        """Refreshes the SQLite mirror of the Scryfall cards and sets. Only the cards changed since the previous
+        refresh are written unless 'full' is enabled. The mirror is refreshed automatically after every Scryfall
+        update.
+
+        Args:
+            full (bool): If enabled, every card is compared with its mirrored version instead of only checking the
+                transactions committed after the previous refresh.
+
+        Returns:
+            int: The number of cards written in the mirror.
+        """
+        if self.sqlite_mirror is None:
+            raise ValueError('The database has no SQLite mirror. Give a path to one with "sqlite_mirror".')
+
+        return self.sqlite_mirror.refresh(self.root, self.storage, full=full)
+
+    def export_snapshot(self, path, cards=None):
+        """Exports an immutable memory-mappable snapshot of the Scryfall cards in a file. Read-only worker processes
+        can open the snapshot with mtgtools.CatalogSnapshot.CatalogSnapshot in milliseconds without ZODB and all of
+        them share one copy of it in the page cache of the system. See CatalogSnapshot.
+
+        Args:
+            path (str): The path of the snapshot file. An existing snapshot is replaced atomically.
+            cards (PCardList): The cards to export. By default all the Scryfall cards are exported.
+
+        Returns:
+            int: The number of cards exported.
+        """
+        from mtgtools.CatalogSnapshot import write_snapshot
+
+        return write_snapshot(path, self.root.scryfall_cards if cards is None else cards)
+
     def close(self):
         """Closes the database properly. Using this is recommended after you are done using the database."""
+        if self.metrics_file:
+            self.write_metrics()
+
+        if self.sqlite_mirror is not None:
+            self.sqlite_mirror.close()
+
         self.connection.close()
         self.database.close()
         self.storage.close()
 
+    def sync(self):
+        """Updates self.root to show the latest state of the database. This is needed for seeing the changes committed
+        by other processes sharing the same storage, eg. through a ZEO server. Any uncommitted changes are discarded.
+        """
+        self.connection.sync()
+
     def commit(self):
         """Commits any changes to the database."""
         transaction.commit()
@@ -397,9 +1115,9 @@ class MtgDB:
         """Packs the database."""
         self.database.pack()
 
-    def verify_scryfall_integrity(self):
-        """
-        Asserts a certain set of integrity conditions related to the Scryfall card&set database. These conditions are:
+    def verify_scryfall_integrity(self, repair=False, verbose=True):
+        """Checks the integrity of the Scryfall card and set databases and returns a report of the problems found
+        (see IntegrityReport). The conditions checked are:
           - The sum of cards is the same as the separate sums of cards in each set
           - No set has duplicate cards
           - The cards database has no duplicate cards
@@ -408,36 +1126,125 @@ class MtgDB:
           - The set database has no duplicate sets
           - The number of cards in each set matches the set's 'card_count' attribute
 
-        The database should be fine if no assertation or other errors are raised.
+        The cards are matched by their ids with hash indexes, so checking takes a single pass over the cards and the
+        sets. The cards and the sets are both read through the connection of this database, so the changes which are
+        not committed yet are checked as well, and 'repair' fixes exactly the state which was checked.
+
+        If 'repair' is enabled, the problems are fixed in a single transaction: duplicate cards and sets are removed
+        keeping their first occurrences, the card lists of the sets are rebuilt with the cards which belong to them,
+        cards found only in the sets are added to the card database and the 'card_count' of each set is set to its
+        number of cards. Orphan cards can not be repaired as their sets are unknown.
+
+        Args:
+            repair (bool): If enabled, the problems found are repaired and committed.
+            verbose (bool): If enabled, prints out the report.
+
+        Returns:
+            IntegrityReport: The report of the problems found.
         """
+        from mtgtools.IntegrityReport import IntegrityReport, check_set
+
         cards = self.root.scryfall_cards
         sets = self.root.scryfall_sets
+        report = IntegrityReport()
+
+        results = [check_set(pset) for pset in sets]
 
-        # The sum of cards is the same as the separate sums of cards in each set
-        assert len(cards) == sum([len(pset.cards) for pset in sets])
+        # Index of the card ids of each set and of the cards of the card database
+        set_ids = dict((result['code'], set(result['ids'])) for result in results)
+        catalog = {}
 
-        # The cards database has no duplicate cards
-        ids = [card.id for card in cards]
-        assert len(ids) == len(set(ids))
+        for card in cards:
+            if card.id in catalog:
+                report.duplicate_cards.append(card.id)
+                continue
+
+            catalog[card.id] = card
 
-        # The sets database has no duplicate sets
-        ids = [pset.id for pset in sets]
-        assert len(ids) == len(set(ids))
+            if card.set not in set_ids:
+                report.orphan_cards.append(card.id)
+            elif card.id not in set_ids[card.set]:
+                report.missing_cards.setdefault(card.set, []).append(card.id)
 
+        seen_sets = set()
         for pset in sets:
-            # The number of cards in each set matches the set's 'card_count' attribute
-            assert len(pset.cards) == pset.card_count
+            if pset.id in seen_sets:
+                report.duplicate_sets.append(pset.id)
+            seen_sets.add(pset.id)
 
-            # Each card of the set is in the set it belongs to
-            for card in pset.cards:
-                assert card.set == pset.code
+        report.card_count = len(cards)
 
-            # No set has duplicate cards
-            ids = [card.id for card in pset.cards]
-            assert len(ids) == len(set(ids))
+        for result in results:
+            code = result['code']
+            report.set_card_count += len(result['ids'])
 
-        # Each card belongs in a set
-        for card in cards:
-            assert card in sets.where_exactly(code=card.set)[0].cards
+            if result['duplicates']:
+                report.duplicate_set_cards[code] = result['duplicates']
+            if result['misplaced']:
+                report.misplaced_cards[code] = result['misplaced']
+
+            unlisted = [card_id for card_id in result['ids'] if card_id not in catalog]
+            if unlisted:
+                report.unlisted_cards[code] = unlisted
+
+            if result['card_count'] != len(result['ids']):
+                report.count_mismatches[code] = (result['card_count'], len(result['ids']))
+
+        if repair and not report.ok:
+            self._repair_scryfall_integrity(report, catalog)
 
-        print("If no errors were encountered then your database should be fine!")
+        if verbose:
+            print(report)
+
+        return report
+
+    def _repair_scryfall_integrity(self, report, catalog):
+        cards = self.root.scryfall_cards
+        sets = self.root.scryfall_sets
+
+        if report.duplicate_sets:
+            seen_sets = set()
+            unique_sets = []
+
+            for pset in sets:
+                if pset.id not in seen_sets:
+                    seen_sets.add(pset.id)
+                    unique_sets.append(pset)
+
+            sets.sets = unique_sets
+
+        unlisted = dict((code, set(card_ids)) for code, card_ids in report.unlisted_cards.items())
+        broken_sets = set(report.duplicate_set_cards) | set(report.misplaced_cards) | set(report.missing_cards)
+        added_cards = []
+
+        for pset in sets:
+            if pset.code in unlisted:
+                for card in pset.cards:
+                    if card.id in unlisted[pset.code] and card.id not in catalog and card.set == pset.code:
+                        catalog[card.id] = card
+                        added_cards.append(card)
+
+            if pset.code in broken_sets:
+                seen = set()
+                set_cards = []
+
+                for card in pset.cards:
+                    if card.id not in seen and card.set == pset.code:
+                        seen.add(card.id)
+                        set_cards.append(card)
+
+                set_cards += [catalog[card_id] for card_id in report.missing_cards.get(pset.code, ())]
+                pset.clear()
+                pset.extend(set_cards)
+
+            if pset.card_count != len(pset):
+                pset.card_count = len(pset)
+
+        if report.duplicate_cards or added_cards:
+            unique_cards = list(catalog.values())
+            cards.clear()
+            cards.extend(unique_cards)
+
+        transaction.get().note('mtgtools: Scryfall integrity repair')
+        transaction.commit()
+        report.repaired = True
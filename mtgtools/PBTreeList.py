@@ -0,0 +1,310 @@
+########################################################################################################################
+# Copyright © 2018 Esko-Kalervo Salaka.
+# All rights reserved.
+#
+#
+# Zope Public License (ZPL) Version 2.1
+#
+# A copyright notice accompanies this license document that identifies the
+# copyright holders.
+#
+# This license has been certified as open source. It has also been designated as
+# GPL compatible by the Free Software Foundation (FSF).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions in source code must retain the accompanying copyright
+# notice, this list of conditions, and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the accompanying copyright
+# notice, this list of conditions, and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Names of the copyright holders must not be used to endorse or promote
+# products derived from this software without prior written permission from the
+# copyright holders.
+#
+# 4. The right to distribute this software or to use it for any purpose does not
+# give you the right to use Servicemarks (sm) or Trademarks (tm) of the
+# copyright
+# holders. Use of them is covered by separate agreement with the copyright
+# holders.
+#
+# 5. If any files are modified, you must cause the modified files to carry
+# prominent notices stating that you changed the files and the date of any
+# change.
+#
+# Disclaimer
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY EXPRESSED
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# This software uses ZODB, a native object database for Python, which is a
+# copyright © by Zope Foundation and Contributors.
+#
+# This software uses Scryfall's rest-like API which is a copyright © by Scryfall LLC.
+#
+# This software uses rest-like API of magicthegathering.io which is a copyright © by Andrew Backes.
+#
+# This software uses the Python Imaging Library (PIL) which is a copyright © 1997-2011 by Secret Labs AB and
+# copyright © 1995-2011 by Fredrik Lundh
+#
+# All the graphical and literal information and data related to Magic: The Gathering which can be handled with this
+# software, such as card information and card images, is copyright of Wizards of the Coast LLC, a
+# Hasbro inc. subsidiary.
+#
+# This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
+# Wizards of the Coast.
+########################################################################################################################
+from collections.abc import MutableSequence
+from itertools import islice
+
+from persistent import Persistent
+from BTrees.LOBTree import LOBTree
+from BTrees.Length import Length
+
+
+# The distance between the keys of consecutive items when the list is written in order
+KEY_SPACING = 1 << 20
+
+
+class PBTreeList(Persistent):
+    """PBTreeList is a persistent list which stores its items in the buckets of a BTree instead of a single persistent
+    record like PersistentList does. The items are keyed by integers in the order of the list with large gaps between
+    them, so adding, changing or removing an item anywhere in the list only writes the one small bucket holding the
+    item and the length of the list instead of the whole list. When the gap between two items runs out, the following
+    items are given new keys up to the next large enough gap, which usually touches the same bucket. This way the list
+    scales to very large lists like the whole card database which are modified a little at a time.
+
+    PBTreeList acts like a normal Python list with indexing, slicing and iteration in order. As long as items are only
+    added to and removed from the end, the key of an item is computed from its position. After items have been
+    inserted or removed in the middle, finding an item by its position walks the buckets of the BTree instead, which
+    is slower for random access but still fast for iteration and slices. Sorting or reversing the list spaces the keys
+    evenly again. It is used as the storage of PCardList objects created with 'btree=True'.
+
+    args:
+        items (iterable): Initial items of the list.
+    """
+
+    # Lists saved by older versions have consecutive keys
+    _spacing = 1
+    _regular = True
+
+    def __init__(self, items=None):
+        self._tree = LOBTree()
+        self._length = Length()
+        self._spacing = KEY_SPACING
+
+        if items:
+            self.extend(items)
+
+    def __len__(self):
+        return self._length()
+
+    def __iter__(self):
+        return iter(self._tree.values())
+
+    def __reversed__(self):
+        if not self._tree:
+            return
+
+        key = self._tree.maxKey()
+        while True:
+            yield self._tree[key]
+
+            try:
+                key = self._tree.maxKey(key - 1)
+            except ValueError:
+                return
+
+    def __contains__(self, item):
+        return any(value == item for value in self)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+
+            if start >= stop and step > 0:
+                return []
+            elif step == 1:
+                return list(islice(self._tree.values(self._key(start)), stop - start))
+            else:
+                return list(self)[index]
+
+        return self._tree[self._key(self._position(index))]
+
+    def __setitem__(self, index, item):
+        if isinstance(index, slice):
+            items = list(self)
+            items[index] = item
+            self._replace(items)
+        else:
+            self._tree[self._key(self._position(index))] = item
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            items = list(self)
+            del items[index]
+            self._replace(items)
+        else:
+            self.pop(index)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def append(self, item):
+        self._tree[self._next_key()] = item
+        self._length.change(1)
+
+    def extend(self, items):
+        key = self._next_key()
+        added = 0
+
+        for item in items:
+            self._tree[key] = item
+            key += self._spacing
+            added += 1
+
+        self._length.change(added)
+
+    def insert(self, index, item):
+        length = len(self)
+        index = min(max(index + length if index < 0 else index, 0), length)
+
+        if index == length:
+            self.append(item)
+            return
+
+        if index == 0:
+            self._tree[self._tree.minKey() - self._spacing] = item
+        else:
+            previous = self._key(index - 1)
+            following = self._tree.minKey(previous + 1)
+
+            if following - previous >= 2:
+                self._tree[previous + (following - previous) // 2] = item
+            else:
+                self._spread(previous, item)
+
+        # The list itself is only saved when it stops being regular
+        if self._regular:
+            self._regular = False
+
+        self._length.change(1)
+
+    def pop(self, index=-1):
+        position = self._position(index)
+        item = self._tree.pop(self._key(position))
+        self._removed(position)
+
+        return item
+
+    def remove(self, item):
+        for position, (key, value) in enumerate(self._tree.items()):
+            if value == item:
+                del self._tree[key]
+                self._removed(position)
+                return
+
+        raise ValueError('{} is not in list'.format(item))
+
+    def index(self, item):
+        for position, value in enumerate(self._tree.values()):
+            if value == item:
+                return position
+
+        raise ValueError('{} is not in list'.format(item))
+
+    def count(self, item):
+        return sum(1 for value in self if value == item)
+
+    def clear(self):
+        self._tree.clear()
+        self._length.set(0)
+
+        if not self._regular:
+            self._regular = True
+
+    def sort(self, key=None, reverse=False):
+        self._replace(sorted(self, key=key, reverse=reverse))
+
+    def reverse(self):
+        self._replace(list(reversed(list(self))))
+
+    def _position(self, index):
+        length = len(self)
+        position = index + length if index < 0 else index
+
+        if not 0 <= position < length:
+            raise IndexError('list index out of range')
+
+        return position
+
+    def _key(self, position):
+        if self._regular:
+            return position * self._spacing
+
+        return self._tree.keys()[position]
+
+    def _next_key(self):
+        return self._tree.maxKey() + self._spacing if self._tree else 0
+
+    def _removed(self, position):
+        length = self._length()
+        self._length.change(-1)
+
+        if length == 1:
+            if not self._regular:
+                self._regular = True
+        elif position != length - 1 and self._regular:
+            self._regular = False
+
+    def _spread(self, previous, item):
+        # Gives the items after 'previous' new keys up to the first gap which has room for them and the new item
+        keys = []
+        bound = None
+
+        for key in self._tree.keys(previous + 1):
+            if key - previous >= 2 * (len(keys) + 2):
+                bound = key
+                break
+
+            keys.append(key)
+
+        if bound is None:
+            bound = keys[-1] + self._spacing * (len(keys) + 2)
+
+        items = [item] + [self._tree.pop(key) for key in keys]
+
+        for number, moved_item in enumerate(items, 1):
+            self._tree[previous + (bound - previous) * number // (len(items) + 1)] = moved_item
+
+    def _replace(self, items):
+        # Lists of older versions get the spaced keys here as all the items are written anyway
+        self._tree = LOBTree()
+        self._spacing = KEY_SPACING
+        self._length.set(0)
+        self._regular = True
+        self.extend(items)
+
+
+MutableSequence.register(PBTreeList)
@@ -67,16 +67,245 @@
 # Wizards of the Coast.
 ########################################################################################################################
 
-import io
-import json
+import sys
 import time
-import urllib.request
 import warnings
-import pathlib
-from urllib.error import URLError
 from persistent import Persistent
 
 
+# The attributes of cards from each api, used for the json representations of the cards
+SCRYFALL_FIELDS = ('arena_id', 'id', 'lang', 'mtgo_id', 'mtgo_foil_id', 'multiverse_ids', 'tcgplayer_id',
+                   'tcgplayer_etched_id', 'cardmarket_id', 'oracle_id', 'prints_search_uri', 'rulings_uri',
+                   'scryfall_uri', 'uri', 'all_parts', 'card_faces', 'cmc', 'color_identity', 'color_indicator',
+                   'colors', 'edhrec_rank', 'hand_modifier', 'keywords', 'layout', 'legalities', 'life_modifier',
+                   'loyalty', 'mana_cost', 'name', 'oracle_text', 'oversized', 'power', 'produced_mana', 'reserved',
+                   'toughness', 'type_line', 'artist', 'booster', 'border_color', 'card_back_id', 'collector_number',
+                   'content_warning', 'digital', 'finishes', 'flavor_name', 'flavor_text', 'frame_effects', 'frame',
+                   'full_art', 'games', 'highres_image', 'illustration_id', 'image_status', 'image_uris', 'prices',
+                   'printed_name', 'printed_text', 'printed_type_line', 'promo', 'promo_types', 'purchase_uris',
+                   'rarity', 'related_uris', 'released_at', 'reprint', 'scryfall_set_uri', 'set_name',
+                   'set_search_uri', 'set_type', 'set_uri', 'set', 'set_id', 'story_spotlight', 'textless',
+                   'variation', 'variation_of', 'watermark')
+MTGIO_FIELDS = ('name', 'layout', 'mana_cost', 'cmc', 'colors', 'color_identity', 'names', 'type', 'supertypes',
+                'subtypes', 'types', 'rarity', 'text', 'flavor', 'artist', 'number', 'power', 'toughness', 'loyalty',
+                'multiverse_id', 'variations', 'variation', 'watermark', 'border', 'timeshifted', 'hand', 'life',
+                'release_date', 'starter', 'printings', 'original_text', 'original_type', 'source', 'image_url',
+                'set', 'set_name', 'id', 'legalities', 'rulings', 'foreign_names')
+
+NUMERIC_FIELDS = ('power_num', 'toughness_num', 'loyalty_num')
+
+# The order of the fields in the stored card records. Never reorder or remove fields here, new fields must only be
+# appended to the end so that the existing records stay readable.
+STATE_FIELDS = ('arena_id', 'id', 'lang', 'mtgo_id', 'mtgo_foil_id', 'multiverse_ids', 'tcgplayer_id',
+                'tcgplayer_etched_id', 'cardmarket_id', 'oracle_id', 'prints_search_uri', 'rulings_uri',
+                'scryfall_uri', 'uri', 'all_parts', 'card_faces', 'cmc', 'color_identity', 'color_indicator',
+                'colors', 'edhrec_rank', 'hand_modifier', 'keywords', 'layout', 'legalities', 'life_modifier',
+                'loyalty', 'mana_cost', 'name', 'oracle_text', 'oversized', 'power', 'produced_mana', 'reserved',
+                'toughness', 'type_line', 'artist', 'booster', 'border_color', 'card_back_id', 'collector_number',
+                'content_warning', 'digital', 'finishes', 'flavor_name', 'flavor_text', 'frame_effects', 'frame',
+                'full_art', 'games', 'highres_image', 'illustration_id', 'image_status', 'image_uris', 'prices',
+                'printed_name', 'printed_text', 'printed_type_line', 'promo', 'promo_types', 'purchase_uris',
+                'rarity', 'related_uris', 'released_at', 'reprint', 'scryfall_set_uri', 'set_name', 'set_search_uri',
+                'set_type', 'set_uri', 'set', 'set_id', 'story_spotlight', 'textless', 'variation', 'variation_of',
+                'watermark', 'names', 'type', 'supertypes', 'subtypes', 'types', 'text', 'flavor', 'number',
+                'multiverse_id', 'variations', 'border', 'timeshifted', 'hand', 'life', 'release_date', 'starter',
+                'printings', 'original_text', 'original_type', 'source', 'image_url', 'rulings', 'foreign_names',
+                'power_num', 'toughness_num', 'loyalty_num', '_image_version', '_extras')
+
+
+# Low-cardinality string attributes which are shared between the card objects instead of duplicated in each one
+INTERNED_FIELDS = ('lang', 'layout', 'rarity', 'set', 'set_name', 'set_type', 'set_id', 'frame', 'border_color',
+                   'image_status', 'artist', 'type_line', 'mana_cost', 'watermark', 'released_at', 'type', 'border',
+                   'release_date', 'source')
+INTERNED_LIST_FIELDS = ('colors', 'color_identity', 'color_indicator', 'games', 'finishes', 'keywords',
+                        'produced_mana', 'promo_types', 'frame_effects', 'supertypes', 'subtypes', 'types')
+_INTERNED_NAMES = frozenset(INTERNED_FIELDS + INTERNED_LIST_FIELDS + ('legalities',))
+
+# Uris which are derived from the other attributes unless they differ from the derived values
+DERIVED_FIELDS = ('uri', 'rulings_uri', 'prints_search_uri', 'set_uri', 'set_search_uri', 'scryfall_set_uri',
+                  'image_uris')
+PRIVATE_FIELDS = ('_image_version', '_extras')
+
+# Bulky and rarely used attributes which are stored in a separate record (PCardExtras) loaded only when needed
+EXTRA_FIELDS = ('all_parts', 'legalities', 'purchase_uris', 'related_uris', 'prices', 'rulings', 'foreign_names')
+
+IMAGE_TYPES = ('small', 'normal', 'large', 'png', 'art_crop', 'border_crop')
+
+
+def _intern_attributes(attributes):
+    for key in INTERNED_FIELDS:
+        value = attributes.get(key)
+
+        if type(value) is str:
+            attributes[key] = sys.intern(value)
+
+    for key in INTERNED_LIST_FIELDS:
+        value = attributes.get(key)
+
+        if type(value) is list:
+            attributes[key] = [sys.intern(item) if type(item) is str else item for item in value]
+
+    legalities = attributes.get('legalities')
+
+    if type(legalities) is dict:
+        attributes['legalities'] = dict((sys.intern(key), sys.intern(value) if type(value) is str else value)
+                                        for key, value in legalities.items())
+
+
+def _derived_image_uris(card, version):
+    if card.id is None or version is None:
+        return None
+
+    return dict((image_type, 'https://cards.scryfall.io/{}/front/{}/{}/{}.{}?{}'.format(
+        image_type, card.id[0], card.id[1], card.id, 'png' if image_type == 'png' else 'jpg', version))
+        for image_type in IMAGE_TYPES)
+
+
+class _DerivedAttribute:
+    """A data descriptor for a Scryfall card attribute which can usually be derived from the other attributes of the
+    card, like the uri of the card from its id. The value is only stored in the card if it differs from the derived
+    one, otherwise it is derived on access."""
+
+    def __init__(self, derive):
+        self.derive = derive
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, card, owner):
+        if card is None:
+            return self
+
+        card._p_activate()
+        value = card.__dict__.get(self.name)
+
+        if value is None and card.__dict__.get('scryfall_uri') is not None:
+            return self.derive(card)
+
+        return value
+
+    def __set__(self, card, value):
+        if value is None:
+            card.__dict__.pop(self.name, None)
+        else:
+            card.__dict__[self.name] = value
+            self.compact(card)
+
+    def __delete__(self, card):
+        card.__dict__.pop(self.name, None)
+
+    def compact(self, card):
+        value = card.__dict__.get(self.name)
+
+        if value is not None and card.__dict__.get('scryfall_uri') is not None and value == self.derive(card):
+            del card.__dict__[self.name]
+
+
+class _DerivedImageUris(_DerivedAttribute):
+    """The image uris of Scryfall cards only differ by the card id and a version timestamp, so only the timestamp is
+    stored in the card."""
+
+    def __get__(self, card, owner):
+        if card is None:
+            return self
+
+        card._p_activate()
+        value = card.__dict__.get(self.name)
+
+        if value is None:
+            return _derived_image_uris(card, card.__dict__.get('_image_version'))
+
+        return value
+
+    def __set__(self, card, value):
+        card.__dict__.pop('_image_version', None)
+        super().__set__(card, value)
+
+    def __delete__(self, card):
+        card.__dict__.pop('_image_version', None)
+        super().__delete__(card)
+
+    def compact(self, card):
+        value = card.__dict__.get(self.name)
+
+        if type(value) is not dict or not isinstance(value.get('normal'), str) or '?' not in value['normal']:
+            return
+
+        version = value['normal'].rsplit('?', 1)[1]
+
+        if value == _derived_image_uris(card, version):
+            del card.__dict__[self.name]
+            card.__dict__['_image_version'] = version
+
+
+class PCardExtras(Persistent):
+    """PCardExtras holds the bulky and rarely used attributes of a card (see EXTRA_FIELDS) in a record of its own, so
+    that loading a card for a query does not load them. The attributes are accessed normally through the card and
+    the extras are loaded on the first access. Changing only these attributes, like the prices, saves only this
+    record instead of the whole card.
+
+    The extras refer back to their card in '_card', so that the card of a changed extras record can be found without
+    searching (see MtgDB.changed_cards). Extras saved by older versions do not have it until they are changed."""
+
+    _card = None
+
+    def __setstate__(self, state):
+        _intern_attributes(state)
+        super().__setstate__(state)
+
+
+class _ExtraAttribute:
+    """A data descriptor for a card attribute which is stored in the extras (PCardExtras) of the card."""
+
+    def __init__(self):
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, card, owner):
+        if card is None:
+            return self
+
+        return getattr(card._extras, self.name, None)
+
+    def __set__(self, card, value):
+        extras = card._extras
+
+        if value is None:
+            if extras is not None and self.name in extras.__dict__:
+                delattr(extras, self.name)
+                self._mark_changed(card, extras)
+            return
+
+        if extras is None:
+            extras = PCardExtras()
+            card._extras = extras
+
+        if extras._card is None:
+            extras._card = card
+
+        if self.name in _INTERNED_NAMES:
+            attributes = {self.name: value}
+            _intern_attributes(attributes)
+            value = attributes[self.name]
+
+        setattr(extras, self.name, value)
+        self._mark_changed(card, extras)
+
+    @staticmethod
+    def _mark_changed(card, extras):
+        # The extras of a card read from a record of an older version are created when the card is loaded and are
+        # not stored yet, so changing them does not register a change. The card is saved instead, which stores the
+        # extras as a new record along with it.
+        if extras._p_jar is None and card._p_jar is not None:
+            card._p_changed = True
+
+    def __delete__(self, card):
+        self.__set__(card, None)
+
+
 class PCard(Persistent):
     """PCard is a simple persistent dataclass representing Magic: the Gathering cards with their characteristic
     attributes. It is constructed simply with a json response dictionary from either magicthegathering.io or Scryfall
@@ -85,6 +314,18 @@ class PCard(Persistent):
     For easy querying of card objects from lists of cards, the PCard has two convenient methods to check for matching
     attributes.
 
+    Attributes which are absent (None) for a card are not stored in the card at all but fall back to the None defaults
+    of the class, and the stored records only hold the values of the present attributes in a fixed order
+    (see STATE_FIELDS). Cards stored in the older format are read normally and converted when they are saved again.
+    Use 'as_dict' to get all the attributes of a card including the absent ones.
+
+    The bulky and rarely used attributes like 'legalities' and 'prices' (see EXTRA_FIELDS) are stored in a separate
+    record (PCardExtras) which is only loaded when one of them is accessed.
+
+    The uris of Scryfall cards which follow the usual Scryfall patterns (see DERIVED_FIELDS) are not stored either but
+    derived from the id, oracle id and set of the card when accessed, and common short strings like the set names and
+    rarities are shared between the cards (see INTERNED_FIELDS).
+
     PCards have one of the following sets of attributes. In addition to these attributes, the cards have numerical
     versions of 'power', 'toughness' and 'loyalty' since these attributes are strings that might contain characters
     like '*' or 'X'. After stripping away these characters, the remaining numbers will be in the numerical version
@@ -198,6 +439,30 @@ class PCard(Persistent):
             response_dict (str): A json response dictionary containing a set of attributes for the card object from.
                 Tne response dict can be from either Scryfall of magicthegathering.io API.
     """
+    uri = _DerivedAttribute(lambda card: 'https://api.scryfall.com/cards/{}'.format(card.id)
+                            if card.id else None)
+    rulings_uri = _DerivedAttribute(lambda card: 'https://api.scryfall.com/cards/{}/rulings'.format(card.id)
+                                    if card.id else None)
+    prints_search_uri = _DerivedAttribute(
+        lambda card: 'https://api.scryfall.com/cards/search?order=released&q=oracleid%3A{}&unique=prints'.format(
+            card.oracle_id) if card.oracle_id else None)
+    set_uri = _DerivedAttribute(lambda card: 'https://api.scryfall.com/sets/{}'.format(card.set_id)
+                                if card.set_id else None)
+    set_search_uri = _DerivedAttribute(
+        lambda card: 'https://api.scryfall.com/cards/search?order=set&q=e%3A{}&unique=prints'.format(card.set)
+        if card.set else None)
+    scryfall_set_uri = _DerivedAttribute(lambda card: 'https://scryfall.com/sets/{}?utm_source=api'.format(card.set)
+                                         if card.set else None)
+    image_uris = _DerivedImageUris(None)
+
+    all_parts = _ExtraAttribute()
+    legalities = _ExtraAttribute()
+    purchase_uris = _ExtraAttribute()
+    related_uris = _ExtraAttribute()
+    prices = _ExtraAttribute()
+    rulings = _ExtraAttribute()
+    foreign_names = _ExtraAttribute()
+
     def __init__(self, response_dict):
         if 'scryfall_uri' in response_dict:
             self.arena_id = response_dict.get('arena_id')
@@ -327,18 +592,63 @@ class PCard(Persistent):
         self.loyalty_num = self.__mk_num(self.loyalty)
 
         if getattr(self, 'card_faces', None):
-            for card_face in self.card_faces:
-                if 'power' in card_face:
-                    card_face['power_num'] = self.__mk_num(
-                        card_face.get('power'))
+            self.card_faces = self.__numbered_faces(self.card_faces)
+
+        # Absent attributes are left to the None defaults of the class so that they take no space
+        for key in [key for key, value in self.__dict__.items() if value is None]:
+            del self.__dict__[key]
 
-                if 'toughness' in card_face:
-                    card_face['toughness_num'] = self.__mk_num(
-                        card_face.get('toughness'))
+        _intern_attributes(self.__dict__)
+        self._compact_derived_attributes()
 
-                if 'loyalty' in card_face:
-                    card_face['loyalty_num'] = self.__mk_num(
-                        card_face.get('loyalty'))
+    def __getstate__(self):
+        state = super().__getstate__()
+        mask = 0
+        values = []
+
+        for index, field in enumerate(STATE_FIELDS):
+            value = state.pop(field, None)
+
+            if value is not None:
+                mask |= 1 << index
+                values.append(value)
+
+        if state:
+            return mask, tuple(values), state
+        else:
+            return mask, tuple(values)
+
+    def __setstate__(self, state):
+        # Records written before the compact layout are plain attribute dictionaries
+        if isinstance(state, dict):
+            attributes = dict((key, value) for key, value in state.items() if value is not None)
+        else:
+            mask, values = state[0], state[1]
+            attributes = dict(state[2]) if len(state) > 2 else {}
+            position = 0
+
+            while mask:
+                bit = mask & -mask
+                attributes[STATE_FIELDS[bit.bit_length() - 1]] = values[position]
+                position += 1
+                mask ^= bit
+
+        # Records of older versions hold the extra attributes in the card itself
+        extras = dict((key, attributes.pop(key)) for key in EXTRA_FIELDS if key in attributes)
+
+        if extras:
+            extras['_card'] = self
+            attributes['_extras'] = PCardExtras()
+            attributes['_extras'].__setstate__(extras)
+
+        _intern_attributes(attributes)
+        super().__setstate__(attributes)
+        self._compact_derived_attributes()
+
+    def _compact_derived_attributes(self):
+        # Drops the stored values which are the same as the derived ones, eg. from records of older versions
+        for attribute in DERIVED_FIELDS:
+            PCard.__dict__[attribute].compact(self)
 
     def __hash__(self):
         return hash(self.id)
@@ -375,6 +685,21 @@ class PCard(Persistent):
     def __repr__(self):
         return '{} ({})'.format(self.name, self.set)
 
+    def __numbered_faces(self, card_faces):
+        # Copies of the faces are made so that the numeric values are not added to the given dictionaries
+        numbered_faces = []
+
+        for card_face in card_faces:
+            card_face = dict(card_face)
+
+            for attribute in ('power', 'toughness', 'loyalty'):
+                if attribute in card_face:
+                    card_face[attribute + '_num'] = self.__mk_num(card_face.get(attribute))
+
+            numbered_faces.append(card_face)
+
+        return numbered_faces
+
     def __mk_num(self, s):
         if type(s) is float or type(s) is int:
             return float(s)
@@ -419,21 +744,26 @@ class PCard(Persistent):
 
     def update(self, response_dict):
         for key, value in response_dict.items():
-            setattr(self, key, value)
+            if value is None:
+                if key in self.__dict__ or (key in EXTRA_FIELDS and getattr(self, key) is not None):
+                    delattr(self, key)
+                continue
+
+            # The faces are compared with the numeric values which the stored faces also have
+            if key == 'card_faces':
+                value = self.__numbered_faces(value)
 
-            if key == 'card_faces' and value is not None:
-                for card_face in self.card_faces:
-                    if 'power' in card_face:
-                        card_face['power_num'] = self.__mk_num(
-                            card_face.get('power'))
+            # Unchanged attributes are not set so that eg. updating only the prices does not save the whole card
+            if getattr(self, key, None) == value:
+                continue
 
-                    if 'toughness' in card_face:
-                        card_face['toughness_num'] = self.__mk_num(
-                            card_face.get('toughness'))
+            if key in EXTRA_FIELDS and self._extras is not None:
+                PCard.__dict__[key].__set__(self, value)
+            else:
+                setattr(self, key, value)
 
-                    if 'loyalty' in card_face:
-                        card_face['loyalty_num'] = self.__mk_num(
-                            card_face.get('loyalty'))
+        _intern_attributes(self.__dict__)
+        self._compact_derived_attributes()
 
     def matches_any(self, search_all_faces=False, **kwargs):
         """Returns True if any of the given keyword arguments match 'loosely' with this cards's attributes.
@@ -557,6 +887,30 @@ class PCard(Persistent):
 
         return True
 
+    def get_rulings(self, rulings_index=None):
+        """Returns the rulings of this card. For magicthegathering.io cards the rulings are stored in the card itself.
+        For Scryfall cards the rulings are looked up from a rulings index (RulingsIndex) by the card's 'oracle_id'
+        without sending any requests to Scryfall. If no index is given, the index of the database this card is stored in
+        (self.root.scryfall_rulings of MtgDB) is used.
+
+        Args:
+            rulings_index (RulingsIndex): An index of rulings to look up the rulings from.
+
+        Returns:
+            list[dict]: A list of the rulings of this card.
+        """
+        if self.api_type != 'scryfall':
+            return list(self.rulings or [])
+
+        if rulings_index is None and self._p_jar is not None:
+            rulings_index = self._p_jar.root().get('scryfall_rulings')
+
+        if rulings_index is None:
+            warnings.warn('No rulings index found for the card --{}--'.format(str(self)))
+            return []
+
+        return rulings_index.get(self.oracle_id)
+
     def download_image_from_scryfall(self,
                                      image_type='normal',
                                      dir_path='',
@@ -585,6 +939,10 @@ class PCard(Persistent):
             )
             return
 
+        import pathlib
+        import urllib.request
+        from urllib.error import URLError
+
         path = pathlib.Path(dir_path)
 
         try:
@@ -662,6 +1020,10 @@ class PCard(Persistent):
             )
             return
 
+        import io
+        import urllib.request
+        from urllib.error import URLError
+
         try:
             if self.image_uris and self.image_uris.get(image_type):
                 image = Image.open(
@@ -701,16 +1063,52 @@ class PCard(Persistent):
                 .format(str(self)))
             print(str(err))
 
+    def as_dict(self):
+        """Returns a dictionary of all the attributes of this card, including the ones that are absent (None).
+
+        Returns:
+            dict: A dictionary of the attributes of this card.
+        """
+        fields = SCRYFALL_FIELDS if self.api_type == 'scryfall' else MTGIO_FIELDS
+        attributes = dict((field, getattr(self, field)) for field in fields + NUMERIC_FIELDS)
+        attributes.update((key, value) for key, value in self.__dict__.items() if key not in PRIVATE_FIELDS)
+
+        return attributes
+
+    def has_field(self, name):
+        """Returns True if a given name is an attribute of this card, that is, a field of the api of the card or
+        another attribute of the card. The fields of the other api are not attributes of the card even though they
+        read as None.
+
+        Args:
+            name (str): The name of the attribute.
+
+        Returns:
+            bool: True if the card has the attribute and False otherwise.
+        """
+        if name in STATE_FIELDS:
+            fields = SCRYFALL_FIELDS if self.api_type == 'scryfall' else MTGIO_FIELDS
+            return name in fields or name in NUMERIC_FIELDS or name in self.__dict__
+
+        return hasattr(self, name)
+
     @property
     def api_type(self):
-        if hasattr(self, 'scryfall_uri'):
+        if self.scryfall_uri is not None:
             return 'scryfall'
         else:
             return 'mtgio'
 
     @property
     def json(self):
-        return json.dumps(self,
-                          default=lambda o: o.__dict__,
+        import json
+
+        return json.dumps(self.as_dict(),
                           sort_keys=True,
                           indent=4)
+
+
+# Absent attributes of cards default to None
+for _field in STATE_FIELDS:
+    if _field not in PCard.__dict__:
+        setattr(PCard, _field, None)
@@ -0,0 +1,533 @@
+########################################################################################################################
+# Copyright © 2018 Esko-Kalervo Salaka.
+# All rights reserved.
+#
+#
+# Zope Public License (ZPL) Version 2.1
+#
+# A copyright notice accompanies this license document that identifies the
+# copyright holders.
+#
+# This license has been certified as open source. It has also been designated as
+# GPL compatible by the Free Software Foundation (FSF).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions in source code must retain the accompanying copyright
+# notice, this list of conditions, and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the accompanying copyright
+# notice, this list of conditions, and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Names of the copyright holders must not be used to endorse or promote
+# products derived from this software without prior written permission from the
+# copyright holders.
+#
+# 4. The right to distribute this software or to use it for any purpose does not
+# give you the right to use Servicemarks (sm) or Trademarks (tm) of the
+# copyright
+# holders. Use of them is covered by separate agreement with the copyright
+# holders.
+#
+# 5. If any files are modified, you must cause the modified files to carry
+# prominent notices stating that you changed the files and the date of any
+# change.
+#
+# Disclaimer
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY EXPRESSED
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# This software uses ZODB, a native object database for Python, which is a
+# copyright © by Zope Foundation and Contributors.
+#
+# This software uses Scryfall's rest-like API which is a copyright © by Scryfall LLC.
+#
+# This software uses rest-like API of magicthegathering.io which is a copyright © by Andrew Backes.
+#
+# This software uses the Python Imaging Library (PIL) which is a copyright © 1997-2011 by Secret Labs AB and
+# copyright © 1995-2011 by Fredrik Lundh
+#
+# All the graphical and literal information and data related to Magic: The Gathering which can be handled with this
+# software, such as card information and card images, is copyright of Wizards of the Coast LLC, a
+# Hasbro inc. subsidiary.
+#
+# This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
+# Wizards of the Coast.
+########################################################################################################################
+from persistent import Persistent
+from BTrees.IIBTree import IIBTree, IISet, IITreeSet, multiunion
+from BTrees.IOBTree import IOBTree
+from BTrees.OIBTree import OIBTree, OIBucket, OITreeSet, weightedUnion
+from BTrees.OOBTree import OOBTree
+
+from mtgtools.util.fuzzy import closest, trigrams
+
+
+# The numeric and date fields whose values are usually queried by ranges
+SORTED_INDEX_FIELDS = ('cmc', 'power_num', 'toughness_num', 'loyalty_num', 'edhrec_rank', 'prices.usd',
+                       'prices.usd_foil', 'prices.eur', 'prices.tix', 'released_at')
+
+# The fields indexed by PCardList.create_index when no fields are given
+DEFAULT_INDEX_FIELDS = ('name', 'set', 'rarity', 'lang', 'layout', 'colors', 'color_identity', 'keywords',
+                        'legalities') + SORTED_INDEX_FIELDS
+
+
+def field_values(card, field):
+    """Returns a list of the values of a given attribute of a card and of each of its faces, leaving out the absent
+    (None) values. Dotted fields like 'prices.usd' give the value of a key of a dictionary attribute."""
+    if '.' in field:
+        name, key = field.split('.', 1)
+        value = getattr(card, name, None)
+        value = value.get(key) if isinstance(value, dict) else None
+        return [] if value is None else [value]
+
+    value = getattr(card, field, None)
+    values = [] if value is None else [value]
+    faces = getattr(card, 'card_faces', None)
+
+    if faces:
+        for face in faces:
+            value = face.get(field)
+            if value is not None:
+                values.append(value)
+
+    return values
+
+
+def normalize_key(value, field=''):
+    """Returns the form in which a value is stored as an index key: strings in lower case, numbers as floats and the
+    prices (which are strings in the Scryfall data) as floats."""
+    if isinstance(value, str):
+        if field.startswith('prices.'):
+            try:
+                return float(value)
+            except ValueError:
+                return None
+        return value.lower()
+    elif isinstance(value, bool):
+        return value
+    elif isinstance(value, (int, float)):
+        return float(value)
+    else:
+        return None
+
+
+def index_keys(card, field):
+    """Returns the set of index keys of a card for a given field. List values give a key for each element and
+    dictionaries like 'legalities' give a key 'key:value' for each item, eg. 'modern:legal'."""
+    keys = set()
+
+    for value in field_values(card, field):
+        if isinstance(value, dict):
+            items = ['{}:{}'.format(key, item) for key, item in value.items()]
+        elif isinstance(value, (list, tuple)):
+            items = value
+        else:
+            items = (value,)
+
+        for item in items:
+            # The legalities of magicthegathering.io cards are lists of dictionaries
+            if isinstance(item, dict):
+                if 'format' not in item or 'legality' not in item:
+                    continue
+                item = '{}:{}'.format(item['format'], item['legality'])
+
+            key = normalize_key(item, field)
+            if key is not None:
+                keys.add(key)
+
+    return keys
+
+
+def _insert(postings, key, docid):
+    # A key of a single card maps straight to its docid, so that unique values like names take no extra records.
+    # Returns True if the key is new.
+    docids = postings.get(key)
+
+    if docids is None:
+        postings[key] = docid
+        return True
+    elif isinstance(docids, int):
+        postings[key] = IITreeSet((docids, docid))
+    else:
+        docids.insert(docid)
+
+    return False
+
+
+def _delete(postings, key, docid):
+    # Returns True if the key was removed
+    docids = postings.get(key)
+
+    if docids is None:
+        return False
+    elif isinstance(docids, int):
+        if docids == docid:
+            del postings[key]
+            return True
+    else:
+        docids.remove(docid)
+
+        if not docids:
+            del postings[key]
+            return True
+
+    return False
+
+
+class PCardIndex(Persistent):
+    """PCardIndex is a persistent index of the cards of a card list by the values of their attributes. Each distinct
+    card of the list gets an integer document id (docid) in the order the cards were added, and for each indexed field
+    the index keeps a BTree of the attribute values mapped to the docids of the cards having them. Finding the cards
+    with a given value or combining the results of several fields with set operations then never needs to touch the
+    cards themselves.
+
+    The values of a field are read from the card and from all of its faces (see field_values) and normalized so that
+    strings are in lower case and numbers are floats (see index_keys). Absent values are not indexed.
+
+    The names of the cards can also be indexed by their trigrams for finding the closest names to a misspelled one
+    (see add_name_grams and closest_names).
+
+    The index is not meant to be used directly. PCardList keeps its index up to date when the list is changed and
+    uses it in 'query'. See PCardList.create_index.
+
+    Args:
+        cards (iterable[PCard]): The cards to index.
+        fields (iterable[str]): The fields to index.
+    """
+
+    # Maps the trigrams of the indexed names to the names (see add_name_grams)
+    _name_grams = None
+
+    def __init__(self, cards=(), fields=()):
+        self._cards = IOBTree()
+        self._docids = OIBTree()
+        self._counts = IIBTree()
+        self._postings = OOBTree()
+        self._keys = OOBTree()
+        self._next_docid = 0
+
+        self.rebuild(cards, fields)
+
+    def __len__(self):
+        return len(self._cards)
+
+    def __contains__(self, field):
+        return field in self._postings
+
+    @property
+    def fields(self):
+        return list(self._postings.keys())
+
+    @property
+    def has_name_grams(self):
+        return self._name_grams is not None
+
+    def rebuild(self, cards, fields=None):
+        """Rebuilds the whole index from the given cards. The docids are given in the order of the cards.
+
+        Args:
+            cards (iterable[PCard]): The cards to index.
+            fields (iterable[str]): The fields to index. By default the currently indexed fields are kept.
+        """
+        fields = self.fields if fields is None else list(fields)
+
+        for tree in (self._cards, self._docids, self._counts, self._postings, self._keys):
+            tree.clear()
+
+        if 'name' not in fields:
+            self._name_grams = None
+
+        docids = {}
+        counts = {}
+        for card in cards:
+            docid = docids.get(card.id)
+
+            if docid is not None:
+                counts[docid] = counts.get(docid, 1) + 1
+            else:
+                docid = docids[self._card_id(card)] = len(docids)
+                self._cards[docid] = card
+
+        self._docids.update(docids)
+        self._counts.update(counts)
+        self._next_docid = len(docids)
+
+        for field in fields:
+            self.add_field(field)
+
+    def add_field(self, field):
+        """Indexes the cards by a new field. An already indexed field is indexed again."""
+        postings = {}
+        keys = {}
+
+        for docid, card in self._cards.items():
+            card_keys = index_keys(card, field)
+
+            if card_keys:
+                keys[docid] = tuple(card_keys)
+
+                for key in card_keys:
+                    postings.setdefault(key, []).append(docid)
+
+        tree = OOBTree()
+        tree.update(dict((key, docids[0] if len(docids) == 1 else IITreeSet(docids))
+                         for key, docids in postings.items()))
+
+        self._postings[field] = tree
+        self._keys[field] = IOBTree(keys)
+
+        if field == 'name' and self._name_grams is not None:
+            self.add_name_grams()
+
+    def remove_field(self, field):
+        """Removes the index of a given field. Removing the names also removes their trigrams."""
+        del self._postings[field]
+        del self._keys[field]
+
+        if field == 'name':
+            self._name_grams = None
+
+    def add_name_grams(self):
+        """Indexes the distinct names of the cards and their faces by their trigrams for 'closest_names'. The names
+        are indexed as the field 'name' which is added if it is not indexed yet. Indexed trigrams are built again."""
+        if 'name' not in self:
+            self.add_field('name')
+
+        grams = {}
+        for name in self._postings['name'].keys():
+            for gram in trigrams(name):
+                grams.setdefault(gram, []).append(name)
+
+        tree = OOBTree()
+        tree.update(dict((gram, OITreeSet(names)) for gram, names in grams.items()))
+        self._name_grams = tree
+
+    def remove_name_grams(self):
+        """Removes the trigrams of the names but keeps the names indexed."""
+        self._name_grams = None
+
+    def closest_names(self, query, k=5, max_distance=None):
+        """Returns the names of the indexed cards and faces closest to a given name (see util.fuzzy.closest). Only
+        the names sharing trigrams with the query are considered.
+
+        Args:
+            query (str): The name to match.
+            k (int): The number of names to return.
+            max_distance (int): The largest edit distance of the returned names. By default there is no limit.
+
+        Returns:
+            list[str]: At most k names as written on the cards, the closest first.
+        """
+        if self._name_grams is None:
+            raise ValueError('The names are not indexed by their trigrams.')
+
+        shared = OIBucket()
+        for gram in trigrams(query):
+            names = self._name_grams.get(gram)
+
+            if names is not None:
+                _, shared = weightedUnion(shared, names)
+
+        return [self._display_name(name) for name in closest(query, dict(shared.items()), k, max_distance)]
+
+    def add(self, card):
+        """Adds a card in the index and returns its docid. A card which is already indexed is only counted again."""
+        docid = self._docids.get(self._card_id(card))
+
+        if docid is not None:
+            self._counts[docid] = self._counts.get(docid, 1) + 1
+            return docid
+
+        docid = self._next_docid
+        self._next_docid += 1
+        self._cards[docid] = card
+        self._docids[card.id] = docid
+
+        for field in self.fields:
+            self._index_card(field, docid, card)
+
+        return docid
+
+    def remove(self, card):
+        """Removes one copy of a card from the index."""
+        docid = self._docids.get(self._card_id(card))
+
+        if docid is None:
+            return
+
+        count = self._counts.get(docid, 1)
+
+        if count > 2:
+            self._counts[docid] = count - 1
+        elif count == 2:
+            del self._counts[docid]
+        else:
+            for field in self.fields:
+                self._unindex_card(field, docid)
+
+            del self._cards[docid]
+            del self._docids[card.id]
+
+    def update(self, card):
+        """Updates the index keys of a card whose attributes have changed. Returns True if any of them changed."""
+        docid = self._docids.get(self._card_id(card))
+
+        if docid is None:
+            return False
+
+        changed = False
+        for field in self.fields:
+            old_keys = self._keys[field].get(docid, ())
+
+            if set(old_keys) != index_keys(card, field):
+                self._unindex_card(field, docid)
+                self._index_card(field, docid, card)
+                changed = True
+
+        return changed
+
+    def clear(self):
+        """Removes all the cards from the index but keeps the indexed fields."""
+        self.rebuild(())
+
+    def docids(self):
+        """Returns the docids of all the indexed cards as an IISet."""
+        return IISet(self._cards.keys())
+
+    def postings(self, field):
+        """Returns the BTree of a given field mapping the index keys to docids. The values are either single docids
+        (ints) or IITreeSets of docids."""
+        return self._postings[field]
+
+    def lookup(self, field, keys):
+        """Returns an IISet of the docids of the cards having any of the given index keys for a field."""
+        postings = self._postings[field]
+        found = []
+
+        for key in keys:
+            try:
+                docids = postings.get(key)
+            except TypeError:
+                # The key is not comparable with the keys of the field, eg. a number in a field of strings
+                docids = None
+
+            if docids is not None:
+                found.append(docids)
+
+        return multiunion(found)
+
+    def key_type(self, field):
+        """Returns the type of the index keys of a field (eg. float or str) or None if the field has no keys."""
+        postings = self._postings[field]
+        return type(postings.minKey()) if postings else None
+
+    def docids_between(self, field, low=None, high=None, exclude_low=False, exclude_high=False):
+        """Returns an IISet of the docids of the cards having an index key between 'low' and 'high' for a field.
+        A bound of None means no bound. Only the keys in the range are visited."""
+        postings = self._postings[field]
+        return multiunion(list(postings.values(low, high, exclude_low, exclude_high)))
+
+    def ordered(self, field, reverse=False, low=None, high=None):
+        """Yields the docids of the cards in the order of their index keys for a field, optionally only those with
+        keys between 'low' and 'high'. A card with several keys (eg. a card whose faces have different values) is
+        yielded at its lowest key, or at its highest key if 'reverse' is enabled. Cards with the same key are
+        yielded in the order of their docids."""
+        items = self._postings[field].items(low, high)
+        seen = set()
+        positions = range(len(items) - 1, -1, -1) if reverse else range(len(items))
+
+        for position in positions:
+            docids = items[position][1]
+
+            for docid in (docids,) if isinstance(docids, int) else docids:
+                if docid not in seen:
+                    seen.add(docid)
+                    yield docid
+
+    def min_key(self, field):
+        """Returns the smallest index key of a field or None if no card has a value for it."""
+        postings = self._postings[field]
+        return postings.minKey() if postings else None
+
+    def max_key(self, field):
+        """Returns the largest index key of a field or None if no card has a value for it."""
+        postings = self._postings[field]
+        return postings.maxKey() if postings else None
+
+    def cards(self, docids):
+        """Yields the cards of the given docids in the order of the docids. Cards which are in the list more than
+        once are yielded as many times."""
+        counts = self._counts
+
+        for docid in docids:
+            card = self._cards[docid]
+
+            for _ in range(counts.get(docid, 1)):
+                yield card
+
+    def _index_card(self, field, docid, card):
+        card_keys = index_keys(card, field)
+
+        if card_keys:
+            postings = self._postings[field]
+            for key in card_keys:
+                if _insert(postings, key, docid) and field == 'name' and self._name_grams is not None:
+                    self._add_name(key)
+            self._keys[field][docid] = tuple(card_keys)
+
+    def _unindex_card(self, field, docid):
+        postings = self._postings[field]
+
+        for key in self._keys[field].pop(docid, ()):
+            if _delete(postings, key, docid) and field == 'name' and self._name_grams is not None:
+                self._remove_name(key)
+
+    def _add_name(self, name):
+        for gram in trigrams(name):
+            names = self._name_grams.get(gram)
+
+            if names is None:
+                self._name_grams[gram] = OITreeSet((name,))
+            else:
+                names.insert(name)
+
+    def _remove_name(self, name):
+        for gram in trigrams(name):
+            names = self._name_grams.get(gram)
+
+            if names is not None:
+                names.remove(name)
+
+                if not names:
+                    del self._name_grams[gram]
+
+    def _display_name(self, name):
+        # The names are indexed in lower case, so the name is looked up from a card having it
+        docids = self._postings['name'][name]
+        card = self._cards[docids if isinstance(docids, int) else docids.minKey()]
+
+        for value in field_values(card, 'name'):
+            if value.lower() == name:
+                return value
+
+        return name
+
+    @staticmethod
+    def _card_id(card):
+        if card.id is None:
+            raise ValueError('Cards without an id can not be indexed.')
+
+        return card.id
@@ -67,75 +67,58 @@
 # Wizards of the Coast.
 ########################################################################################################################
 import datetime
-import json
 import os
-import random
 import re
 import warnings
-import uuid
-import pathlib
 
 from textwrap import dedent
 from itertools import groupby
 from persistent.list import PersistentList
 from persistent import Persistent
 from mtgtools.PCard import PCard
+from mtgtools.PBTreeList import PBTreeList
+from mtgtools.util.cache import QueryCache, query_key, reads_snapshot, snapshot_id
 from BTrees.OOBTree import BTree
 
 
-class PCardList(Persistent):
-    """PCardList is a persistent card list object that mostly acts just like a normal Python list for PCard objects.
-    These lists can be saved in the database just like any other persistent objects. It can optionally be initialized
-    with another list of PCard objects and a name. Additionally, it will also have an attribute 'creation_date' and
-    a unique uuid attribute 'id'. PCardLists are considered equal if they have the same 'id'.
+def _in_range(key, low, high, include_low, include_high):
+    try:
+        if low is not None and (key < low or not include_low and key == low):
+            return False
+        if high is not None and (key > high or not include_high and key == high):
+            return False
+    except TypeError:
+        return False
 
-    Except for the usual list methods like 'extend' and 'append', the PCardList is functional in style, meaning that
-    calling any of the other filtering or querying methods return new PCardList objects leaving the original untouched.
+    return True
 
-    PCardList can also be used as a deck by adding cards to it's 'sideboard' attribute. Having cards in the 'sideboard'
-    changes some functionalities of the methods like 'deck_str' in which now also the sideboard cards are added. Images
-    are downloaded and proxies created for both the cards and the sideboard. However, Having  cards in the 'sideaboard'
-    does not change the behaviour of the crucial internal methods like __len__, __getitem__ or __setitem__,
-    so basically the cards in the 'sideboard' are a kind of an extra.
 
-    args:
-        cards (PCardList, PersistentList[PCard], list[PCard], tuple[PCard]): Initial cards of the card list.
-        sideboard (PCardList, PersistentList[PCard], list[PCard], tuple[PCard]): Initial cards of the sideboard of the
-            card list in case it is supposed to act like a deck.
-        name (str): Name of the card list
-    """
+def _view(cards):
+    from mtgtools.CardListView import CardListView
+    return CardListView.wrap(cards)
 
-    def __init__(self, cards=None, sideboard=None, name=''):
-        if isinstance(cards, PCardList):
-            self._cards = PersistentList(cards.cards)
-        elif isinstance(cards, (list, PersistentList, tuple)):
-            self._cards = PersistentList(cards)
-        elif not cards:
-            self._cards = PersistentList()
-        else:
-            raise TypeError
 
-        if isinstance(sideboard, PCardList):
-            self._sideboard = PersistentList(cards.cards)
-        elif isinstance(sideboard, (list, PersistentList, tuple)):
-            self._sideboard = PersistentList(cards)
-        elif not sideboard:
-            self._sideboard = PersistentList()
-        else:
-            raise TypeError
+class CardListBase:
+    """CardListBase contains the read API shared by the persistent card lists (PCardList) and the lightweight
+    results of their queries (CardListView): iterating, indexing, filtering, querying, grouping and printing the cards.
+    None of these methods change the list. The filtering, querying and grouping methods return their results as
+    CardListView objects, which can be turned into persistent lists with 'persist'.
 
-        self.name = name
-        self.creation_date = datetime.datetime.now()
-        self.id = uuid.uuid4()
+    Subclasses store the cards in '_cards' and provide the 'cards', 'sideboard' and 'name' attributes.
+    """
+
+    __slots__ = ()
+
+    # The attribute index of the cards (PCardIndex) or None if the list is not indexed
+    _index = None
 
     def __getitem__(self, item):
         if isinstance(item, int):
             return self._cards.__getitem__(item)
         else:
-            return PCardList(self.cards.__getitem__(item))
-
-    def __setitem__(self, key, val):
-        self._cards.__setitem__(key, val)
+            # Slicing the PersistentList itself would create another persistent list
+            cards = self._cards.data if isinstance(self._cards, PersistentList) else self._cards
+            return _view(cards.__getitem__(item))
 
     def __iter__(self):
         return iter(self._cards)
@@ -149,14 +132,10 @@ class PCardList(Persistent):
     def __contains__(self, card):
         return self._cards.__contains__(card)
 
-    def __eq__(self, other):
-        if isinstance(other, PCardList):
-            return self.id == other.id
-
     def __add__(self, other):
-        if isinstance(other, PCardList):
+        if isinstance(other, CardListBase):
             return PCardList(self.cards + other.cards)
-        elif isinstance(other, (list, PersistentList, tuple)):
+        elif isinstance(other, (list, PersistentList, PBTreeList, tuple)):
             return PCardList(self.cards + other)
         elif isinstance(other, PCard):
             new_cards = PersistentList(self.cards)
@@ -166,9 +145,9 @@ class PCardList(Persistent):
             raise TypeError
 
     def __radd__(self, other):
-        if isinstance(other, PCardList):
+        if isinstance(other, CardListBase):
             return PCardList(self.cards + other.cards)
-        elif isinstance(other, (list, PersistentList, tuple)):
+        elif isinstance(other, (list, PersistentList, PBTreeList, tuple)):
             return PCardList(self.cards + other)
         elif isinstance(other, PCard):
             new_cards = PersistentList(self.cards)
@@ -178,9 +157,9 @@ class PCardList(Persistent):
             raise TypeError
 
     def __iadd__(self, other):
-        if isinstance(other, PCardList):
+        if isinstance(other, CardListBase):
             return PCardList(self.cards + other.cards)
-        elif isinstance(other, (list, PersistentList, tuple)):
+        elif isinstance(other, (list, PersistentList, PBTreeList, tuple)):
             return PCardList(self.cards + other)
         elif isinstance(other, PCard):
             new_cards = PersistentList(self.cards)
@@ -190,9 +169,9 @@ class PCardList(Persistent):
             raise TypeError
 
     def __sub__(self, other):
-        if isinstance(other, PCardList):
+        if isinstance(other, CardListBase):
             return PCardList([card for card in self.cards if card not in other.cards])
-        elif isinstance(other, (list, PersistentList, tuple)):
+        elif isinstance(other, (list, PersistentList, PBTreeList, tuple)):
             return PCardList([card for card in self.cards if card not in other])
         elif isinstance(other, PCard):
             return PCardList([card for card in self.cards if card is not other])
@@ -220,23 +199,6 @@ class PCardList(Persistent):
     def __len__(self):
         return len(self.cards)
 
-    def append(self, card):
-        """Adds a card object to the end of the list in-place.
-
-        Args:
-            card (PCard): The card object to be appended
-        """
-        self._cards.append(card)
-
-    def insert(self, index, card):
-        """Inserts a card object to a given index in this list in-place
-
-        Args:
-            card (PCard): The card object to be inserted in the given index.
-            index (int): The index to insert the given card object.
-        """
-        self._cards.insert(index, card)
-
     def index(self, card):
         """Returns the index where the given card object is located in the list.
 
@@ -245,66 +207,25 @@ class PCardList(Persistent):
         """
         return self._cards.index(card)
 
-    def clear(self):
-        """Clears te cards in this list."""
-        self._cards.clear()
-
-    def extend(self, cards):
-        """Extends the list with a list of card objects in-place.
-
-        Args:
-            cards (PCardList, list, tuple, PersistentList): A PCardList, PersistentList, list or a tuple of
-                card objects to extend this list with.
-        """
-        if isinstance(cards, PCardList):
-            self._cards.extend(cards.cards)
-        elif isinstance(cards, (list, PersistentList, tuple)):
-            self._cards.extend(cards)
-
-    def remove(self, card):
-        """Removes a given card object from this list in-place.
-
-        Args:
-            card (PCard): A card object to remove from this list.
-        """
-        self._cards.remove(card)
-
-    def pop(self, index):
-        """Removes a card object from a given index from this list in-place.
-
-        Args:
-            index (int): An index to remove a card object from.
-        """
-        return self._cards.pop(index)
-
-    def count(self, card):
+    def count(self, card=None, invert=False, search_all_faces=False, exactly=False, **kwargs):
         """Returns the number of given card objects in this list. Cards are considered same if they have the same id.
+        Without a card, returns the number of cards matching the given keyword arguments like in 'where' (or in
+        'where_exactly' if 'exactly' is enabled) without creating a new list of them.
 
         Args:
             card (PCard): A card object to count.
+            invert (bool): If True, the cards NOT matching the keyword arguments are counted.
+            search_all_faces (bool): If True, all the faces of the cards are searched.
+            exactly (bool): If True, the keyword arguments must match completely like in 'where_exactly'.
+            **kwargs: Arguments to match with the attributes of the cards.
 
         Returns:
             int: The number of given card objects in this list
         """
-        return self._cards.count(card)
-
-    def sort(self, func):
-        """Sorts the cards of this list with a given function in-place. The given function should return some
-        attribute of a card object by which this list is sorted.
-
-        Args:
-            func: A function to sort this list with.
-        """
-        self._cards.sort(key=func)
-
-    def filter(self, func):
-        """Filters the cards of this list with a given function in-place. The new list contains all the cards
-        for which the given function returns True.
+        if card is not None:
+            return self._cards.count(card)
 
-        Args:
-            func: A function to filter with.
-        """
-        self._cards.filter(key=func)
+        return sum(1 for _ in self.iter_where(invert, search_all_faces, exactly, **kwargs))
 
     def sorted(self, func):
         """Returns a new instance of this the list sorted with a given function. The given function should return some
@@ -314,10 +235,10 @@ class PCardList(Persistent):
             func: A function to sort this list with.
 
         Returns:
-            PCardList: A new instance of this list sorted.
+            CardListView: A new instance of this list sorted.
 
         """
-        return PCardList(sorted(self._cards, key=func))
+        return _view(sorted(self._cards, key=func))
 
     def filtered(self, func):
         """Returns a new instance of this the list filtered with a given function. The new list contains all the cards
@@ -327,10 +248,10 @@ class PCardList(Persistent):
             func: A function to filter with.
 
         Returns:
-            PCardList: A new instance of this list filtered.
+            CardListView: A new instance of this list filtered.
 
         """
-        return PCardList(list(filter(func, self._cards)))
+        return _view(list(filter(func, self._cards)))
 
     def where(self, invert=False, search_all_faces=False, **kwargs):
         """Returns a new list of cards for which any of the given keyword arguments match partly or completely with the
@@ -354,34 +275,10 @@ class PCardList(Persistent):
             **kwargs: Arguments to match with the attributes of this list's cards.
 
         Returns:
-            bool: A new list of cards for which the given keyword arguments match partly or completely.
+            CardListView: A new list of cards for which the given keyword arguments match partly or completely.
         """
-        del_keys = []
-
-        for (key, val) in kwargs.items():
-            if val is None:
-                msg = 'Ignoring an empty or null value for keyword {}. Null or empty values are not supported.'
-                warnings.warn(msg.format(key))
-                del_keys.append(key)
-            elif len(self.cards) == 0:
-                msg = 'Searching an empty list.'
-                warnings.warn(msg)
-            elif not hasattr(self.cards[0], key):
-                msg = 'Ignoring an unrecognized keyword {}. Make sure you are using correct api type and spelling.'
-                warnings.warn(msg.format(key))
-                del_keys.append(key)
-            elif key == 'card_faces':
-                msg = 'Ignoring keyword "card_faces". Searching by this keyword is not supported'
-                warnings.warn(msg)
-                del_keys.append(key)
-
-        for key in del_keys:
-            del kwargs[key]
-
-        if not invert:
-            return PCardList([card for card in self if card.matches_any(search_all_faces, **kwargs)])
-        else:
-            return PCardList([card for card in self if not card.matches_any(search_all_faces, **kwargs)])
+        predicate = self._predicate(invert, search_all_faces, False, kwargs)
+        return self._select(predicate, 'where', invert, search_all_faces, kwargs)
 
     def where_exactly(self, invert=False, search_all_faces=False, **kwargs):
         """Returns a new list of cards for which the given keyword arguments match completely with the attributes
@@ -406,8 +303,117 @@ class PCardList(Persistent):
             **kwargs: Arguments to match with the attributes of this list's cards.
 
         Returns:
-            bool: A new list of cards for which the given keyword arguments match completely.
+            CardListView: A new list of cards for which the given keyword arguments match completely.
+        """
+        predicate = self._predicate(invert, search_all_faces, True, kwargs)
+        return self._select(predicate, 'where_exactly', invert, search_all_faces, kwargs)
+
+    def iter_where(self, invert=False, search_all_faces=False, exactly=False, **kwargs):
+        """Returns an iterator over the cards matching the given keyword arguments like in 'where' (or in
+        'where_exactly' if 'exactly' is enabled). The cards are checked only as far as the iterator is consumed, so
+        stopping early skips the rest of the list. For example, the first two red creatures are found with:
+
+            itertools.islice(cards.iter_where(exactly=True, colors=['R'], power='2'), 2)
+
+        Args:
+            invert (bool): If True, the cards NOT matching the keyword arguments are iterated.
+            search_all_faces (bool): If True, all the faces of the cards are searched.
+            exactly (bool): If True, the keyword arguments must match completely like in 'where_exactly'.
+            **kwargs: Arguments to match with the attributes of the cards.
+
+        Returns:
+            generator: The matching cards in the order of this list.
+        """
+        return self._predicate(invert, search_all_faces, exactly, kwargs).filter(self._cards)
+
+    def first(self, invert=False, search_all_faces=False, exactly=False, **kwargs):
+        """Returns the first card matching the given keyword arguments like in 'where' (or in 'where_exactly' if
+        'exactly' is enabled), or None if no card matches. The rest of the list is not checked after a match is found.
+
+        Args:
+            invert (bool): If True, the first card NOT matching the keyword arguments is returned.
+            search_all_faces (bool): If True, all the faces of the cards are searched.
+            exactly (bool): If True, the keyword arguments must match completely like in 'where_exactly'.
+            **kwargs: Arguments to match with the attributes of the cards.
+
+        Returns:
+            PCard: The first matching card or None.
+        """
+        return next(self.iter_where(invert, search_all_faces, exactly, **kwargs), None)
+
+    def exists(self, invert=False, search_all_faces=False, exactly=False, **kwargs):
+        """Returns True if any card matches the given keyword arguments like in 'where' (or in 'where_exactly' if
+        'exactly' is enabled). The rest of the list is not checked after a match is found.
+
+        Args:
+            invert (bool): If True, checks whether any card does NOT match the keyword arguments.
+            search_all_faces (bool): If True, all the faces of the cards are searched.
+            exactly (bool): If True, the keyword arguments must match completely like in 'where_exactly'.
+            **kwargs: Arguments to match with the attributes of the cards.
+
+        Returns:
+            bool: True if a matching card is found, False otherwise.
+        """
+        return self.first(invert, search_all_faces, exactly, **kwargs) is not None
+
+    def limit(self, num, invert=False, search_all_faces=False, exactly=False, **kwargs):
+        """Returns a new list of at most 'num' first cards matching the given keyword arguments like in 'where' (or in
+        'where_exactly' if 'exactly' is enabled). Without keyword arguments, returns the 'num' first cards of this
+        list. The rest of the list is not checked after enough matches are found.
+
+        Args:
+            num (int): The maximum number of cards to return.
+            invert (bool): If True, the cards NOT matching the keyword arguments are returned.
+            search_all_faces (bool): If True, all the faces of the cards are searched.
+            exactly (bool): If True, the keyword arguments must match completely like in 'where_exactly'.
+            **kwargs: Arguments to match with the attributes of the cards.
+
+        Returns:
+            CardListView: A new list of at most 'num' matching cards.
+        """
+        from itertools import islice
+
+        cards = self.iter_where(invert, search_all_faces, exactly, **kwargs) if kwargs else self._cards
+        return _view(list(islice(cards, num)))
+
+    def closest_names(self, query, k=5, max_distance=None):
+        """Returns the names of the cards (and card faces) of this list closest to a given, possibly misspelled, name.
+        The names are compared in lower case and without accents, and ranked by the share of letter trigrams they have
+        in common with the query and then by their edit distance to it (counting also swapped adjacent letters), so
+        both misspelled and partial names are found, eg.
+
+            cards.closest_names('lightening blot', 1) -> ['Lightning Bolt']
+            cards.closest_names('lim dul', 1) -> ['Lim-Dûl the Necromancer']
+
+        If the list has a name index (see PCardList.create_name_index), only the names sharing trigrams with the
+        query are looked at. Otherwise all the names of the list are compared with the query.
+
+        Args:
+            query (str): The name to match.
+            k (int): The number of names to return.
+            max_distance (int): The largest edit distance of the returned names. By default there is no limit.
+
+        Returns:
+            list[str]: At most k names, the closest first.
         """
+        if self._index is not None and self._index.has_name_grams:
+            return self._index.closest_names(query, k, max_distance)
+
+        from mtgtools.PCardIndex import field_values
+        from mtgtools.util.fuzzy import closest, shared_trigrams
+
+        names = {name for card in self._cards for name in field_values(card, 'name')}
+        return closest(query, shared_trigrams(query, names), k, max_distance)
+
+    def _predicate(self, invert, search_all_faces, exactly, kwargs):
+        from mtgtools.CardQuery import Attributes
+
+        kwargs = self._search_arguments(kwargs, 'with' if exactly else 'by')
+        predicate = Attributes(exactly, search_all_faces, **kwargs)
+        return ~predicate if invert else predicate
+
+    def _search_arguments(self, kwargs, preposition):
+        # Drops the search arguments which are not supported with a warning
         del_keys = []
 
         for (key, val) in kwargs.items():
@@ -418,22 +424,35 @@ class PCardList(Persistent):
             elif len(self.cards) == 0:
                 msg = 'Searching an empty list.'
                 warnings.warn(msg)
-            elif not hasattr(self.cards[0], key):
+            elif not self.cards[0].has_field(key):
                 msg = 'Ignoring an unrecognized keyword {}. Make sure you are using correct api type and spelling.'
                 warnings.warn(msg.format(key))
                 del_keys.append(key)
             elif key == 'card_faces':
-                msg = 'Ignoring keyword "card_faces". Searching with this keyword is not supported'
-                warnings.warn(msg)
+                msg = 'Ignoring keyword "card_faces". Searching {} this keyword is not supported'
+                warnings.warn(msg.format(preposition))
                 del_keys.append(key)
 
         for key in del_keys:
             del kwargs[key]
 
-        if not invert:
-            return PCardList([card for card in self if card.matches_all(search_all_faces, **kwargs)])
+        return kwargs
+
+    def _select(self, predicate, *key):
+        return _view(self._cached_cards(lambda: list(predicate.filter(self._cards)), *key))
+
+    def _cached_cards(self, compute, *key):
+        # Returns the list of cards computed by 'compute'. PCardList caches the lists of the queries with a key if its
+        # query cache is enabled (see PCardList.set_query_cache).
+        return compute()
+
+    def _type_predicate(self, type_name, mtgio_type=None):
+        from mtgtools.CardQuery import Attributes
+
+        if self.api_type == 'scryfall':
+            return Attributes(type_line=type_name)
         else:
-            return PCardList([card for card in self if not card.matches_all(search_all_faces, **kwargs)])
+            return Attributes(type=[type_name] if mtgio_type is None else mtgio_type)
 
     def has_all(self, cards):
         """Returns true if this list contains all the given cards.
@@ -466,15 +485,17 @@ class PCardList(Persistent):
             duplicates (bool): If True, duplicate values are allowed in the sample
 
         Returns:
-            PCardList: A new list of cards randomly chosen from this list.
+            CardListView: A new list of cards randomly chosen from this list.
         """
+        import random
+
         if duplicates:
-            return PCardList([random.choice(self.cards) for _ in range(num)])
+            return _view([random.choice(self.cards) for _ in range(num)])
         else:
             try:
-                return PCardList(random.sample(self.cards, num))
+                return _view(random.sample(self.cards, num))
             except ValueError:
-                return PCardList([random.choice(self.cards) for _ in range(num)])
+                return _view([random.choice(self.cards) for _ in range(num)])
 
     def random_card(self):
         """Returns a random card object from this list.
@@ -482,6 +503,8 @@ class PCardList(Persistent):
         Returns:
             PCard: A random card from this list.
         """
+        import random
+
         return random.choice(self.cards)
 
     def random_pack(self, num_of_commons=11, num_of_uncommons=3, num_of_rares=1):
@@ -498,22 +521,28 @@ class PCardList(Persistent):
         Returns:
             PCardList: A new list of cards corresponding a booster (or similar) pack
         """
+        import random
+
         random_commons = self.where_exactly(rarity='common').random_sample(num_of_commons)
         random_uncommons = self.where_exactly(rarity='uncommon').random_sample(num_of_uncommons)
         random_rares = PCardList()
 
-        if self.where_exactly(rarity='mythic rare'):
+        if self.exists(exactly=True, rarity='mythic rare'):
+            mythics, rares = self.where_exactly(rarity='mythic rare'), self.where_exactly(rarity='rare')
+
             for _ in range(num_of_rares):
                 if random.randint(0, 7) == 0:
-                    random_rares.extend(self.where_exactly(rarity='mythic rare').random_sample(1))
+                    random_rares.extend(mythics.random_sample(1))
                 else:
-                    random_rares.extend(self.where_exactly(rarity='rare').random_sample(1))
-        elif self.where_exactly(rarity='mythic'):
+                    random_rares.extend(rares.random_sample(1))
+        elif self.exists(exactly=True, rarity='mythic'):
+            mythics, rares = self.where(rarity='mythic'), self.where(rarity='rare')
+
             for _ in range(num_of_rares):
                 if random.randint(0, 7) == 0:
-                    random_rares.extend(self.where(rarity='mythic').random_sample(1))
+                    random_rares.extend(mythics.random_sample(1))
                 else:
-                    random_rares.extend(self.where(rarity='rare').random_sample(1))
+                    random_rares.extend(rares.random_sample(1))
         else:
             random_rares.extend(self.where(rarity='rare').random_sample(num_of_rares))
 
@@ -524,7 +553,7 @@ class PCardList(Persistent):
         this list. For magicthegathering.io api removes also cards which are backsides or flipsides of normal cards.
 
         Returns:
-            PCardList: A new list of cards with all the special non-playable cards removed.
+            CardListView: A new list of cards with all the special non-playable cards removed.
         """
         if self.api_type == 'scryfall':
             non_playable_layouts = ['vanguard', 'scheme', 'planar', 'emblem', 'token', 'double_faced_token']
@@ -541,118 +570,91 @@ class PCardList(Persistent):
         multiples of cards with the same names are removed leaving only single copies of cards in the new list.
 
         Returns:
-            PCardList: A new list of cards containing only singles of cards with with unique names.
+            CardListView: A new list of cards containing only singles of cards with with unique names.
         """
         temp = set()
-        return PCardList([card for card in self.cards if card.name not in temp and (temp.add(card.name) or True)])
+        return _view([card for card in self.cards if card.name not in temp and (temp.add(card.name) or True)])
 
     def unique_cards(self):
         """Returns a new list of cards containing only singles of each card object of this list. In other words all the
         multiples of the same card object are removed leaving only single copies of cards in the new list.
 
         Returns:
-            PCardList: A new list of cards containing only singles cards.
+            CardListView: A new list of cards containing only singles cards.
         """
-        return PCardList(list(set(self.cards)))
+        return _view(list(set(self.cards)))
 
     def creatures(self):
         """Returns a new list which only contains the creatures of this list.
 
         Returns:
-            PCardList: A new list of cards containing only the creature cards.
+            CardListView: A new list of cards containing only the creature cards.
         """
-        if self.api_type == 'scryfall':
-            return self.where(type_line='creature')
-        else:
-            return self.where(type=['creature'])
+        return self._select(self._type_predicate('creature'))
 
     def artifacts(self):
         """Returns a new list which only contains the artifacts of this list.
 
         Returns:
-            PCardList: A new list of cards containing only the artifact cards.
+            CardListView: A new list of cards containing only the artifact cards.
         """
-        if self.api_type == 'scryfall':
-            return self.where(type_line='artifact')
-        else:
-            return self.where(type=['artifact'])
+        return self._select(self._type_predicate('artifact'))
 
     def instants(self):
         """Returns a new list which only contains the instants of this list.
 
         Returns:
-            PCardList: A new list of cards containing only the instant cards.
+            CardListView: A new list of cards containing only the instant cards.
         """
-        if self.api_type == 'scryfall':
-            return self.where(type_line='instant')
-        else:
-            return self.where(type=['instant'])
+        return self._select(self._type_predicate('instant'))
 
     def sorceries(self):
         """Returns a new list which only contains the sorceries of this list.
 
         Returns:
-            PCardList: A new list of cards containing only the sorcery cards.
+            CardListView: A new list of cards containing only the sorcery cards.
         """
-        if self.api_type == 'scryfall':
-            return self.where(type_line='sorcery')
-        else:
-            return self.where(type=['sorcery'])
+        return self._select(self._type_predicate('sorcery'))
 
     def planeswalkers(self):
         """Returns a new list which only contains the planeswalkers of this list.
 
         Returns:
-            PCardList: A new list of cards containing only the planeswalker cards.
+            CardListView: A new list of cards containing only the planeswalker cards.
         """
-        if self.api_type == 'scryfall':
-            return self.where(type_line='planeswalker')
-        else:
-            return self.where(type=['planeswalker'])
+        return self._select(self._type_predicate('planeswalker'))
 
     def enchantments(self):
         """Returns a new list which only contains the enchantments of this list.
 
         Returns:
-            PCardList: A new list of cards containing only the enchantment cards.
+            CardListView: A new list of cards containing only the enchantment cards.
         """
-        if self.api_type == 'scryfall':
-            return self.where(type_line='enchantment')
-        else:
-            return self.where(type=['enchantment'])
+        return self._select(self._type_predicate('enchantment'))
 
     def noncreatures(self):
         """Returns a new list which only contains the noncreatures of this list.
 
         Returns:
-            PCardList: A new list of cards containing only the noncreature cards.
+            CardListView: A new list of cards containing only the noncreature cards.
         """
-        if self.api_type == 'scryfall':
-            return self.where(type_line='creature', invert=True)
-        else:
-            return self.where(type=['creature'], invert=True)
+        return self._select(~self._type_predicate('creature'))
 
     def lands(self):
         """Returns a new list which only contains the lands of this list.
 
         Returns:
-            PCardList: A new list of cards containing only the land cards.
+            CardListView: A new list of cards containing only the land cards.
         """
-        if self.api_type == 'scryfall':
-            return self.where(type_line='land')
-        else:
-            return self.where(type='land')
+        return self._select(self._type_predicate('land', 'land'))
 
     def basic_lands(self):
         """Returns a new list which only contains the basic lands of this list.
 
         Returns:
-            PCardList: A new list of cards containing only the basic land cards.
+            CardListView: A new list of cards containing only the basic land cards.
         """
-        if self.api_type == 'scryfall':
-            return self.where(type_line='basic land')
-        else:
-            return self.where(type='basic land')
+        return self._select(self._type_predicate('basic land', 'basic land'))
 
     def converted_mana_cost(self):
         """Returns the converted mana cost of the list.
@@ -707,7 +709,7 @@ class PCardList(Persistent):
             dict: A dictionary containing the cards grouped by their converted mana costs.
         """
         sorted_cards = self.sorted(lambda card: card.cmc)
-        return dict((k, PCardList(list(v))) for k, v in groupby(sorted_cards, key=lambda card: card.cmc))
+        return dict((k, _view(list(v))) for k, v in groupby(sorted_cards, key=lambda card: card.cmc))
 
     def grouped_by_simple_type(self):
         """Returns a dictionary containing the cards of this list grouped by their types in a simple way.
@@ -722,11 +724,19 @@ class PCardList(Persistent):
         Returns:
             dict: A dictionary containing the cards grouped by simple types.
         """
-        creatures = self.creatures()
-        lands = self.lands() - creatures
-        noncreatures = self.noncreatures() - lands
+        is_creature = self._type_predicate('creature').matches
+        is_land = self._type_predicate('land', 'land').matches
+        groups = {'creatures': [], 'lands': [], 'noncreatures': []}
+
+        for card in self._cards:
+            if is_creature(card):
+                groups['creatures'].append(card)
+            elif is_land(card):
+                groups['lands'].append(card)
+            else:
+                groups['noncreatures'].append(card)
 
-        return {'creatures': creatures, 'lands': lands, 'noncreatures': noncreatures}
+        return dict((group, _view(group_cards)) for group, group_cards in groups.items())
 
     def grouped_by_type(self):
         """Returns a dictionary containing the cards of this list grouped by their types.
@@ -747,16 +757,25 @@ class PCardList(Persistent):
         Returns:
             dict: A dictionary containing the cards grouped by simple types.
         """
-        creatures = self.creatures()
-        lands = self.lands() - creatures
-        enchantments = self.enchantments() - creatures - lands
-        artifacts = self.artifacts() - creatures - lands - enchantments
-        instants = self.instants()
-        sorceries = self.sorceries()
-        planeswalkers = self.planeswalkers()
-
-        return {'creatures': creatures, 'lands': lands, 'enchantments': enchantments, 'artifacts': artifacts,
-                'instants': instants, 'sorceries': sorceries, 'planeswalkers': planeswalkers}
+        # The first four groups are exclusive in this order of priority and the rest are not
+        exclusive = [(group, self._type_predicate(type_name, mtgio_type).matches) for group, type_name, mtgio_type in
+                     (('creatures', 'creature', None), ('lands', 'land', 'land'),
+                      ('enchantments', 'enchantment', None), ('artifacts', 'artifact', None))]
+        others = [(group, self._type_predicate(type_name).matches) for group, type_name in
+                  (('instants', 'instant'), ('sorceries', 'sorcery'), ('planeswalkers', 'planeswalker'))]
+        groups = dict((group, []) for group, _ in exclusive + others)
+
+        for card in self._cards:
+            for group, matches in exclusive:
+                if matches(card):
+                    groups[group].append(card)
+                    break
+
+            for group, matches in others:
+                if matches(card):
+                    groups[group].append(card)
+
+        return dict((group, _view(group_cards)) for group, group_cards in groups.items())
 
     def grouped_by_color_identity(self):
         """Returns a dictionary containing the cards of this list grouped by their color identities.
@@ -771,7 +790,7 @@ class PCardList(Persistent):
         sorted_cards = self.sorted(lambda card: card.color_identity)
         grouper = groupby(sorted_cards, key=lambda card: re.sub("[],'[ ]", "", str(sorted(card.color_identity))))
 
-        return dict((k, PCardList(list(v))) for k, v in grouper)
+        return dict((k, _view(list(v))) for k, v in grouper)
 
     def grouped_by_color(self):
         """Returns a dictionary containing the cards of this list grouped by their colors.
@@ -794,7 +813,7 @@ class PCardList(Persistent):
 
         grouper = groupby(self.sorted(get_color), key=get_color)
 
-        return dict((k, PCardList(list(v))) for k, v in grouper)
+        return dict((k, _view(list(v))) for k, v in grouper)
 
     def grouped_by_id(self):
         """Returns a dictionary containing the cards of this list grouped by their unique id's.
@@ -806,7 +825,7 @@ class PCardList(Persistent):
             dict: A dictionary containing cards grouped by their unique id's.
         """
         sorted_cards = self.sorted(lambda card: card.id)
-        return dict((k, PCardList(list(v))) for k, v in groupby(sorted_cards, key=lambda card: card.id))
+        return dict((k, _view(list(v))) for k, v in groupby(sorted_cards, key=lambda card: card.id))
 
     def deck_str(self, group_by='type', add_set_codes=True):
         """Returns a string of the cards in this list in a readable deck form. Optionally the set code of the cards can
@@ -916,7 +935,7 @@ class PCardList(Persistent):
             if group_by != 'none':
                 deck += '// {} ({})\n'.format('Sideboard', len(self.sideboard))
 
-            for cards in PCardList(self.sideboard).grouped_by_id().values():
+            for cards in _view(list(self.sideboard)).grouped_by_id().values():
                 if add_set_codes:
                     deck += 'SB: {} {} [{}]\n'.format(len(cards), cards[0].name, cards[0].set)
                 else:
@@ -1018,7 +1037,7 @@ class PCardList(Persistent):
         if self.sideboard:
             pp_str += '\nSideboard:\n'
 
-            for cards in PCardList(self.sideboard).grouped_by_id().values():
+            for cards in _view(list(self.sideboard)).grouped_by_id().values():
                 card = cards[0]
                 num = len(cards)
 
@@ -1107,7 +1126,9 @@ class PCardList(Persistent):
         except ImportError:
             print('The Pillow-image library is needed for creating printable proxies. Make sure you have it installed!')
             return
-        
+
+        import pathlib
+
         path = pathlib.Path(dir_path)
 
         try:
@@ -1149,7 +1170,7 @@ class PCardList(Persistent):
                       quality=quality, 
                       dpi=(300, 300))
 
-    def from_str(self, card_list_str, **kwargs):
+    def from_str(self, card_list_str, fuzzy=False, **kwargs):
         """Reads a given card list string and returns a new list of all the cards of this list found in the string.
 
         The string should be given in the following format:
@@ -1179,6 +1200,11 @@ class PCardList(Persistent):
         Additionally, you can include any card-specific keyword arguments such as lang='en' which will only return
         those matching cards.
 
+        If 'fuzzy' is enabled, a card name which is not found is replaced with the closest name of this list (see
+        closest_names) differing from it by at most a quarter of its letters (but at least by two), and a warning
+        tells which name was used. Creating a name index first (see create_name_index) makes this fast for large
+        lists.
+
         eg.
         --------------------------------------
         //Creatures (8)
@@ -1196,6 +1222,7 @@ class PCardList(Persistent):
 
         Args:
             card_list_str (str): A string representing a list of cards.
+            fuzzy (bool): If True, misspelled card names are replaced with the closest matching names.
             **kwargs: Arguments to match with the attributes of every card in the list (see the documentation of where).
 
         Returns:
@@ -1228,42 +1255,50 @@ class PCardList(Persistent):
                     set_code = cl.split()[0] if len(cl.split()) > 0 else None
                     collector_number = cl.split()[1] if len(cl.split()) > 1 else None
                 else:
-                    set_code = None
+                    set_code = collector_number = None
 
                 if set_code and set_code not in set_codes:
                     msg = 'Could not find any matching {} API set code for the line --{}--'
                     warnings.warn(msg.format(self.api_type, line))
                     set_code = None
 
-                try:
-                    if set_code:
-                        if collector_number:
-                            card = self.where_exactly(name=name,
-                                                      set=set_code,
-                                                      search_all_faces=True,
-                                                      collector_number=collector_number,
-                                                      **kwargs)[0]
-                        else:
-                            card = self.where_exactly(name=name, set=set_code, search_all_faces=True, **kwargs)[0]
-                    else:
-                        card = self.where_exactly(name=name, search_all_faces=True, **kwargs).random_card()
+                card = self._find_card(name, set_code, collector_number, kwargs)
 
-                    if sb:
-                        card_list.sideboard.extend([card for _ in range(num)])
-                    else:
-                        card_list.extend(num * (PCardList() + card))
+                if card is None and fuzzy:
+                    closest_names = self.closest_names(name, 1, max(2, len(name) // 4))
 
-                except IndexError:
+                    if closest_names and closest_names[0].lower() != name.lower():
+                        card = self._find_card(closest_names[0], set_code, collector_number, kwargs)
+
+                        if card is not None:
+                            msg = 'Could not find the card name --{}-- on the line --{}--, using --{}-- instead'
+                            warnings.warn(msg.format(name, line, closest_names[0]))
+
+                if card is None:
                     msg = """
                     Could not find any cards matching the line --{}-- with given keyword arguments --{}--.
                     This could possibly be because of a typo, the card doesn't exist in the given set or 
                     because there are no cards matching the given keyword arguments or collector number if any were specified
                     """
                     warnings.warn(dedent(msg.format(line, list(kwargs.items()))))
+                elif sb:
+                    card_list.sideboard.extend([card for _ in range(num)])
+                else:
+                    card_list.extend([card for _ in range(num)])
 
         return card_list
 
-    def from_file(self, file_path, **kwargs):
+    def _find_card(self, name, set_code, collector_number, kwargs):
+        if set_code and collector_number:
+            return self.first(search_all_faces=True, exactly=True, name=name, set=set_code,
+                              collector_number=collector_number, **kwargs)
+        elif set_code:
+            return self.first(search_all_faces=True, exactly=True, name=name, set=set_code, **kwargs)
+        else:
+            matches = self.where_exactly(name=name, search_all_faces=True, **kwargs)
+            return matches.random_card() if matches else None
+
+    def from_file(self, file_path, fuzzy=False, **kwargs):
         """Reads a card list string from a given text file and returns a new list of all the cards of this list
         found in the file.
 
@@ -1311,6 +1346,7 @@ class PCardList(Persistent):
 
         Args:
             file_path (str): A path to the file containing a list of cards to read.
+            fuzzy (bool): If True, misspelled card names are replaced with the closest matching names (see from_str).
             **kwargs: Arguments to match with the attributes of every card in the list (see the documentation of where).
 
         Returns:
@@ -1319,7 +1355,7 @@ class PCardList(Persistent):
 
         try:
             with open(file_path, 'r') as f:
-                return self.from_str(f.read(), **kwargs)
+                return self.from_str(f.read(), fuzzy, **kwargs)
 
         except (IOError, FileNotFoundError):
             print('Something went wrong with reading file {}'.format(file_path))
@@ -1383,6 +1419,32 @@ class PCardList(Persistent):
         except (FileExistsError, IOError) as err:
             print('Something went wrong with writing to the file: {}'.format(str(err)))
 
+    def to_ndjson(self, file, fields=None, compress=None, chunk_size=1000, compresslevel=6):
+        """Writes the cards of this list as newline-delimited json, one card per line, to a file or a file-like
+        object. Unlike 'json', the cards are encoded and written in chunks, so exporting even the whole card database
+        runs in constant memory. The cards loaded from a database are released from the object cache between the
+        chunks. The sideboard is not included.
+
+        The output is gzip-compressed if 'compress' is enabled or, by default, if the file path ends with '.gz'.
+        File-like objects must be binary when compressing. The exported cards can be loaded in a database with
+        MtgDB.bulk_load.
+
+        Args:
+            file: A path to the file to write (an existing file is overwritten) or a file-like object.
+            fields (list[str]): The attributes of the cards to export. By default all the present attributes are
+                exported and the absent (None) ones left out.
+            compress (bool): If enabled, the output is gzip-compressed.
+            chunk_size (int): The number of cards encoded and written at a time.
+            compresslevel (int): The gzip compression level from 1 (fastest) to 9 (smallest).
+
+        Returns:
+            int: The number of cards written.
+        """
+        from .util.export import write_cards
+
+        return write_cards(self.cards, file, fields=fields, compress=compress, chunk_size=chunk_size,
+                           compresslevel=compresslevel)
+
     def create_id_index(self):
         """Creates and returns a fast persistent index of the unique cards of this list as a BTree which works
         quite like a normal Python dict. Cards are indexed by their unique 'id' values and each id maps to a single
@@ -1394,6 +1456,164 @@ class PCardList(Persistent):
         sorted_cards = self.sorted(lambda card: card.id)
         return BTree(dict((k, list(v)[0]) for k, v in groupby(sorted_cards, key=lambda card: card.id)))
 
+    @property
+    def indexed_fields(self):
+        """The card attributes this list is indexed by (see 'create_index')."""
+        return [] if self._index is None else self._index.fields
+
+    def query(self, query):
+        """Returns a new list of the cards of this list matching a search query written in a syntax similar to the
+        one of Scryfall, eg.
+
+            cards.query('t:creature c>=rg cmc<=3 o:"draw a card" r:mythic -is:digital')
+
+        The query is compiled into a plan which uses the index of this list (see 'create_index') for the indexed
+        attributes and checks the remaining conditions in a single pass over the candidate cards. See CardQuery for
+        the syntax. Cards are returned in the order of the list, except that with an index multiple copies of a card
+        are returned next to each other. Predicates composed with &, | and ~ are accepted as well, eg.
+
+            cards.query(Attributes(colors='R') & ~Attributes(type_line='creature'))
+
+        Args:
+            query (str, CardQuery, Predicate): The query.
+
+        Returns:
+            CardListView: A new list of the matching cards.
+        """
+        from mtgtools.CardQuery import CardQuery
+
+        if isinstance(query, str):
+            return _view(self._cached_cards(lambda: list(CardQuery(query).iterate(self)), 'query', query))
+        elif not isinstance(query, CardQuery):
+            query = CardQuery(query)
+
+        return _view(list(query.iterate(self)))
+
+    def in_range(self, field, low=None, high=None, include_low=True, include_high=True):
+        """Returns a new list of the cards whose value of a given attribute is between 'low' and 'high'. Either
+        bound can be left out. Dotted fields like 'prices.usd' compare a key of a dictionary attribute, and the prices
+        are compared as numbers. For example:
+
+            cards.in_range('cmc', 2, 4)
+            cards.in_range('prices.usd', high=1, include_high=False)
+            cards.in_range('released_at', '2019-01-01')
+
+        If the attribute is indexed (see 'create_index'), only the cards in the range are visited. Otherwise every
+        card is checked. The values of all the faces of the cards are compared and strings are compared in lower
+        case.
+
+        Args:
+            field (str): The card attribute.
+            low: The lower bound or None.
+            high: The upper bound or None.
+            include_low (bool): If enabled, cards with the value 'low' are included.
+            include_high (bool): If enabled, cards with the value 'high' are included.
+
+        Returns:
+            CardListView: A new list of the cards in the range in the order of this list.
+        """
+        from mtgtools.PCardIndex import normalize_key, index_keys
+
+        low = None if low is None else normalize_key(low, field)
+        high = None if high is None else normalize_key(high, field)
+
+        if self._has_sorted_index(field, low, high):
+            docids = self._index.docids_between(field, low, high, not include_low, not include_high)
+            return _view(list(self._index.cards(docids)))
+
+        return _view([card for card in self._cards
+                      if any(_in_range(key, low, high, include_low, include_high) for key in index_keys(card, field))])
+
+    def min_value(self, field):
+        """Returns the smallest value of a given attribute among the cards of this list, or None if no card has a
+        value for it. Strings are returned in lower case and numbers as floats. With an index on the attribute this
+        takes a single BTree lookup.
+
+        Args:
+            field (str): The card attribute, eg. 'cmc' or 'prices.usd'.
+        """
+        return self._extreme_value(field, False)
+
+    def max_value(self, field):
+        """Returns the largest value of a given attribute among the cards of this list, or None if no card has a
+        value for it. See 'min_value'.
+
+        Args:
+            field (str): The card attribute, eg. 'edhrec_rank' or 'released_at'.
+        """
+        return self._extreme_value(field, True)
+
+    def ordered_by(self, field, reverse=False, low=None, high=None):
+        """Yields the cards of this list in the order of a given attribute, optionally only those with values
+        between 'low' and 'high' (inclusive). Cards without a value are left out. With an index on the attribute
+        the cards are read from the index in order, so taking the first few cards costs only as much, eg. the
+        cheapest cards:
+
+            itertools.islice(cards.ordered_by('prices.usd'), 10)
+
+        Cards with several values (eg. different values on their faces) come at their lowest value, or at their
+        highest value if 'reverse' is enabled. Cards with the same value keep the order of this list, except that with
+        an index multiple copies of a card come next to each other.
+
+        Args:
+            field (str): The card attribute.
+            reverse (bool): If enabled, the cards are yielded from the largest value to the smallest.
+            low: The smallest value included or None.
+            high: The largest value included or None.
+
+        Returns:
+            generator: The cards in order.
+        """
+        from mtgtools.PCardIndex import normalize_key, index_keys
+
+        low = None if low is None else normalize_key(low, field)
+        high = None if high is None else normalize_key(high, field)
+
+        if self._has_sorted_index(field, low, high):
+            yield from self._index.cards(self._index.ordered(field, reverse, low, high))
+            return
+
+        keyed = []
+        for card in self._cards:
+            keys = [key for key in index_keys(card, field) if _in_range(key, low, high, True, True)]
+
+            if keys:
+                keyed.append(((max if reverse else min)(keys), card))
+
+        for _, card in sorted(keyed, key=lambda item: item[0], reverse=reverse):
+            yield card
+
+    def _has_sorted_index(self, field, *bounds):
+        if self._index is None or field not in self._index:
+            return False
+
+        key_type = self._index.key_type(field)
+        return all(key_type is None or bound is None or type(bound) is key_type for bound in bounds)
+
+    def _extreme_value(self, field, largest):
+        from mtgtools.PCardIndex import index_keys
+
+        if self._has_sorted_index(field):
+            return self._index.max_key(field) if largest else self._index.min_key(field)
+
+        keys = [key for card in self._cards for key in index_keys(card, field)]
+
+        try:
+            return (max if largest else min)(keys) if keys else None
+        except TypeError:
+            raise TypeError('The values of {} can not be compared with each other.'.format(field))
+
+    def counted(self):
+        """Returns a new PCountedList of the cards of this list and its sideboard. The counted list stores each card
+        only once together with its counts, which makes it a much more compact and faster representation for decks
+        and collections with many copies of the same cards.
+
+        Returns:
+            PCountedList: A new counted list of the cards of this list.
+        """
+        from mtgtools.PCountedList import PCountedList
+        return PCountedList(self, name=self.name)
+
     @property
     def api_type(self):
         try:
@@ -1403,7 +1623,364 @@ class PCardList(Persistent):
 
     @property
     def json(self):
-        return json.dumps({'cards': [card.__dict__ for card in self.cards]}, sort_keys=True, indent=4)
+        import json
+
+        return json.dumps({'cards': [card.as_dict() for card in self.cards]}, sort_keys=True, indent=4)
+
+
+class PCardList(CardListBase, Persistent):
+    """PCardList is a persistent card list object that mostly acts just like a normal Python list for PCard objects.
+    These lists can be saved in the database just like any other persistent objects. It can optionally be initialized
+    with another list of PCard objects and a name. Additionally, it will also have an attribute 'creation_date' and
+    a unique uuid attribute 'id'. PCardLists are considered equal if they have the same 'id'.
+
+    Except for the usual list methods like 'extend' and 'append', the PCardList is functional in style, meaning that
+    calling any of the other filtering or querying methods return new lists leaving the original untouched. These
+    results are lightweight non-persistent CardListView objects with the same read API (see CardListBase). A result
+    can be saved in the database by turning it into a new PCardList with 'persist' (or simply with 'PCardList(view)'),
+    while adding and multiplying lists still creates new PCardList objects.
+
+    PCardList can also be used as a deck by adding cards to it's 'sideboard' attribute. Having cards in the 'sideboard'
+    changes some functionalities of the methods like 'deck_str' in which now also the sideboard cards are added. Images
+    are downloaded and proxies created for both the cards and the sideboard. However, Having  cards in the 'sideaboard'
+    does not change the behaviour of the crucial internal methods like __len__, __getitem__ or __setitem__,
+    so basically the cards in the 'sideboard' are a kind of an extra.
+
+    By default the cards are stored in a single PersistentList which is saved as a whole every time the list is
+    changed. Very large lists which are modified a little at a time, like the whole card database, can be created with
+    'btree=True' to store the cards in the buckets of a BTree (PBTreeList) instead. Then adding or removing a card
+    only saves the small bucket it is stored in. The storage of an existing list can be changed with 'use_btree_storage'.
+
+    Large lists can also be indexed by card attributes with 'create_index' (see PCardIndex). The index is kept up to
+    date when the list is changed, and 'query' uses it to answer Scryfall-like search queries (see CardQuery) without
+    checking every card. Lists which are queried over and over with the same arguments can cache the results of
+    their queries with 'set_query_cache'.
+
+    args:
+        cards (PCardList, CardListView, PersistentList[PCard], list[PCard], tuple[PCard]): Initial cards of the card
+            list.
+        sideboard (PCardList, CardListView, PersistentList[PCard], list[PCard], tuple[PCard]): Initial cards of the
+            sideboard of the card list in case it is supposed to act like a deck.
+        name (str): Name of the card list
+        btree (bool): If True, the cards are stored in the buckets of a BTree instead of a single PersistentList.
+    """
+
+    # The limits (max_entries, max_cards) of the query cache or None if query results are not cached
+    _query_cache_limits = None
+
+    # The query cache (QueryCache) of this object in memory, which is never saved
+    _v_query_cache = None
+
+    def __init__(self, cards=None, sideboard=None, name='', btree=False):
+        import uuid
+
+        list_type = PBTreeList if btree else PersistentList
+
+        if isinstance(cards, CardListBase):
+            self._cards = list_type(cards.cards)
+        elif isinstance(cards, (list, PersistentList, PBTreeList, tuple)):
+            self._cards = list_type(cards)
+        elif not cards:
+            self._cards = list_type()
+        else:
+            raise TypeError
+
+        if isinstance(sideboard, CardListBase):
+            self._sideboard = PersistentList(sideboard.cards)
+        elif isinstance(sideboard, (list, PersistentList, PBTreeList, tuple)):
+            self._sideboard = PersistentList(sideboard)
+        elif not sideboard:
+            self._sideboard = PersistentList()
+        else:
+            raise TypeError
+
+        self.name = name
+        self.creation_date = datetime.datetime.now()
+        self.id = uuid.uuid4()
+
+    def __setitem__(self, key, val):
+        self._cards.__setitem__(key, val)
+        self._clear_query_cache()
+
+        if self._index is not None:
+            self._index.rebuild(self._cards)
+
+    def __eq__(self, other):
+        if isinstance(other, PCardList):
+            return self.id == other.id
+
+    def append(self, card):
+        """Adds a card object to the end of the list in-place.
+
+        Args:
+            card (PCard): The card object to be appended
+        """
+        self._cards.append(card)
+        self._clear_query_cache()
+
+        if self._index is not None:
+            self._index.add(card)
+
+    def insert(self, index, card):
+        """Inserts a card object to a given index in this list in-place
+
+        Args:
+            card (PCard): The card object to be inserted in the given index.
+            index (int): The index to insert the given card object.
+        """
+        self._cards.insert(index, card)
+        self._clear_query_cache()
+
+        if self._index is not None:
+            self._index.rebuild(self._cards)
+
+    def clear(self):
+        """Clears te cards in this list."""
+        self._cards.clear()
+        self._clear_query_cache()
+
+        if self._index is not None:
+            self._index.clear()
+
+    def extend(self, cards):
+        """Extends the list with a list of card objects in-place.
+
+        Args:
+            cards (PCardList, list, tuple, PersistentList): A PCardList, PersistentList, list or a tuple of
+                card objects to extend this list with.
+        """
+        if isinstance(cards, CardListBase):
+            cards = cards.cards
+        elif not isinstance(cards, (list, PersistentList, PBTreeList, tuple)):
+            return
+
+        self._cards.extend(cards)
+        self._clear_query_cache()
+
+        if self._index is not None:
+            for card in cards:
+                self._index.add(card)
+
+    def remove(self, card):
+        """Removes a given card object from this list in-place.
+
+        Args:
+            card (PCard): A card object to remove from this list.
+        """
+        self._cards.remove(card)
+        self._clear_query_cache()
+
+        if self._index is not None:
+            self._index.remove(card)
+
+    def pop(self, index):
+        """Removes a card object from a given index from this list in-place.
+
+        Args:
+            index (int): An index to remove a card object from.
+        """
+        card = self._cards.pop(index)
+        self._clear_query_cache()
+
+        if self._index is not None:
+            self._index.remove(card)
+
+        return card
+
+    def sort(self, func):
+        """Sorts the cards of this list with a given function in-place. The given function should return some
+        attribute of a card object by which this list is sorted.
+
+        Args:
+            func: A function to sort this list with.
+        """
+        self._cards.sort(key=func)
+        self._clear_query_cache()
+
+        if self._index is not None:
+            self._index.rebuild(self._cards)
+
+    def filter(self, func):
+        """Filters the cards of this list with a given function in-place. The new list contains all the cards
+        for which the given function returns True.
+
+        Args:
+            func: A function to filter with.
+        """
+        self._cards.filter(key=func)
+        self._clear_query_cache()
+
+        if self._index is not None:
+            self._index.rebuild(self._cards)
+
+    def create_index(self, *fields):
+        """Indexes the cards of this list by the given attributes, or by the common search attributes
+        (PCardIndex.DEFAULT_INDEX_FIELDS) if none are given. The index is stored with the list and kept up to date
+        when cards are added to or removed from the list, and 'query' uses it to find the matching cards without
+        checking every card. Dotted fields like 'prices.usd' index a key of a dictionary attribute.
+
+        Changing the attributes of the cards themselves does not update the index. After changing cards, eg. after
+        updating them from an API, call 'reindex'. MtgDB does this automatically after its updates.
+
+        Indexing takes a pass over all the cards and some extra space, so it is meant for large lists which are
+        queried often, like the whole card database:
+
+            mtg_db.root.scryfall_cards.create_index()
+            mtg_db.commit()
+
+        Args:
+            *fields (str): The card attributes to index.
+        """
+        from mtgtools.PCardIndex import PCardIndex, DEFAULT_INDEX_FIELDS
+
+        fields = fields or DEFAULT_INDEX_FIELDS
+
+        if self._index is None:
+            self._index = PCardIndex(self._cards, fields)
+        else:
+            for field in fields:
+                self._index.add_field(field)
+
+    def create_name_index(self):
+        """Indexes the names of the cards and card faces of this list by their letter trigrams so that
+        'closest_names' and 'from_str' with 'fuzzy' enabled only compare a misspelled name with the names sharing
+        trigrams with it instead of every name of the list. The name index is a part of the attribute index of the
+        list (see create_index) and kept up to date in the same way. The names are also indexed as the attribute
+        'name' if they are not already.
+
+            mtg_db.root.scryfall_cards.create_name_index()
+            mtg_db.commit()
+            mtg_db.root.scryfall_cards.closest_names('jace the mind scultpor', 1)
+        """
+        if self._index is None:
+            self.create_index('name')
+
+        self._index.add_name_grams()
+
+    def drop_name_index(self):
+        """Removes the name index of this list (see create_name_index). The other indexes are kept."""
+        if self._index is not None:
+            self._index.remove_name_grams()
+
+    @property
+    def has_name_index(self):
+        """True if the names of the cards of this list are indexed for 'closest_names' (see create_name_index)."""
+        return self._index is not None and self._index.has_name_grams
+
+    def drop_index(self, *fields):
+        """Removes the indexes of the given attributes, or the whole index of this list if none are given.
+
+        Args:
+            *fields (str): The indexed card attributes to remove.
+        """
+        if self._index is None:
+            return
+
+        for field in fields:
+            if field in self._index:
+                self._index.remove_field(field)
+
+        if not fields or not self._index.fields:
+            self._index = None
+
+    def reindex(self, cards=None):
+        """Updates the index of this list after the attributes of its cards have changed. Only the index entries
+        of the changed values are rewritten.
+
+        Args:
+            cards (PCardList, list[PCard]): The changed cards. By default every card of this list is checked.
+
+        Returns:
+            int: The number of cards whose index entries changed.
+        """
+        if self._index is None:
+            return 0
+
+        return sum(1 for card in (self._cards if cards is None else cards) if self._index.update(card))
+
+    def set_query_cache(self, max_entries=128, max_cards=100000):
+        """Enables caching the results of 'where', 'where_exactly' and 'query' (with a query string) for this list, or
+        disables it if 'max_entries' is 0. Repeating a query with the same arguments then returns the cached cards
+        without checking the list again. The least recently used results are dropped when the cache gets full.
+
+        The limits are saved with the list, but the cached results are kept only in memory, separately for each
+        database connection. The cache is cleared whenever the list is changed and whenever the connection starts
+        seeing newer transactions, so cached results are never older than what the connection reads.
+
+        The cache can not tell which cards have been changed, so it is bypassed while anything has been changed
+        through the connection in the current transaction, until the changes are committed or aborted. It is also
+        bypassed if the list is not stored in a database, since changes to its cards could not be noticed at all.
+
+        Args:
+            max_entries (int): The maximum number of query results to cache.
+            max_cards (int): The maximum number of card references in all the cached results together. Each reference
+                takes 8 bytes of memory on top of the cards themselves, which are shared with the list.
+        """
+        self._query_cache_limits = (max_entries, max_cards) if max_entries > 0 else None
+        self._v_query_cache = None
+
+    def query_cache_stats(self):
+        """Returns the statistics of the query cache of this list (see 'set_query_cache') in this connection.
+
+        Returns:
+            dict: The number of hits, misses, evictions and invalidations of the cache, the number of cached results
+                ('entries') and card references ('cards') and the limits of the cache, or None if the cache is
+                disabled.
+        """
+        cache = self._query_cache()
+        return None if cache is None else cache.stats()
+
+    def _query_cache(self):
+        if self._query_cache_limits is None:
+            return None
+
+        cache = self._v_query_cache
+
+        if cache is None:
+            cache = self._v_query_cache = QueryCache(*self._query_cache_limits)
+
+        snapshot = snapshot_id(self._p_jar)
+
+        if snapshot is not None:
+            cache.validate(snapshot)
+
+        return cache
+
+    def _cached_cards(self, compute, *key):
+        cache = self._query_cache() if key else None
+        key = None if cache is None else query_key(*key)
+
+        # The cache can not see the changes of the cards themselves, so it is used only when the results are known to
+        # be those of the committed snapshot the cache is bound to
+        if key is None or not reads_snapshot(self._p_jar):
+            return compute()
+
+        # The cache keeps the cards in a tuple of its own, since the returned lists can be changed through the views
+        cards = cache.get(key)
+
+        if cards is None:
+            cards = compute()
+            cache.put(key, tuple(cards))
+            return cards
+
+        return list(cards)
+
+    def _clear_query_cache(self):
+        if self._v_query_cache is not None:
+            self._v_query_cache.clear()
+
+    def use_btree_storage(self, btree=True):
+        """Changes the storage of the cards of this list in-place. If 'btree' is enabled, the cards are moved into the
+        buckets of a BTree (PBTreeList) so that small changes to the list only save the changed buckets. Otherwise
+        the cards are moved into a single PersistentList.
+
+        Args:
+            btree (bool): If True, the cards are stored in a BTree and otherwise in a PersistentList.
+        """
+        if btree and not isinstance(self._cards, PBTreeList):
+            self._cards = PBTreeList(self._cards)
+        elif not btree and isinstance(self._cards, PBTreeList):
+            self._cards = PersistentList(self._cards)
 
     @property
     def cards(self):
@@ -1411,14 +1988,20 @@ class PCardList(Persistent):
 
     @cards.setter
     def cards(self, cards):
-        if isinstance(cards, PCardList):
-            self._cards = PersistentList(cards.cards)
-        elif isinstance(cards, (list, PersistentList, tuple)):
-            self._cards = PersistentList(cards)
+        list_type = PBTreeList if isinstance(self._cards, PBTreeList) else PersistentList
+
+        if isinstance(cards, CardListBase):
+            self._cards = list_type(cards.cards)
+        elif isinstance(cards, (list, PersistentList, PBTreeList, tuple)):
+            self._cards = list_type(cards)
         elif not cards:
-            self._cards = PersistentList()
+            self._cards = list_type()
         else:
             raise TypeError
+        self._clear_query_cache()
+
+        if self._index is not None:
+            self._index.rebuild(self._cards)
 
     @property
     def sideboard(self):
@@ -1426,9 +2009,9 @@ class PCardList(Persistent):
 
     @sideboard.setter
     def sideboard(self, sideboard):
-        if isinstance(sideboard, PCardList):
+        if isinstance(sideboard, CardListBase):
             self._sideboard = PersistentList(sideboard.cards)
-        elif isinstance(sideboard, (list, PersistentList, tuple)):
+        elif isinstance(sideboard, (list, PersistentList, PBTreeList, tuple)):
             self._sideboard = PersistentList(sideboard)
         elif not sideboard:
             self._sideboard = PersistentList()
@@ -0,0 +1,725 @@
+########################################################################################################################
+# Copyright © 2018 Esko-Kalervo Salaka.
+# All rights reserved.
+#
+#
+# Zope Public License (ZPL) Version 2.1
+#
+# A copyright notice accompanies this license document that identifies the
+# copyright holders.
+#
+# This license has been certified as open source. It has also been designated as
+# GPL compatible by the Free Software Foundation (FSF).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions in source code must retain the accompanying copyright
+# notice, this list of conditions, and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the accompanying copyright
+# notice, this list of conditions, and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Names of the copyright holders must not be used to endorse or promote
+# products derived from this software without prior written permission from the
+# copyright holders.
+#
+# 4. The right to distribute this software or to use it for any purpose does not
+# give you the right to use Servicemarks (sm) or Trademarks (tm) of the
+# copyright
+# holders. Use of them is covered by separate agreement with the copyright
+# holders.
+#
+# 5. If any files are modified, you must cause the modified files to carry
+# prominent notices stating that you changed the files and the date of any
+# change.
+#
+# Disclaimer
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY EXPRESSED
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# This software uses ZODB, a native object database for Python, which is a
+# copyright © by Zope Foundation and Contributors.
+#
+# This software uses Scryfall's rest-like API which is a copyright © by Scryfall LLC.
+#
+# This software uses rest-like API of magicthegathering.io which is a copyright © by Andrew Backes.
+#
+# This software uses the Python Imaging Library (PIL) which is a copyright © 1997-2011 by Secret Labs AB and
+# copyright © 1995-2011 by Fredrik Lundh
+#
+# All the graphical and literal information and data related to Magic: The Gathering which can be handled with this
+# software, such as card information and card images, is copyright of Wizards of the Coast LLC, a
+# Hasbro inc. subsidiary.
+#
+# This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
+# Wizards of the Coast.
+########################################################################################################################
+import datetime
+
+from persistent import Persistent
+from mtgtools.PCard import PCard
+from mtgtools.PCardList import CardListBase, PCardList
+from mtgtools.CardListView import CardListView
+from persistent.list import PersistentList
+from mtgtools.PBTreeList import PBTreeList
+
+
+class PCountedList(Persistent):
+    """PCountedList is a persistent deck or collection object which stores each card only once together with its
+    mainboard and sideboard counts, instead of keeping a separate reference for every copy of a card like PCardList.
+    Quantity lookups like 'count' are O(1) and deck operations like 'deck_str' and subtraction are proportional to the
+    number of unique cards rather than to the total number of cards. The cards and their counts are pickled as a
+    single flat tuple, so millions of decks can be stored in the database without much space.
+
+    PCountedList has mostly the same querying, filtering and grouping methods as PCardList, and they return new
+    PCountedList objects with the counts of the matching cards preserved. The queries are run once per unique card
+    and the cards of the sideboard are searched too. Iterating over the list yields every mainboard copy of the cards
+    just like iterating over a PCardList would. A PCountedList can be created from a PCardList with
+    'PCardList.counted' and turned back into one with 'to_card_list'.
+
+    PCountedLists are considered equal if they have the same 'id'.
+
+    args:
+        cards (PCardList, PCountedList, list[PCard], tuple[PCard]): Initial cards of the list. Multiple copies of the
+            same card are counted.
+        sideboard (PCardList, list[PCard], tuple[PCard]): Initial cards of the sideboard.
+        name (str): Name of the list
+    """
+
+    def __init__(self, cards=None, sideboard=None, name=''):
+        import uuid
+
+        self._entries = ()
+
+        if isinstance(cards, PCountedList):
+            self._counts = dict(cards._counts)
+        elif isinstance(cards, CardListBase):
+            self.extend(cards)
+            self.extend(cards.sideboard, sideboard=True)
+        else:
+            self.extend(cards)
+
+        self.extend(sideboard, sideboard=True)
+
+        self.name = name
+        self.creation_date = datetime.datetime.now()
+        self.id = uuid.uuid4()
+
+    def __iter__(self):
+        for card, num, _ in self._counts.values():
+            for _ in range(num):
+                yield card
+
+    def __len__(self):
+        return sum(num for _, num, _ in self._counts.values())
+
+    def __str__(self):
+        return str(self.counts())
+
+    def __repr__(self):
+        return repr(self.counts())
+
+    def __contains__(self, card):
+        entry = self._counts.get(card.id)
+        return entry is not None and entry[1] > 0
+
+    def __eq__(self, other):
+        if isinstance(other, PCountedList):
+            return self.id == other.id
+
+    def __add__(self, other):
+        counted = PCountedList(self)
+
+        if isinstance(other, PCountedList):
+            for card, num, sb_num in other._counts.values():
+                counted.add(card, num)
+                counted.add(card, sb_num, sideboard=True)
+        elif isinstance(other, CardListBase):
+            counted.extend(other)
+            counted.extend(other.sideboard, sideboard=True)
+        elif isinstance(other, (list, PersistentList, PBTreeList, tuple)):
+            counted.extend(other)
+        elif isinstance(other, PCard):
+            counted.add(other)
+        else:
+            raise TypeError
+
+        return counted
+
+    def __radd__(self, other):
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        counted = PCountedList(self)
+
+        if isinstance(other, PCountedList):
+            for card, num, sb_num in other._counts.values():
+                counted.remove(card, num)
+                counted.remove(card, sb_num, sideboard=True)
+        elif isinstance(other, CardListBase):
+            for card in other:
+                counted.remove(card)
+            for card in other.sideboard:
+                counted.remove(card, sideboard=True)
+        elif isinstance(other, (list, PersistentList, PBTreeList, tuple)):
+            for card in other:
+                counted.remove(card)
+        elif isinstance(other, PCard):
+            counted.remove(other)
+        else:
+            raise TypeError
+
+        return counted
+
+    def __mul__(self, num):
+        counted = PCountedList()
+        counted._counts = dict((card_id, (card, main * num, side * num))
+                               for card_id, (card, main, side) in self._counts.items())
+        return counted
+
+    def __rmul__(self, num):
+        return self.__mul__(num)
+
+    def add(self, card, num=1, sideboard=False):
+        """Adds 'num' copies of a card object in the list (or in the sideboard) in-place.
+
+        Args:
+            card (PCard): The card object to add.
+            num (int): The number of copies to add.
+            sideboard (bool): If True, the copies are added in the sideboard.
+        """
+        counts = self._counts
+        self._change_count(counts, card, num, sideboard)
+        self._counts = counts
+
+    def remove(self, card, num=1, sideboard=False):
+        """Removes 'num' copies of a card object from the list (or from the sideboard) in-place. Removing more copies
+        than the list has simply removes all of them.
+
+        Args:
+            card (PCard): The card object to remove.
+            num (int): The number of copies to remove.
+            sideboard (bool): If True, the copies are removed from the sideboard.
+        """
+        counts = self._counts
+        self._change_count(counts, card, -num, sideboard)
+        self._counts = counts
+
+    def append(self, card):
+        """Adds a single copy of a card object in the list in-place.
+
+        Args:
+            card (PCard): The card object to be appended
+        """
+        self.add(card)
+
+    def extend(self, cards, sideboard=False):
+        """Adds all the given card objects in the list (or in the sideboard) in-place. Multiple copies of the same
+        card are counted.
+
+        Args:
+            cards (PCardList, list, tuple, PersistentList): The card objects to add.
+            sideboard (bool): If True, the cards are added in the sideboard.
+        """
+        if isinstance(cards, CardListBase):
+            cards = cards.cards
+        elif not cards:
+            return
+        elif not isinstance(cards, (list, PersistentList, PBTreeList, tuple)):
+            raise TypeError
+
+        counts = self._counts
+
+        for card in cards:
+            self._change_count(counts, card, 1, sideboard)
+
+        self._counts = counts
+
+    def clear(self):
+        """Clears the cards and the sideboard of this list."""
+        self._counts = {}
+
+    def count(self, card, sideboard=False):
+        """Returns the number of copies of a given card object in this list (or in the sideboard). Cards are considered
+        same if they have the same id.
+
+        Args:
+            card (PCard): A card object to count.
+            sideboard (bool): If True, the copies in the sideboard are counted instead.
+
+        Returns:
+            int: The number of copies of the given card object.
+        """
+        entry = self._counts.get(card.id)
+
+        if entry is None:
+            return 0
+
+        return entry[2] if sideboard else entry[1]
+
+    def counts(self, sideboard=False):
+        """Returns a dictionary mapping the card ids of this list (or of the sideboard) to their counts.
+
+        Returns:
+            dict: A dictionary of card ids and counts.
+        """
+        index = 2 if sideboard else 1
+        return dict((card_id, entry[index]) for card_id, entry in self._counts.items() if entry[index])
+
+    def items(self):
+        """Returns a list of (card, mainboard count, sideboard count) tuples of the unique cards of this list.
+
+        Returns:
+            list[tuple]: A list of (card, mainboard count, sideboard count) tuples.
+        """
+        return list(self._counts.values())
+
+    def unique_cards(self):
+        """Returns a new list of cards containing a single copy of each card object of this list and its sideboard.
+
+        Returns:
+            CardListView: A new list of the unique cards.
+        """
+        return CardListView.wrap([card for card, _, _ in self._counts.values()])
+
+    def to_card_list(self):
+        """Returns a new PCardList with every copy of the cards of this list and its sideboard.
+
+        Returns:
+            PCardList: A new list of cards.
+        """
+        sideboard = [card for card, _, num in self._counts.values() for _ in range(num)]
+        return PCardList(list(self), sideboard, name=self.name)
+
+    def sorted(self, func):
+        """Returns a new instance of this list sorted with a given function. See PCardList.sorted.
+
+        Args:
+            func: A function to sort this list with.
+
+        Returns:
+            PCountedList: A new instance of this list sorted.
+        """
+        return self._counted(sorted(self.unique_cards(), key=func))
+
+    def filtered(self, func):
+        """Returns a new instance of this list filtered with a given function. See PCardList.filtered.
+
+        Args:
+            func: A function to filter with.
+
+        Returns:
+            PCountedList: A new instance of this list filtered.
+        """
+        return self._counted(self.unique_cards().filtered(func))
+
+    def where(self, invert=False, search_all_faces=False, **kwargs):
+        """Returns a new list of cards for which any of the given keyword arguments match partly or completely with the
+        attributes of the cards in this list. See PCardList.where.
+
+        Args:
+            search_all_faces (bool): (only for Scryfall cards) If True, searches all the cards faces of this lists'
+                cards instead of the first one
+            invert: If True, a list of cards NOT matching the arguments is returned
+            **kwargs: Arguments to match with the attributes of this list's cards.
+
+        Returns:
+            PCountedList: A new list of cards for which the given keyword arguments match partly or completely.
+        """
+        return self._counted(self.unique_cards().where(invert, search_all_faces, **kwargs))
+
+    def where_exactly(self, invert=False, search_all_faces=False, **kwargs):
+        """Returns a new list of cards for which the given keyword arguments match completely with the attributes
+        of the cards in this list. See PCardList.where_exactly.
+
+        Args:
+            search_all_faces (bool): (only for Scryfall cards) If True, searches all the cards faces of this lists'
+                cards instead of the first one
+            invert: If True, a list of cards NOT matching the arguments is returned
+            **kwargs: Arguments to match with the attributes of this list's cards.
+
+        Returns:
+            PCountedList: A new list of cards for which the given keyword arguments match completely.
+        """
+        return self._counted(self.unique_cards().where_exactly(invert, search_all_faces, **kwargs))
+
+    def has_all(self, cards):
+        """Returns true if this list contains all the given cards.
+
+        Args:
+            cards (PCardlist, list, tuple, PersistentList): A list of card objects to check.
+
+        Returns:
+            bool: True if this list contains all the given card objects, False otherwise.
+        """
+        return all(card in self for card in cards)
+
+    def has_any(self, cards):
+        """Returns true if this list contains any of the given cards.
+
+        Args:
+            cards (PCardlist, list, tuple, PersistentList): A list of card objects to check .
+
+        Returns:
+            bool: True if this list contains any of the given card objects, False otherwise.
+        """
+        return any(card in self for card in cards)
+
+    def normal_playable_cards(self):
+        """Returns a new list of cards with all the special non-playable cards removed. See
+        PCardList.normal_playable_cards.
+
+        Returns:
+            PCountedList: A new list of cards with all the special non-playable cards removed.
+        """
+        return self._counted(self.unique_cards().normal_playable_cards())
+
+    def creatures(self):
+        """Returns a new list which only contains the creatures of this list.
+
+        Returns:
+            PCountedList: A new list of cards containing only the creature cards.
+        """
+        return self._counted(self.unique_cards().creatures())
+
+    def artifacts(self):
+        """Returns a new list which only contains the artifacts of this list.
+
+        Returns:
+            PCountedList: A new list of cards containing only the artifact cards.
+        """
+        return self._counted(self.unique_cards().artifacts())
+
+    def instants(self):
+        """Returns a new list which only contains the instants of this list.
+
+        Returns:
+            PCountedList: A new list of cards containing only the instant cards.
+        """
+        return self._counted(self.unique_cards().instants())
+
+    def sorceries(self):
+        """Returns a new list which only contains the sorceries of this list.
+
+        Returns:
+            PCountedList: A new list of cards containing only the sorcery cards.
+        """
+        return self._counted(self.unique_cards().sorceries())
+
+    def planeswalkers(self):
+        """Returns a new list which only contains the planeswalkers of this list.
+
+        Returns:
+            PCountedList: A new list of cards containing only the planeswalker cards.
+        """
+        return self._counted(self.unique_cards().planeswalkers())
+
+    def enchantments(self):
+        """Returns a new list which only contains the enchantments of this list.
+
+        Returns:
+            PCountedList: A new list of cards containing only the enchantment cards.
+        """
+        return self._counted(self.unique_cards().enchantments())
+
+    def noncreatures(self):
+        """Returns a new list which only contains the noncreatures of this list.
+
+        Returns:
+            PCountedList: A new list of cards containing only the noncreature cards.
+        """
+        return self._counted(self.unique_cards().noncreatures())
+
+    def lands(self):
+        """Returns a new list which only contains the lands of this list.
+
+        Returns:
+            PCountedList: A new list of cards containing only the land cards.
+        """
+        return self._counted(self.unique_cards().lands())
+
+    def basic_lands(self):
+        """Returns a new list which only contains the basic lands of this list.
+
+        Returns:
+            PCountedList: A new list of cards containing only the basic land cards.
+        """
+        return self._counted(self.unique_cards().basic_lands())
+
+    def converted_mana_cost(self):
+        """Returns the converted mana cost of the list.
+
+        Returns:
+            float: The converted mana cost of the list.
+        """
+        return sum(card.cmc * num for card, num, _ in self._counts.values())
+
+    def average_mana_cost(self):
+        """Returns the average mana cost of the cards in this list.
+
+        Returns:
+            float: The average mana cost of the list.
+        """
+        num_of_cards = len(self)
+        return self.converted_mana_cost() / num_of_cards if num_of_cards else 0
+
+    def mana_symbol_counts(self):
+        """Returns a dictionary containing the counts of all the manasymbols of the cards of this list.
+        See PCardList.mana_symbol_counts.
+
+        Returns:
+            dict: a dictionary containing the counts of all the manasymbols this list.
+        """
+        count_dict = {'W': 0, 'U': 0, 'B': 0, 'R': 0, 'G': 0}
+
+        for card, num, _ in self._counts.values():
+            for mana, card_count in CardListView.wrap([card]).mana_symbol_counts().items():
+                count_dict[mana] += card_count * num
+
+        return count_dict
+
+    def grouped_by_converted_mana_cost(self):
+        """Returns a dictionary containing the cards of this list grouped by their converted mana costs.
+        See PCardList.grouped_by_converted_mana_cost.
+
+        Returns:
+            dict: A dictionary containing the cards grouped by their converted mana costs.
+        """
+        return self._grouped(self._main_cards().grouped_by_converted_mana_cost())
+
+    def grouped_by_simple_type(self):
+        """Returns a dictionary containing the cards of this list grouped by their types in a simple way.
+        See PCardList.grouped_by_simple_type.
+
+        Returns:
+            dict: A dictionary containing the cards grouped by simple types.
+        """
+        return self._grouped(self._main_cards().grouped_by_simple_type())
+
+    def grouped_by_type(self):
+        """Returns a dictionary containing the cards of this list grouped by their types.
+        See PCardList.grouped_by_type.
+
+        Returns:
+            dict: A dictionary containing the cards grouped by types.
+        """
+        return self._grouped(self._main_cards().grouped_by_type())
+
+    def grouped_by_color_identity(self):
+        """Returns a dictionary containing the cards of this list grouped by their color identities.
+        See PCardList.grouped_by_color_identity.
+
+        Returns:
+            dict: A dictionary containing cards grouped by their color identities.
+        """
+        return self._grouped(self._main_cards().grouped_by_color_identity())
+
+    def grouped_by_color(self):
+        """Returns a dictionary containing the cards of this list grouped by their colors.
+        See PCardList.grouped_by_color.
+
+        Returns:
+            dict: A dictionary containing cards grouped by their colors.
+        """
+        return self._grouped(self._main_cards().grouped_by_color())
+
+    def grouped_by_id(self):
+        """Returns a dictionary containing the cards of this list grouped by their unique id's. Unlike for PCardList,
+        each id maps to a PCountedList with the single card and its counts, so no sorting is needed.
+
+        Returns:
+            dict: A dictionary containing cards grouped by their unique id's.
+        """
+        return self._grouped(dict((card.id, [card]) for card in self._main_cards()))
+
+    def deck_str(self, group_by='type', add_set_codes=True):
+        """Returns a string of the cards in this list in a readable deck form. The string is the same as the one of
+        PCardList.deck_str, except that the cards are not sorted by their ids within the groups.
+
+        Args:
+            group_by (str): How the cards are grouped in the string. Either 'none', 'color', 'type' or 'cmc'
+            add_set_codes (bool): If enabled, also the set codes are added after the card names.
+        Returns:
+            str: A string of the cards of this list in a readable deck format.
+        """
+        deck = ''
+
+        if group_by == 'type':
+            groups = self.grouped_by_type()
+        elif group_by == 'cmc':
+            groups = dict((str(int(cmc)), cards) for cmc, cards in self.grouped_by_converted_mana_cost().items())
+        elif group_by == 'color':
+            keymap = {'R': 'Red', 'G': 'Green', 'U': 'Blue', 'B': 'Black', 'W': 'White', '': 'Colorless'}
+            groups = {'Multicolor': PCountedList(), 'Colorless': PCountedList(), 'Red': PCountedList(),
+                      'Blue': PCountedList(), 'Black': PCountedList(), 'White': PCountedList(),
+                      'Green': PCountedList()}
+
+            for key, val in self.grouped_by_color().items():
+                if len(key) > 1:
+                    groups['Multicolor'] += val
+                else:
+                    groups[keymap[key]] += val
+        else:
+            groups = {None: self}
+
+        for group_name, group_cards in groups.items():
+            if len(group_cards):
+                if group_name is not None:
+                    deck += '// {} ({})\n'.format(group_name.capitalize(), len(group_cards))
+
+                deck += self._deck_lines(group_cards, '', add_set_codes, sideboard=False)
+                deck += '\n'
+
+        sideboard_size = sum(num for _, _, num in self._counts.values())
+
+        if sideboard_size:
+            if group_by != 'none':
+                deck += '// {} ({})\n'.format('Sideboard', sideboard_size)
+
+            deck += self._deck_lines(self, 'SB: ', add_set_codes, sideboard=True)
+            deck += '\n'
+
+        return deck
+
+    def to_file(self, file_path, group_by='type', add_set_codes=True):
+        """Writes the cards in this list in a readable deck form in a file. See PCardList.to_file.
+
+        Args:
+            group_by (str): How the cards are grouped in the text file. Either 'none', 'color', 'type' or 'cmc'
+            add_set_codes (bool): If enabled, also the set codes are added after the card names.
+            file_path (str): The path to create the file to.
+        """
+        try:
+            with open(file_path, 'x') as f:
+                f.write(self.deck_str(group_by=group_by, add_set_codes=add_set_codes))
+
+        except (FileExistsError, IOError) as err:
+            print('Something went wrong with writing to the file: {}'.format(str(err)))
+
+    def pprint(self):
+        """Prints out the contents of this list in a nice readable way."""
+        print(self.pretty_print_str())
+
+    def pretty_print_str(self):
+        """Returns a nice readable string of the contents of this list. See PCardList.pretty_print_str.
+
+        Returns:
+            str: a string of the contents of this list in a nice readable format.
+        """
+        return self.to_card_list().pretty_print_str()
+
+    def download_images_from_scryfall(self, image_type='normal', dir_path=''):
+        """Downloads the images of the unique cards of this list and its sideboard from Scryfall to a given directory.
+        See PCardList.download_images_from_scryfall.
+
+        Args:
+            image_type (str): A type or size of image to download. Either 'png', 'border_crop', 'art_crop', 'small',
+            'normal' or 'large'.
+            dir_path (str): The path to the directory to download the images to.
+        """
+        self.unique_cards().download_images_from_scryfall(image_type=image_type, dir_path=dir_path)
+
+    def create_proxies(self, *args, **kwargs):
+        """Creates A4-sized printable jpeg-proxy sheets of the cards in this list and its sideboard. Takes the same
+        arguments as PCardList.create_proxies."""
+        self.to_card_list().create_proxies(*args, **kwargs)
+
+    @property
+    def api_type(self):
+        for card, _, _ in self._counts.values():
+            return card.api_type
+
+        return 'unspecified'
+
+    @property
+    def json(self):
+        import json
+
+        return json.dumps({'cards': [dict(card.as_dict(), count=num, sideboard_count=sb_num)
+                                     for card, num, sb_num in self._counts.values()]}, sort_keys=True, indent=4)
+
+    def __getstate__(self):
+        # The cards and counts are stored as a flat tuple (card, main count, sideboard count, card, ...) which pickles
+        # into a much smaller record than a dictionary keyed by the card ids. The tuple is only built when the list is
+        # saved, so that changing the counts one card at a time does not rebuild it every time.
+        state = super().__getstate__()
+        state['_entries'] = tuple(value for entry in self._counts.values() for value in entry)
+        return state
+
+    @property
+    def _counts(self):
+        # The dictionary is rebuilt from the stored tuple on demand
+        try:
+            return self._v_counts
+        except AttributeError:
+            entries = self._entries
+            self._v_counts = dict((entries[i].id, tuple(entries[i:i + 3])) for i in range(0, len(entries), 3))
+            return self._v_counts
+
+    @_counts.setter
+    def _counts(self, counts):
+        self._v_counts = counts
+        self._p_changed = True
+
+    @staticmethod
+    def _change_count(counts, card, num, sideboard):
+        _, main, side = counts.get(card.id, (card, 0, 0))
+
+        if sideboard:
+            side = max(0, side + num)
+        else:
+            main = max(0, main + num)
+
+        if main or side:
+            counts[card.id] = (card, main, side)
+        else:
+            counts.pop(card.id, None)
+
+    def _main_cards(self):
+        return CardListView.wrap([card for card, num, _ in self._counts.values() if num])
+
+    def _counted(self, cards):
+        # Builds a new counted list of the given unique cards with the counts of this list
+        counted = PCountedList()
+        counted._counts = dict((card.id, self._counts[card.id]) for card in cards)
+        return counted
+
+    def _grouped(self, groups):
+        # Keeps only the mainboard counts since the groupings only concern the mainboard
+        result = {}
+
+        for key, cards in groups.items():
+            counted = PCountedList()
+            counted._counts = dict((card.id, (card, self._counts[card.id][1], 0)) for card in cards)
+            result[key] = counted
+
+        return result
+
+    @staticmethod
+    def _deck_lines(counted, prefix, add_set_codes, sideboard):
+        lines = ''
+
+        for card, num, sb_num in counted._counts.values():
+            num = sb_num if sideboard else num
+
+            if not num:
+                continue
+
+            if add_set_codes:
+                lines += '{}{} {} [{}]\n'.format(prefix, num, card.name, card.set)
+            else:
+                lines += '{}{} {}\n'.format(prefix, num, card.name)
+
+        return lines
@@ -66,7 +66,6 @@
 # This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
 # Wizards of the Coast.
 ########################################################################################################################
-import json
 
 from persistent import Persistent
 from mtgtools.PCardList import PCardList
@@ -116,8 +115,8 @@ class PSet(PCardList, Persistent):
         icon_svg_uri:          str
     """
 
-    def __init__(self, response_dict, cards=None):
-        super().__init__(cards=cards)
+    def __init__(self, response_dict, cards=None, btree=False):
+        super().__init__(cards=cards, btree=btree)
 
         if 'scryfall_uri' in response_dict:
             self.id = response_dict.get('id')
@@ -266,7 +265,9 @@ class PSet(PCardList, Persistent):
 
     @property
     def json(self):
+        import json
+
         json_dict = dict(self.__dict__)
-        json_dict['cards'] = [card.__dict__ for card in self.cards]
+        json_dict['cards'] = [card.as_dict() for card in self.cards]
 
         return json.dumps(json_dict, sort_keys=True, indent=4)
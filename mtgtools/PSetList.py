@@ -68,8 +68,6 @@
 ########################################################################################################################
 
 import datetime
-import json
-import uuid
 import warnings
 
 from persistent import Persistent
@@ -92,6 +90,8 @@ class PSetList(Persistent):
     """
 
     def __init__(self, sets=None, name=''):
+        import uuid
+
         if isinstance(sets, PSetList):
             self._sets = PersistentList(sets.sets)
         elif isinstance(sets, (PersistentList, list, tuple)):
@@ -429,8 +429,56 @@ class PSetList(Persistent):
         except IndexError:
             return 'unspecified'
 
+    def to_ndjson(self, file, compress=None):
+        """Writes the sets of this list without their cards as newline-delimited json, one set per line, to a file or
+        a file-like object. See PCardList.to_ndjson.
+
+        Args:
+            file: A path to the file to write or a file-like object.
+            compress (bool): If enabled, the output is gzip-compressed. By default paths ending with '.gz' are.
+
+        Returns:
+            int: The number of sets written.
+        """
+        from .util.export import set_record, write_ndjson
+
+        return write_ndjson((set_record(pset) for pset in self.sets), file, compress=compress)
+
+    def to_ndjson_shards(self, dir_path, fields=None, compress=False, chunk_size=1000, compresslevel=6):
+        """Writes the sets of this list and their cards as newline-delimited json in a directory with one file per set.
+        The sets are written in 'sets.ndjson' and the cards of each set in 'cards-<set code>.ndjson'. With 'compress',
+        the files are gzip-compressed and end with '.gz'. Sets without cards get no card file. See
+        PCardList.to_ndjson.
+
+        Args:
+            dir_path (str): The directory to write the files to. It is created if it does not exist.
+            fields (list[str]): The attributes of the cards to export. By default all the present attributes.
+            compress (bool): If enabled, the files are gzip-compressed.
+            chunk_size (int): The number of cards encoded and written at a time.
+            compresslevel (int): The gzip compression level from 1 (fastest) to 9 (smallest).
+
+        Returns:
+            int: The number of cards written.
+        """
+        import os
+
+        suffix = '.ndjson.gz' if compress else '.ndjson'
+        os.makedirs(dir_path, exist_ok=True)
+
+        self.to_ndjson(os.path.join(dir_path, 'sets' + suffix), compress=compress)
+        written = 0
+
+        for pset in self.sets:
+            if len(pset) > 0:
+                written += pset.to_ndjson(os.path.join(dir_path, 'cards-{}{}'.format(pset.code, suffix)), fields=fields,
+                                          compress=compress, chunk_size=chunk_size, compresslevel=compresslevel)
+
+        return written
+
     @property
     def json(self):
+        import json
+
         pset_json_dicts = []
 
         for pset in self.sets:
@@ -439,9 +487,12 @@ class PSetList(Persistent):
             del json_dict['_sideboard']
             del json_dict['creation_date']
             del json_dict['id']
+            json_dict.pop('_index', None)
+            json_dict.pop('_query_cache_limits', None)
+            json_dict.pop('_v_query_cache', None)
 
             if len(pset) > 0:
-                json_dict['cards'] = [card.__dict__ for card in pset.cards]
+                json_dict['cards'] = [card.as_dict() for card in pset.cards]
                 pset_json_dicts.append(json_dict)
 
         return json.dumps({'sets': pset_json_dicts}, sort_keys=True, indent=4)
@@ -0,0 +1,497 @@
+########################################################################################################################
+# Copyright © 2018 Esko-Kalervo Salaka.
+# All rights reserved.
+#
+#
+# Zope Public License (ZPL) Version 2.1
+#
+# A copyright notice accompanies this license document that identifies the
+# copyright holders.
+#
+# This license has been certified as open source. It has also been designated as
+# GPL compatible by the Free Software Foundation (FSF).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions in source code must retain the accompanying copyright
+# notice, this list of conditions, and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the accompanying copyright
+# notice, this list of conditions, and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Names of the copyright holders must not be used to endorse or promote
+# products derived from this software without prior written permission from the
+# copyright holders.
+#
+# 4. The right to distribute this software or to use it for any purpose does not
+# give you the right to use Servicemarks (sm) or Trademarks (tm) of the
+# copyright
+# holders. Use of them is covered by separate agreement with the copyright
+# holders.
+#
+# 5. If any files are modified, you must cause the modified files to carry
+# prominent notices stating that you changed the files and the date of any
+# change.
+#
+# Disclaimer
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY EXPRESSED
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# This software uses ZODB, a native object database for Python, which is a
+# copyright © by Zope Foundation and Contributors.
+#
+# This software uses Scryfall's rest-like API which is a copyright © by Scryfall LLC.
+#
+# This software uses rest-like API of magicthegathering.io which is a copyright © by Andrew Backes.
+#
+# This software uses the Python Imaging Library (PIL) which is a copyright © 1997-2011 by Secret Labs AB and
+# copyright © 1995-2011 by Fredrik Lundh
+#
+# All the graphical and literal information and data related to Magic: The Gathering which can be handled with this
+# software, such as card information and card images, is copyright of Wizards of the Coast LLC, a
+# Hasbro inc. subsidiary.
+#
+# This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
+# Wizards of the Coast.
+########################################################################################################################
+import bisect
+import datetime
+import heapq
+import time
+
+from array import array
+from persistent import Persistent
+from BTrees.IOBTree import IOBTree
+from BTrees.LOBTree import LOBTree
+from BTrees.OIBTree import OIBTree
+
+
+PRICE_FIELDS = ('usd', 'usd_foil', 'eur', 'tix')
+
+# The number of cards in a block of prices and the number of snapshots between full copies of the prices
+BLOCK_SIZE = 512
+CHECKPOINT_INTERVAL = 16
+
+_NO_PRICES = (0,) * len(PRICE_FIELDS)
+_MAX_BLOCKS = 1 << 24
+
+
+def _encode_price(price):
+    """Turns a Scryfall price string like '0.25' into an integer. Prices are stored as cents + 1 so that 0 can mean a
+    missing (null) price."""
+    if price is None:
+        return 0
+
+    try:
+        return int(round(float(price) * 100)) + 1
+    except (TypeError, ValueError):
+        return 0
+
+
+def _decode_price(value):
+    return None if value == 0 else (value - 1) / 100
+
+
+def _write_varint(buffer, value):
+    # Zigzag encoding keeps small negative deltas small
+    value = (value << 1) ^ (value >> 63)
+
+    while value > 0x7f:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+
+    buffer.append(value)
+
+
+def _read_varints(data):
+    value = 0
+    shift = 0
+
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield (value >> 1) ^ -(value & 1)
+            value = 0
+            shift = 0
+
+
+def _block_key(snapshot, block):
+    return snapshot * _MAX_BLOCKS + block
+
+
+def _to_timestamp(when):
+    if when is None:
+        return None
+    elif isinstance(when, datetime.datetime):
+        return int(when.timestamp())
+    elif isinstance(when, datetime.date):
+        return int(time.mktime(when.timetuple()))
+    else:
+        return int(when)
+
+
+class PriceBlock(Persistent):
+    """PriceBlock holds the price changes of a block of BLOCK_SIZE cards in a single snapshot as a compact delta
+    encoded byte string. Each entry in the string consists of the position of a card in the block (as the distance to
+    the previous entry) and the changes of the usd, usd_foil, eur and tix prices of the card. A block is written once
+    and never changed afterwards, so recording a snapshot writes only the changes of that snapshot no matter how long
+    the history is.
+
+    The blocks are not meant to be used directly. See PriceHistory for querying prices.
+    """
+
+    def __init__(self, values, previous):
+        buffer = bytearray()
+        position = -1
+
+        for offset in sorted(values):
+            old_values = previous.get(offset) or _NO_PRICES
+            _write_varint(buffer, offset - position)
+
+            for value, old_value in zip(values[offset], old_values):
+                _write_varint(buffer, value - old_value)
+
+            position = offset
+
+        self._data = bytes(buffer)
+
+    def apply(self, state):
+        """Applies the changes of the block to a given dictionary of card positions mapped to encoded price values."""
+        step = len(PRICE_FIELDS) + 1
+        position = -1
+        entry = []
+
+        for delta in _read_varints(self._data):
+            entry.append(delta)
+
+            if len(entry) == step:
+                position += entry[0]
+                old_values = state.get(position) or _NO_PRICES
+                state[position] = tuple(value + change for value, change in zip(old_values, entry[1:]))
+                entry = []
+
+    @property
+    def size(self):
+        return len(self._data)
+
+
+class PriceHistory(Persistent):
+    """PriceHistory is a persistent store for the price history of cards. Every time a snapshot of a list of cards is
+    recorded, the usd, usd_foil, eur and tix prices of the cards whose prices have changed since the previous snapshot
+    are written to compact blocks of BLOCK_SIZE cards (see PriceBlock), one block per snapshot for each block of cards
+    with changes. Old blocks are never rewritten, so the cost of recording a snapshot depends only on the number of
+    changed prices and not on the length of the history. Every CHECKPOINT_INTERVAL:th snapshot writes the full prices
+    of all the cards instead, so that reading the prices at any point replays at most CHECKPOINT_INTERVAL snapshots.
+
+    The Scryfall database keeps a price history in self.root.scryfall_price_history of MtgDB which is updated
+    automatically every time the database is updated from Scryfall. Histories can also be recorded manually for any
+    list of cards with 'record'.
+
+    Prices are returned as floats (eg. 0.25) or None if the card had no price at that time. Times can be given as
+    datetime objects or as unix timestamps.
+    """
+
+    def __init__(self):
+        self._timestamps = array('q')
+        self._numbers = OIBTree()
+        self._card_ids = IOBTree()
+        self._blocks = LOBTree()
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def __contains__(self, card_id):
+        return card_id in self._numbers
+
+    def record(self, cards, timestamp=None):
+        """Records a new price snapshot from the given cards. Only Scryfall cards contain prices, other cards are
+        ignored.
+
+        Args:
+            cards (PCardList, list[PCard]): The cards whose prices to record.
+            timestamp (datetime, int): The time of the snapshot. If not given, the current time is used.
+
+        Returns:
+            int: The number of cards whose prices changed since the previous snapshot.
+        """
+        timestamp = _to_timestamp(timestamp) if timestamp is not None else int(time.time())
+
+        if self._timestamps and timestamp < self._timestamps[-1]:
+            raise ValueError('Price snapshots must be recorded in chronological order.')
+
+        snapshot = len(self._timestamps)
+        states = self._states_at(snapshot - 1)
+        changes = {}
+        next_number = self._card_ids.maxKey() + 1 if self._card_ids else 0
+
+        for card in cards:
+            prices = getattr(card, 'prices', None)
+            number = self._numbers.get(card.id)
+
+            if number is None:
+                if prices is None:
+                    continue
+
+                number = next_number
+                next_number += 1
+                self._numbers[card.id] = number
+                self._card_ids[number] = card.id
+
+            prices = prices or {}
+            values = tuple(_encode_price(prices.get(field)) for field in PRICE_FIELDS)
+            block, offset = divmod(number, BLOCK_SIZE)
+            state = states.setdefault(block, {})
+            old_values = state.get(offset)
+
+            if values != (old_values or _NO_PRICES):
+                changes.setdefault(block, {}).setdefault(offset, old_values)
+                state[offset] = values
+
+        timestamps = array('q', self._timestamps)
+        timestamps.append(timestamp)
+        self._timestamps = timestamps
+
+        if snapshot % CHECKPOINT_INTERVAL == 0:
+            for block, state in states.items():
+                if state:
+                    self._blocks[_block_key(snapshot, block)] = PriceBlock(state, {})
+        else:
+            for block, previous in changes.items():
+                values = {offset: states[block][offset] for offset in previous}
+                self._blocks[_block_key(snapshot, block)] = PriceBlock(values, previous)
+
+        return sum(len(previous) for previous in changes.values())
+
+    def timestamps(self):
+        """Returns the times of all the recorded snapshots as a list of datetime objects."""
+        return [datetime.datetime.fromtimestamp(timestamp) for timestamp in self._timestamps]
+
+    def history(self, card_id, field='usd', start=None, end=None):
+        """Returns the price history of a given card as a list of (datetime, price) tuples, one for each snapshot
+        between 'start' and 'end'.
+
+        Args:
+            card_id (str): The id of the card.
+            field (str): The price field, either 'usd', 'usd_foil', 'eur' or 'tix'.
+            start (datetime, int): The start of the time range. If not given, the range starts from the first snapshot.
+            end (datetime, int): The end of the time range. If not given, the range ends to the last snapshot.
+
+        Returns:
+            list[tuple]: A list of (datetime, price) tuples.
+        """
+        first, last = self._snapshot_range(start, end)
+
+        if card_id not in self._numbers or first > last:
+            return []
+
+        values = self._card_values(card_id, PRICE_FIELDS.index(field), first, last)
+
+        return [(datetime.datetime.fromtimestamp(self._timestamps[first + i]),
+                 _decode_price(value) if value is not None else None)
+                for i, value in enumerate(values)]
+
+    def price_at(self, card_id, when=None, field='usd'):
+        """Returns the price of a given card at a given time, that is, the price from the latest snapshot recorded
+        at or before the time.
+
+        Args:
+            card_id (str): The id of the card.
+            when (datetime, int): The time. If not given, the latest price is returned.
+            field (str): The price field, either 'usd', 'usd_foil', 'eur' or 'tix'.
+
+        Returns:
+            float: The price at the given time or None if there is no price.
+        """
+        snapshot = self._snapshot_at(when)
+
+        if card_id not in self._numbers or snapshot < 0:
+            return None
+
+        value = self._card_values(card_id, PRICE_FIELDS.index(field), snapshot, snapshot)[0]
+        return _decode_price(value) if value is not None else None
+
+    def top_movers(self, start, end=None, field='usd', num=10, relative=False, falling=False):
+        """Returns the cards whose prices changed the most between two points in time. Only cards which have a price
+        at both points are considered.
+
+        Args:
+            start (datetime, int): The start time.
+            end (datetime, int): The end time. If not given, the latest snapshot is used.
+            field (str): The price field, either 'usd', 'usd_foil', 'eur' or 'tix'.
+            num (int): The maximum number of cards to return.
+            relative (bool): If True, the cards are ranked by relative change instead of absolute change.
+            falling (bool): If True, the cards whose prices dropped the most are returned instead.
+
+        Returns:
+            list[tuple]: A list of (card_id, old_price, new_price, change) tuples ordered by the change.
+        """
+        first = self._snapshot_at(start)
+        last = self._snapshot_at(end)
+        field_index = PRICE_FIELDS.index(field)
+
+        if first < 0 or last < 0:
+            return []
+
+        old_states = self._states_at(first)
+        new_states = self._states_at(last)
+
+        movers = []
+        for block, state in new_states.items():
+            old_state = old_states.get(block, {})
+
+            for offset, values in state.items():
+                old = old_state.get(offset, _NO_PRICES)[field_index]
+                new = values[field_index]
+
+                if not old or not new:
+                    continue
+
+                card_id = self._card_ids[block * BLOCK_SIZE + offset]
+
+                old, new = _decode_price(old), _decode_price(new)
+                change = round(new - old, 2)
+
+                if relative:
+                    change = change / old if old else 0
+
+                movers.append((card_id, old, new, change))
+
+        if falling:
+            return heapq.nsmallest(num, movers, key=lambda mover: mover[3])
+        else:
+            return heapq.nlargest(num, movers, key=lambda mover: mover[3])
+
+    def moving_average(self, card_id, window=7, field='usd', start=None, end=None):
+        """Returns the simple moving average of the price of a given card over the last 'window' snapshots for each
+        snapshot between 'start' and 'end'. Snapshots without a price are left out of the averages.
+
+        Args:
+            card_id (str): The id of the card.
+            window (int): The number of snapshots to average over.
+            field (str): The price field, either 'usd', 'usd_foil', 'eur' or 'tix'.
+            start (datetime, int): The start of the time range.
+            end (datetime, int): The end of the time range.
+
+        Returns:
+            list[tuple]: A list of (datetime, average price) tuples.
+        """
+        first, last = self._snapshot_range(start, end)
+
+        if card_id not in self._numbers or first > last:
+            return []
+
+        offset = max(0, first - window + 1)
+        values = self._card_values(card_id, PRICE_FIELDS.index(field), offset, last)
+
+        averages = []
+        for snapshot in range(first, last + 1):
+            window_values = [value for value in values[max(0, snapshot - window + 1 - offset):snapshot + 1 - offset]
+                             if value]
+            average = sum(_decode_price(value) for value in window_values) / len(window_values) \
+                if window_values else None
+            averages.append((datetime.datetime.fromtimestamp(self._timestamps[snapshot]), average))
+
+        return averages
+
+    def moving_averages(self, window=7, field='usd', when=None):
+        """Returns the simple moving averages of the prices of all the cards over the last 'window' snapshots at a
+        given time.
+
+        Args:
+            window (int): The number of snapshots to average over.
+            field (str): The price field, either 'usd', 'usd_foil', 'eur' or 'tix'.
+            when (datetime, int): The time. If not given, the latest snapshot is used.
+
+        Returns:
+            dict: A dictionary mapping card ids to their average prices. Cards without any price are left out.
+        """
+        last = self._snapshot_at(when)
+        first = max(0, last - window + 1)
+        field_index = PRICE_FIELDS.index(field)
+
+        if last < 0:
+            return {}
+
+        totals = {}
+        for _, states in self._replay(first, last):
+            for block, state in states.items():
+                for offset, values in state.items():
+                    if values[field_index]:
+                        total = totals.setdefault(block * BLOCK_SIZE + offset, [0, 0])
+                        total[0] += _decode_price(values[field_index])
+                        total[1] += 1
+
+        return {self._card_ids[number]: total / count for number, (total, count) in totals.items()}
+
+    def size(self):
+        """Returns the total size of the encoded price blocks in bytes."""
+        return sum(block.size for block in self._blocks.values())
+
+    def _replay(self, first, last, blocks=None):
+        """Yields the snapshot index and the prices of the cards for each snapshot between 'first' and 'last'
+        (inclusive). The prices are given as a dictionary of block indices mapped to dictionaries of card positions
+        mapped to encoded price values. The same dictionary is updated in place between the snapshots. If 'blocks' is
+        given, only the prices of the cards in those blocks are read."""
+        states = {}
+
+        for snapshot in range(first - first % CHECKPOINT_INTERVAL, last + 1):
+            if snapshot % CHECKPOINT_INTERVAL == 0:
+                states = {}
+
+            if blocks is None:
+                records = ((key - _block_key(snapshot, 0), record) for key, record in
+                           self._blocks.items(_block_key(snapshot, 0), _block_key(snapshot + 1, 0), excludemax=True))
+            else:
+                records = ((block, self._blocks.get(_block_key(snapshot, block))) for block in blocks)
+
+            for block, record in records:
+                if record is not None:
+                    record.apply(states.setdefault(block, {}))
+
+            if snapshot >= first:
+                yield snapshot, states
+
+    def _states_at(self, snapshot):
+        states = {}
+
+        for _, states in self._replay(snapshot, snapshot):
+            pass
+
+        return states
+
+    def _card_values(self, card_id, field_index, first, last):
+        block, offset = divmod(self._numbers[card_id], BLOCK_SIZE)
+        values = []
+
+        for _, states in self._replay(first, last, (block,)):
+            card_values = states.get(block, {}).get(offset)
+            values.append(card_values[field_index] if card_values is not None else None)
+
+        return values
+
+    def _snapshot_at(self, when):
+        if when is None:
+            return len(self._timestamps) - 1
+
+        return bisect.bisect_right(self._timestamps, _to_timestamp(when)) - 1
+
+    def _snapshot_range(self, start, end):
+        first = 0 if start is None else bisect.bisect_left(self._timestamps, _to_timestamp(start))
+        last = self._snapshot_at(end)
+
+        return first, last
@@ -0,0 +1,144 @@
+########################################################################################################################
+# Copyright © 2018 Esko-Kalervo Salaka.
+# All rights reserved.
+#
+#
+# Zope Public License (ZPL) Version 2.1
+#
+# A copyright notice accompanies this license document that identifies the
+# copyright holders.
+#
+# This license has been certified as open source. It has also been designated as
+# GPL compatible by the Free Software Foundation (FSF).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions in source code must retain the accompanying copyright
+# notice, this list of conditions, and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the accompanying copyright
+# notice, this list of conditions, and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Names of the copyright holders must not be used to endorse or promote
+# products derived from this software without prior written permission from the
+# copyright holders.
+#
+# 4. The right to distribute this software or to use it for any purpose does not
+# give you the right to use Servicemarks (sm) or Trademarks (tm) of the
+# copyright
+# holders. Use of them is covered by separate agreement with the copyright
+# holders.
+#
+# 5. If any files are modified, you must cause the modified files to carry
+# prominent notices stating that you changed the files and the date of any
+# change.
+#
+# Disclaimer
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY EXPRESSED
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# This software uses ZODB, a native object database for Python, which is a
+# copyright © by Zope Foundation and Contributors.
+#
+# This software uses Scryfall's rest-like API which is a copyright © by Scryfall LLC.
+#
+# This software uses rest-like API of magicthegathering.io which is a copyright © by Andrew Backes.
+#
+# This software uses the Python Imaging Library (PIL) which is a copyright © 1997-2011 by Secret Labs AB and
+# copyright © 1995-2011 by Fredrik Lundh
+#
+# All the graphical and literal information and data related to Magic: The Gathering which can be handled with this
+# software, such as card information and card images, is copyright of Wizards of the Coast LLC, a
+# Hasbro inc. subsidiary.
+#
+# This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
+# Wizards of the Coast.
+########################################################################################################################
+from persistent import Persistent
+from BTrees.OOBTree import OOBTree
+
+
+class RulingsIndex(Persistent):
+    """RulingsIndex is a persistent index of card rulings keyed by the 'oracle_id' of the cards. Since all the
+    printings of a card share the same oracle_id and rulings, each ruling is stored only once no matter how many
+    printings the card has. The rulings are stored in a BTree, so only the parts of the index that are actually looked
+    up are loaded from the database.
+
+    The Scryfall database keeps an index of all the rulings in self.root.scryfall_rulings of MtgDB, which is filled
+    from the Scryfall rulings bulk data. The rulings of Scryfall cards can be accessed simply with PCard.get_rulings.
+
+    Each ruling is a dictionary of the form:
+
+        {'source': 'wotc', 'published_at': '2004-10-04', 'comment': 'The ruling text...'}
+    """
+
+    def __init__(self):
+        self._rulings = OOBTree()
+        self.updated_at = None
+
+    def __len__(self):
+        return len(self._rulings)
+
+    def __contains__(self, oracle_id):
+        return oracle_id in self._rulings
+
+    def get(self, oracle_id):
+        """Returns the rulings of a card with the given oracle_id.
+
+        Args:
+            oracle_id (str): The oracle_id of the card.
+
+        Returns:
+            list[dict]: A list of the rulings of the card. The list is empty if the card has no rulings.
+        """
+        if oracle_id is None:
+            return []
+
+        return [dict(ruling) for ruling in self._rulings.get(oracle_id, ())]
+
+    def load(self, rulings_data, updated_at=None):
+        """Loads the given rulings into this index replacing the current rulings. Only the cards whose rulings have
+        changed are written in the database.
+
+        Args:
+            rulings_data (list[dict]): A list of ruling dictionaries from Scryfall rulings bulk data.
+            updated_at (str): The time when the rulings data was last updated.
+
+        Returns:
+            int: The number of cards whose rulings changed.
+        """
+        grouped = {}
+
+        for ruling in rulings_data:
+            grouped.setdefault(ruling['oracle_id'], []).append({'source': ruling.get('source'),
+                                                                 'published_at': ruling.get('published_at'),
+                                                                 'comment': ruling.get('comment')})
+
+        changed = 0
+
+        for oracle_id in [oracle_id for oracle_id in self._rulings.keys() if oracle_id not in grouped]:
+            del self._rulings[oracle_id]
+            changed += 1
+
+        for oracle_id, rulings in grouped.items():
+            rulings = tuple(rulings)
+
+            if self._rulings.get(oracle_id) != rulings:
+                self._rulings[oracle_id] = rulings
+                changed += 1
+
+        self.updated_at = updated_at
+
+        return changed
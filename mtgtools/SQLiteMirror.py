@@ -0,0 +1,484 @@
+########################################################################################################################
+# Copyright © 2018 Esko-Kalervo Salaka.
+# All rights reserved.
+#
+#
+# Zope Public License (ZPL) Version 2.1
+#
+# A copyright notice accompanies this license document that identifies the
+# copyright holders.
+#
+# This license has been certified as open source. It has also been designated as
+# GPL compatible by the Free Software Foundation (FSF).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions in source code must retain the accompanying copyright
+# notice, this list of conditions, and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the accompanying copyright
+# notice, this list of conditions, and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# 3. Names of the copyright holders must not be used to endorse or promote
+# products derived from this software without prior written permission from the
+# copyright holders.
+#
+# 4. The right to distribute this software or to use it for any purpose does not
+# give you the right to use Servicemarks (sm) or Trademarks (tm) of the
+# copyright
+# holders. Use of them is covered by separate agreement with the copyright
+# holders.
+#
+# 5. If any files are modified, you must cause the modified files to carry
+# prominent notices stating that you changed the files and the date of any
+# change.
+#
+# Disclaimer
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS ``AS IS'' AND ANY EXPRESSED
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+#
+# This software uses ZODB, a native object database for Python, which is a
+# copyright © by Zope Foundation and Contributors.
+#
+# This software uses Scryfall's rest-like API which is a copyright © by Scryfall LLC.
+#
+# This software uses rest-like API of magicthegathering.io which is a copyright © by Andrew Backes.
+#
+# This software uses the Python Imaging Library (PIL) which is a copyright © 1997-2011 by Secret Labs AB and
+# copyright © 1995-2011 by Fredrik Lundh
+#
+# All the graphical and literal information and data related to Magic: The Gathering which can be handled with this
+# software, such as card information and card images, is copyright of Wizards of the Coast LLC, a
+# Hasbro inc. subsidiary.
+#
+# This software is in no way endorsed or promoted by Scryfall, Zope Foundation, magicthegathering.io or
+# Wizards of the Coast.
+########################################################################################################################
+import json
+import sqlite3
+import threading
+import warnings
+
+from ZODB.utils import p64, u64
+from mtgtools.CardListView import CardListView
+from .util.history import changed_oids, tid_after
+
+# Scalar card attributes stored in their own indexable columns
+CARD_COLUMNS = (('id', 'TEXT PRIMARY KEY'), ('oracle_id', 'TEXT'), ('name', 'TEXT'), ('lang', 'TEXT'),
+                ('layout', 'TEXT'), ('mana_cost', 'TEXT'), ('cmc', 'REAL'), ('type_line', 'TEXT'),
+                ('oracle_text', 'TEXT'), ('flavor_text', 'TEXT'), ('power', 'TEXT'), ('toughness', 'TEXT'),
+                ('loyalty', 'TEXT'), ('power_num', 'REAL'), ('toughness_num', 'REAL'), ('loyalty_num', 'REAL'),
+                ('rarity', 'TEXT'), ('set', 'TEXT'), ('set_name', 'TEXT'), ('set_type', 'TEXT'), ('set_id', 'TEXT'),
+                ('collector_number', 'TEXT'), ('released_at', 'TEXT'), ('artist', 'TEXT'), ('border_color', 'TEXT'),
+                ('frame', 'TEXT'), ('watermark', 'TEXT'), ('edhrec_rank', 'INTEGER'), ('reserved', 'INTEGER'),
+                ('digital', 'INTEGER'), ('promo', 'INTEGER'), ('reprint', 'INTEGER'), ('full_art', 'INTEGER'),
+                ('oversized', 'INTEGER'), ('booster', 'INTEGER'), ('story_spotlight', 'INTEGER'))
+
+# Nested card attributes stored as json, which can be queried with the json functions of SQLite
+CARD_JSON_COLUMNS = ('colors', 'color_identity', 'color_indicator', 'keywords', 'produced_mana', 'games', 'finishes',
+                     'promo_types', 'frame_effects', 'multiverse_ids', 'card_faces', 'legalities', 'prices',
+                     'all_parts', 'image_uris', 'purchase_uris', 'related_uris')
+
+SET_COLUMNS = (('id', 'TEXT PRIMARY KEY'), ('code', 'TEXT'), ('name', 'TEXT'), ('set_type', 'TEXT'),
+               ('released_at', 'TEXT'), ('card_count', 'INTEGER'), ('block', 'TEXT'), ('block_code', 'TEXT'),
+               ('parent_set_code', 'TEXT'), ('digital', 'INTEGER'), ('foil_only', 'INTEGER'))
+
+INDEXED_COLUMNS = ('oracle_id', 'name', 'cmc', 'type_line', 'rarity', 'set', 'released_at', 'artist', 'lang',
+                   'power_num', 'toughness_num', 'edhrec_rank')
+
+FTS_COLUMNS = ('name', 'type_line', 'oracle_text', 'flavor_text')
+
+
+def _quote(column):
+    return '"{}"'.format(column)
+
+
+class SQLiteMirror:
+    """SQLiteMirror is a read-optimized copy of the Scryfall cards and sets of MtgDB in a local SQLite database. The
+    scalar attributes of the cards are stored in indexed columns, the nested attributes in json columns and the names
+    and texts of the cards in a FTS5 full text index, so the mirror can be queried quickly with SQL from any tool.
+
+    The mirror of MtgDB is refreshed incrementally after every Scryfall update, see MtgDB.refresh_sqlite_mirror. Only
+    the cards which have been changed since the previous refresh are written, which are found from the transactions
+    of the ZODB storage after the last refreshed one. The cards which are no longer in the catalog are deleted.
+
+    The cards of the mirror can be queried with 'where' and 'where_exactly' which work much like the ones of PCardList,
+    with 'search' for full text searches, or with plain SQL with 'execute'. The queries return PCards loaded from the
+    ZODB connection given to the mirror, or sqlite3.Row objects if 'rows' is enabled or there is no connection.
+
+    The SQL queries are thread-safe, as each thread uses its own SQLite connection. A ZODB connection must only be
+    used by one thread though, so threads other than the one owning the connection given to the mirror should load
+    the cards through their own connection by giving its root (eg. from MtgDB.open_connection) with 'root', or query
+    rows instead.
+
+    The tables are 'cards' with the columns in CARD_COLUMNS and CARD_JSON_COLUMNS plus the whole card as json in 'data',
+    'cards_fts' for the full text search and 'sets' with the columns in SET_COLUMNS plus the whole set in 'data'.
+
+    args:
+        path (str): A path to the SQLite database file. A new file is created if none exists.
+        connection (ZODB.Connection.Connection): A connection to the ZODB database to load query results from.
+    """
+
+    def __init__(self, path, connection=None):
+        self.path = str(path)
+        self.connection = connection
+        self._local = threading.local()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._create_tables()
+
+    def close(self):
+        """Closes the SQLite database of this thread."""
+        self._db.close()
+
+        if getattr(self._local, 'db', None) is not None:
+            self._local.db.close()
+            self._local.db = None
+
+    def refresh(self, root, storage=None, full=False):
+        """Refreshes the mirror to match the given database root. If the storage is given and supports iterating over
+        its transactions, only the cards changed in the transactions committed after the previous refresh are
+        written. Otherwise, or if 'full' is enabled, every card is compared with its mirrored revision.
+
+        Args:
+            root: The root of a MtgDB connection.
+            storage: The ZODB storage of the database.
+            full (bool): If enabled, all the cards are checked.
+
+        Returns:
+            int: The number of cards written in the mirror.
+        """
+        last_tid = self._get_meta('last_tid')
+        tid = storage.lastTransaction() if storage is not None else None
+
+        if tid is not None and last_tid == tid.hex() and not full:
+            return 0
+
+        changed = None
+
+        if storage is not None and last_tid and not full:
+            changed = self._changed_cards(root, storage, bytes.fromhex(last_tid))
+
+        with self._db:
+            if changed is None:
+                written = self._refresh_all_cards(root.scryfall_cards)
+            else:
+                changed, removed_oids = changed
+
+                # The removed cards are deleted first, since a card may have been replaced with a new record
+                for oid in removed_oids:
+                    self._db.execute('DELETE FROM cards WHERE oid = ?', (oid,))
+
+                written = 0
+                for card in changed:
+                    self._write_card(card)
+                    written += 1
+
+            self._refresh_sets(root.scryfall_sets)
+
+            if tid is not None:
+                self._set_meta('last_tid', tid.hex())
+
+        return written
+
+    def where(self, invert=False, rows=False, root=None, **kwargs):
+        """Returns the cards for which any of the given keyword arguments match partly or completely with the
+        attributes of the cards in the mirror. The matching works like in PCardList.where, except that the faces of
+        the cards are not searched: strings match case-insensitively as substrings, lists match if any of the
+        elements match and numbers match if the argument is larger or equal to the attribute.
+
+        Args:
+            invert (bool): If True, the cards NOT matching the arguments are returned.
+            rows (bool): If True, sqlite3.Row objects are returned instead of cards.
+            root: The root of a ZODB connection to load the cards through, eg. from MtgDB.open_connection. By
+                default the connection given to the mirror is used, which only the thread owning it may use.
+            **kwargs: Arguments to match with the attributes of the cards.
+
+        Returns:
+            CardListView: A list of the matching cards, or a list of rows if 'rows' is enabled.
+        """
+        clauses, params = self._clauses(kwargs, exactly=False)
+        condition = ' OR '.join(clauses) or '1'
+
+        return self._select(condition, params, invert, rows, root)
+
+    def where_exactly(self, invert=False, rows=False, root=None, **kwargs):
+        """Returns the cards for which all the given keyword arguments match completely with the attributes of the
+        cards in the mirror. The matching works like in PCardList.where_exactly, except that the faces of the cards
+        are not searched.
+
+        Args:
+            invert (bool): If True, the cards NOT matching the arguments are returned.
+            rows (bool): If True, sqlite3.Row objects are returned instead of cards.
+            root: The root of a ZODB connection to load the cards through, eg. from MtgDB.open_connection. By
+                default the connection given to the mirror is used, which only the thread owning it may use.
+            **kwargs: Arguments to match with the attributes of the cards.
+
+        Returns:
+            CardListView: A list of the matching cards, or a list of rows if 'rows' is enabled.
+        """
+        clauses, params = self._clauses(kwargs, exactly=True)
+        condition = ' AND '.join(clauses) or '1'
+
+        return self._select(condition, params, invert, rows, root)
+
+    def search(self, query, limit=None, rows=False, root=None):
+        """Returns the cards matching a full text search over the names, types, oracle texts and flavor texts of the
+        cards, ordered by relevance. The query uses the SQLite FTS5 syntax, eg. 'draw AND name:mongrel'.
+
+        Args:
+            query (str): A full text search query.
+            limit (int): The maximum number of cards to return.
+            rows (bool): If True, sqlite3.Row objects are returned instead of cards.
+            root: The root of a ZODB connection to load the cards through, eg. from MtgDB.open_connection. By
+                default the connection given to the mirror is used, which only the thread owning it may use.
+
+        Returns:
+            CardListView: A list of the matching cards, or a list of rows if 'rows' is enabled.
+        """
+        sql = 'SELECT cards.* FROM cards_fts JOIN cards ON cards.rowid = cards_fts.rowid ' \
+              'WHERE cards_fts MATCH ? ORDER BY rank'
+        params = [query]
+
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        return self._results(self.execute(sql, params), rows, root)
+
+    def execute(self, sql, params=()):
+        """Executes a read-only SQL query in the mirror and returns the resulting rows. Each thread uses its own
+        read-only connection to the SQLite database.
+
+        Args:
+            sql (str): An SQL query.
+            params (tuple, dict): The parameters of the query.
+
+        Returns:
+            list[sqlite3.Row]: The resulting rows.
+        """
+        db = getattr(self._local, 'db', None)
+
+        if db is None:
+            db = sqlite3.connect('file:{}?mode=ro'.format(self.path), uri=True)
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+
+        return db.execute(sql, params).fetchall()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM cards').fetchone()[0]
+
+    def _create_tables(self):
+        card_columns = ', '.join('{} {}'.format(_quote(name), kind) for name, kind in CARD_COLUMNS)
+        json_columns = ', '.join('{} TEXT'.format(_quote(name)) for name in CARD_JSON_COLUMNS)
+        set_columns = ', '.join('{} {}'.format(_quote(name), kind) for name, kind in SET_COLUMNS)
+        fts_columns = ', '.join(_quote(name) for name in FTS_COLUMNS)
+        new_fts_values = ', '.join('new.{}'.format(_quote(name)) for name in FTS_COLUMNS)
+        old_fts_values = ', '.join('old.{}'.format(_quote(name)) for name in FTS_COLUMNS)
+
+        with self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS cards ({}, {}, data TEXT, oid INTEGER, extras_oid INTEGER, '
+                             'serial TEXT)'.format(card_columns, json_columns))
+            self._db.execute('CREATE TABLE IF NOT EXISTS sets ({}, data TEXT, serial TEXT)'.format(set_columns))
+
+            # Text columns are compared case-insensitively, so their indexes must be too
+            column_types = dict(CARD_COLUMNS)
+            for column in INDEXED_COLUMNS:
+                collation = ' COLLATE NOCASE' if column_types[column] == 'TEXT' else ''
+                self._db.execute('CREATE INDEX IF NOT EXISTS cards_{0} ON cards ({1}{2})'.format(
+                    column, _quote(column), collation))
+
+            self._db.execute('CREATE INDEX IF NOT EXISTS cards_oid ON cards (oid)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS cards_extras_oid ON cards (extras_oid)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS sets_code ON sets (code)')
+
+            # The full text index is kept in sync with the cards table by triggers
+            self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5({}, content='cards', "
+                             "content_rowid='rowid')".format(fts_columns))
+            self._db.execute('CREATE TRIGGER IF NOT EXISTS cards_ai AFTER INSERT ON cards BEGIN '
+                             'INSERT INTO cards_fts(rowid, {0}) VALUES (new.rowid, {1}); END'
+                             .format(fts_columns, new_fts_values))
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS cards_ad AFTER DELETE ON cards BEGIN "
+                             "INSERT INTO cards_fts(cards_fts, rowid, {0}) VALUES ('delete', old.rowid, {1}); END"
+                             .format(fts_columns, old_fts_values))
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS cards_au AFTER UPDATE ON cards BEGIN "
+                             "INSERT INTO cards_fts(cards_fts, rowid, {0}) VALUES ('delete', old.rowid, {1}); "
+                             "INSERT INTO cards_fts(rowid, {0}) VALUES (new.rowid, {2}); END"
+                             .format(fts_columns, old_fts_values, new_fts_values))
+
+    def _get_meta(self, key):
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def _changed_cards(self, root, storage, last_tid):
+        # Returns the cards of the catalog which have been changed after the given transaction or which are not
+        # mirrored yet, and the oids of the mirrored cards which are no longer in the catalog. Returns None if the
+        # storage can not tell.
+        try:
+            oids = changed_oids(storage, tid_after(last_tid))
+        except Exception:
+            return None
+
+        if oids is None:
+            return None
+
+        card_oids = oids['PCard']
+
+        for extras_oid in oids['PCardExtras']:
+            row = self._db.execute('SELECT oid FROM cards WHERE extras_oid = ?', (extras_oid,)).fetchone()
+            if row:
+                card_oids.add(row[0])
+
+        connection = root.scryfall_cards._p_jar or self.connection
+
+        if connection is None:
+            return None
+
+        # The oids of the cards are known without loading the cards themselves
+        catalog_oids = set(u64(card._p_oid) for card in root.scryfall_cards if card._p_oid is not None)
+        mirrored_oids = set(oid for oid, in self._db.execute('SELECT oid FROM cards WHERE oid IS NOT NULL'))
+        card_oids = (card_oids & catalog_oids) | (catalog_oids - mirrored_oids)
+
+        cards = []
+        for oid in sorted(card_oids):
+            card = connection.get(p64(oid))
+
+            if card.api_type == 'scryfall':
+                cards.append(card)
+
+        return cards, mirrored_oids - catalog_oids
+
+    def _refresh_all_cards(self, cards):
+        serials = dict(self._db.execute('SELECT id, serial FROM cards'))
+        written = 0
+
+        for card in cards:
+            serial = self._serial(card)
+
+            if serials.pop(card.id, None) != serial:
+                self._write_card(card, serial)
+                written += 1
+
+        for card_id in serials:
+            self._db.execute('DELETE FROM cards WHERE id = ?', (card_id,))
+
+        return written
+
+    def _refresh_sets(self, sets):
+        serials = dict(self._db.execute('SELECT id, serial FROM sets'))
+
+        for pset in sets:
+            pset._p_activate()
+            serial = pset._p_serial.hex()
+
+            if serials.pop(pset.id, None) != serial:
+                data = dict((key, value) for key, value in pset.__dict__.items()
+                            if not key.startswith('_') and key not in ('creation_date',))
+                values = [getattr(pset, name, None) for name, _ in SET_COLUMNS]
+                columns = [name for name, _ in SET_COLUMNS] + ['data', 'serial']
+
+                self._db.execute('INSERT OR REPLACE INTO sets ({}) VALUES ({})'.format(
+                    ', '.join(_quote(column) for column in columns), ', '.join('?' * len(columns))),
+                    values + [json.dumps(data, default=str), serial])
+
+        for set_id in serials:
+            self._db.execute('DELETE FROM sets WHERE id = ?', (set_id,))
+
+    @staticmethod
+    def _serial(card):
+        card._p_activate()
+        serial = card._p_serial.hex()
+
+        if card._extras is not None:
+            card._extras._p_activate()
+            serial += card._extras._p_serial.hex()
+
+        return serial
+
+    def _write_card(self, card, serial=None):
+        serial = serial or self._serial(card)
+        values = [getattr(card, name) for name, _ in CARD_COLUMNS]
+        values += [json.dumps(getattr(card, name)) if getattr(card, name) is not None else None
+                   for name in CARD_JSON_COLUMNS]
+        values += [json.dumps(card.as_dict(), default=str),
+                   u64(card._p_oid) if card._p_oid else None,
+                   u64(card._extras._p_oid) if card._extras is not None and card._extras._p_oid else None,
+                   serial]
+        columns = [name for name, _ in CARD_COLUMNS] + list(CARD_JSON_COLUMNS) + \
+                  ['data', 'oid', 'extras_oid', 'serial']
+
+        # An upsert keeps the rowid of the card so that the triggers can update the full text index
+        updates = ', '.join('{0} = excluded.{0}'.format(_quote(column)) for column in columns[1:])
+        self._db.execute('INSERT INTO cards ({}) VALUES ({}) ON CONFLICT(id) DO UPDATE SET {}'.format(
+            ', '.join(_quote(column) for column in columns), ', '.join('?' * len(columns)), updates), values)
+
+    def _clauses(self, kwargs, exactly):
+        clauses = []
+        params = []
+        columns = set(name for name, _ in CARD_COLUMNS)
+
+        for key, val in kwargs.items():
+            if val is None:
+                msg = 'Ignoring an empty or null value for keyword {}. Null or empty values are not supported.'
+                warnings.warn(msg.format(key))
+            elif key in CARD_JSON_COLUMNS and isinstance(val, (list, tuple)):
+                elements = ', '.join('?' * len(val))
+                exists = 'EXISTS (SELECT 1 FROM json_each({}) WHERE value IN ({}))'.format(_quote(key), elements)
+
+                if exactly:
+                    clauses.append('({} AND json_array_length({}) = ? AND NOT EXISTS (SELECT 1 FROM json_each({}) '
+                                   'WHERE value NOT IN ({})))'.format(exists, _quote(key), _quote(key), elements))
+                    params.extend(list(val) + [len(set(val))] + list(val))
+                else:
+                    clauses.append(exists)
+                    params.extend(val)
+            elif key not in columns:
+                msg = 'Ignoring an unrecognized keyword {}. Only the columns of the mirror can be searched.'
+                warnings.warn(msg.format(key))
+            elif isinstance(val, str):
+                if exactly:
+                    clauses.append('{} = ? COLLATE NOCASE'.format(_quote(key)))
+                    params.append(val)
+                else:
+                    clauses.append("{} LIKE ? ESCAPE '\\'".format(_quote(key)))
+                    params.append('%{}%'.format(val.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')))
+            elif isinstance(val, bool) or exactly:
+                clauses.append('{} = ?'.format(_quote(key)))
+                params.append(val)
+            else:
+                clauses.append('{} <= ?'.format(_quote(key)))
+                params.append(val)
+
+        return clauses, params
+
+    def _select(self, condition, params, invert, rows, root):
+        if invert:
+            # Attributes which are null never match, so their cards are included in inverted results
+            condition = 'NOT coalesce(({}), 0)'.format(condition)
+
+        return self._results(self.execute('SELECT * FROM cards WHERE {}'.format(condition), params), rows, root)
+
+    def _results(self, result_rows, rows, root):
+        connection = root.scryfall_cards._p_jar if root is not None else self.connection
+
+        if rows or connection is None:
+            return result_rows
+
+        return CardListView.wrap([connection.get(p64(row['oid'])) for row in result_rows])
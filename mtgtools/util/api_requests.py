@@ -60,7 +60,7 @@ def process_scryfall_sets(current_sets):
         if set_response_dict['code'] in current_set_codes:
             current_sets.where_exactly(code=set_response_dict['code'])[0].update(set_response_dict)
         else:
-            current_sets.append(PSet(set_response_dict))
+            current_sets.append(PSet(set_response_dict, btree=True))
 
     obsolete_sets = PSetList()
     api_set_codes = [set_response_dict['code'] for set_response_dict in set_response_dicts]
@@ -93,7 +93,7 @@ def process_mtgio_sets(sets):
         if set_response_dict['code'] in current_set_codes:
             sets.where_exactly(code=set_response_dict['code'])[0].update(set_response_dict)
         else:
-            sets.append(PSet(set_response_dict))
+            sets.append(PSet(set_response_dict, btree=True))
 
     obsolete_sets = PSetList()
     api_set_codes = [set_response_dict['code'] for set_response_dict in set_response_dicts]
@@ -167,7 +167,7 @@ async def process_cards(sets, cards, card_page_uris, data_identifier, verbose=Tr
                     if pset is not None:
                         pset._cards.append(card)
                 else:
-                    card_index[card.id].update(card.__dict__)
+                    card_index[card.id].update(card.as_dict())
 
             processed += 1
             if verbose:
@@ -0,0 +1,156 @@
+import threading
+
+from collections import OrderedDict
+
+scalar_types = {str, int, float, bool, type(None)}
+
+
+def freeze(value):
+    """Returns a hashable form of a query argument, or raises TypeError if there is none. Lists, tuples and sets
+    become frozensets since the card attributes are matched against them as sets, dictionaries become sorted tuples of
+    their items and the type of the other values is kept so that eg. 1 and True are not confused.
+    """
+    value_type = type(value)
+
+    if value_type in scalar_types:
+        return value_type, value
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        return frozenset(freeze(item) for item in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+
+    hash(value)
+    return value_type, value
+
+
+def query_key(*parts):
+    """Returns a normalized cache key of a query, eg. of the name and the arguments of a query method, or None if some
+    part can not be hashed.
+
+    Args:
+        *parts: The parts of the query.
+
+    Returns:
+        tuple: The cache key or None.
+    """
+    try:
+        return tuple(map(freeze, parts))
+    except TypeError:
+        return None
+
+
+def snapshot_id(connection):
+    """Returns an id of the snapshot of the database a ZODB connection reads, or None if there is no connection or the
+    snapshot can not be told. The id changes when the connection starts seeing the changes of newer transactions,
+    which happens only between its own transactions.
+
+    Args:
+        connection (ZODB.Connection.Connection): The connection or None.
+
+    Returns:
+        bytes: The id of the snapshot or None.
+    """
+    # ZODB has no public API for this. The MVCC storage of a connection reads the objects as of the transaction
+    # preceding '_start'.
+    return getattr(getattr(connection, '_storage', None), '_start', None)
+
+
+def has_changes(connection):
+    """Returns True if any objects have been changed or added through a ZODB connection in its current transaction,
+    or if it can not be told."""
+    registered = getattr(connection, '_registered_objects', None)
+    added = getattr(connection, '_added', None)
+
+    return registered is None or added is None or bool(registered) or bool(added)
+
+
+def reads_snapshot(connection):
+    """Returns True if the objects read through a ZODB connection are known to be exactly those of its snapshot (see
+    snapshot_id), ie. nothing has been changed through the connection in its current transaction."""
+    return connection is not None and snapshot_id(connection) is not None and not has_changes(connection)
+
+
+class QueryCache:
+    """A least recently used cache of the cards of query results. The cache is bound by the number of results and by
+    the total number of card references in them, and it keeps count of its hits, misses, evictions and invalidations.
+    Results with more cards than the whole cache allows are not cached.
+
+    The cache remembers the id of the database snapshot the results were computed from (see snapshot_id), and
+    'validate' clears the cache when it changes.
+
+    Args:
+        max_entries (int): The maximum number of results to keep.
+        max_cards (int): The maximum number of card references to keep in all the results together.
+    """
+
+    def __init__(self, max_entries=128, max_cards=100000):
+        self.max_entries = max_entries
+        self.max_cards = max_cards
+        self.snapshot = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._results = OrderedDict()
+        self._cards = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key):
+        """Returns the cached cards of a given key and marks them as the most recently used, or None if the key is not
+        cached."""
+        with self._lock:
+            cards = self._results.get(key)
+
+            if cards is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._results.move_to_end(key)
+
+            return cards
+
+    def put(self, key, cards):
+        """Caches the cards of a given key, evicting the least recently used results if the cache gets too big."""
+        if len(cards) > self.max_cards or self.max_entries <= 0:
+            return
+
+        with self._lock:
+            old = self._results.pop(key, None)
+            self._cards -= 0 if old is None else len(old)
+            self._results[key] = cards
+            self._cards += len(cards)
+
+            while len(self._results) > self.max_entries or self._cards > self.max_cards:
+                _, evicted = self._results.popitem(last=False)
+                self._cards -= len(evicted)
+                self.evictions += 1
+
+    def validate(self, snapshot):
+        """Clears the cache if a given snapshot id differs from the one the cached results were computed from."""
+        if snapshot != self.snapshot:
+            self.clear()
+            self.snapshot = snapshot
+
+    def clear(self):
+        """Removes all the cached results."""
+        with self._lock:
+            if self._results:
+                self.invalidations += 1
+
+            self._results.clear()
+            self._cards = 0
+
+    def stats(self):
+        """Returns the statistics of the cache as a dictionary.
+
+        Returns:
+            dict: The number of hits, misses, evictions and invalidations, the number of cached results ('entries')
+                and card references ('cards'), and the limits of the cache.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'entries': len(self._results), 'cards': self._cards,
+                    'max_entries': self.max_entries, 'max_cards': self.max_cards}
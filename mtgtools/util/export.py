@@ -0,0 +1,183 @@
+import gzip
+import io
+import json
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def card_record(card, fields=None):
+    """Returns a dictionary of the given attributes of a card for exporting. If no fields are given, all the present
+    attributes of the card are included."""
+    if fields is None:
+        return dict((key, value) for key, value in card.as_dict().items() if value is not None)
+
+    return dict((field, getattr(card, field, None)) for field in fields)
+
+
+def set_record(pset):
+    """Returns a dictionary of the attributes of a set without its cards for exporting."""
+    pset._p_activate()
+
+    return dict((key, value) for key, value in pset.__dict__.items()
+                if not key.startswith('_') and key != 'creation_date' and value is not None and
+                (key != 'id' or isinstance(value, str)))
+
+
+def open_output(file, compress=None, compresslevel=6):
+    """Opens a text stream for writing newline-delimited json. Returns the stream and whether it should be closed
+    after writing.
+
+    Args:
+        file: A path or a file-like object. File-like objects are written as text unless 'compress' is enabled, in
+            which case they have to be binary.
+        compress (bool): If enabled, the output is gzip-compressed. By default paths ending with '.gz' are compressed.
+        compresslevel (int): The gzip compression level from 1 (fastest) to 9 (smallest).
+    """
+    if hasattr(file, 'write'):
+        if compress:
+            return io.TextIOWrapper(gzip.GzipFile(fileobj=file, mode='wb', compresslevel=compresslevel),
+                                    encoding='utf-8', newline='\n'), True
+
+        return file, False
+
+    if compress or (compress is None and str(file).endswith('.gz')):
+        return gzip.open(file, 'wt', compresslevel=compresslevel, encoding='utf-8', newline='\n'), True
+
+    return open(file, 'w', encoding='utf-8', newline='\n'), True
+
+
+def write_ndjson(records, file, compress=None, chunk_size=1000, compresslevel=6):
+    """Writes dictionaries as newline-delimited json (one json document per line) to a file. The lines are encoded
+    and written in chunks of 'chunk_size' so that only one chunk is kept in memory at a time.
+
+    Args:
+        records: An iterable of dictionaries. Persistent objects loaded while producing them can be released from the
+            cache between the chunks, see 'write_cards'.
+        file: A path or a file-like object, see 'open_output'.
+        compress (bool): If enabled, the output is gzip-compressed.
+        chunk_size (int): The number of lines written at a time.
+        compresslevel (int): The gzip compression level.
+
+    Returns:
+        int: The number of lines written.
+    """
+    output, close = open_output(file, compress=compress, compresslevel=compresslevel)
+    written = 0
+    lines = []
+
+    try:
+        for record in records:
+            lines.append(_encoder.encode(record))
+
+            if len(lines) >= chunk_size:
+                output.write('\n'.join(lines) + '\n')
+                written += len(lines)
+                lines = []
+
+        if lines:
+            output.write('\n'.join(lines) + '\n')
+            written += len(lines)
+    finally:
+        if close:
+            output.close()
+        elif hasattr(output, 'flush'):
+            output.flush()
+
+    return written
+
+
+def card_records(cards, fields=None, chunk_size=1000):
+    """Yields the export records of the given cards. Every 'chunk_size' cards the object cache of the connection of
+    the cards is garbage collected so that exporting a large database does not keep every card in memory."""
+    for i, card in enumerate(cards, 1):
+        yield card_record(card, fields)
+
+        if i % chunk_size == 0 and card._p_jar is not None:
+            card._p_jar.cacheGC()
+
+
+def write_cards(cards, file, fields=None, compress=None, chunk_size=1000, compresslevel=6):
+    """Writes cards as newline-delimited json to a file. See PCardList.to_ndjson."""
+    return write_ndjson(card_records(cards, fields, chunk_size), file, compress=compress, chunk_size=chunk_size,
+                        compresslevel=compresslevel)
+
+
+def open_input(path):
+    """Opens a file for reading text, decompressing it if it is gzip-compressed."""
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+
+    if compressed:
+        return gzip.open(path, 'rt', encoding='utf-8')
+
+    return open(path, 'r', encoding='utf-8')
+
+
+def _is_list_document(document):
+    # Scryfall lists have the objects in 'data' and the json of PCardList and PSetList in 'cards' or 'sets'
+    return isinstance(document, list) or any(isinstance(document.get(key), list) for key in ('data', 'cards', 'sets'))
+
+
+def _list_items(document):
+    if isinstance(document, list):
+        return document
+
+    for key in ('data', 'cards', 'sets'):
+        if isinstance(document.get(key), list):
+            return document[key]
+
+    return [document]
+
+
+def read_records(path):
+    """Yields the json objects (eg. cards or sets) of a file one by one. The file can be newline-delimited json, a
+    Scryfall bulk data file or any json document with the objects in a list, either as is or in 'data', 'cards' or
+    'sets' like the responses of Scryfall or the json of PCardList. Files can be gzip-compressed.
+
+    Newline-delimited json and Scryfall bulk data files, which have one object per line in a json array, are read in
+    constant memory. Other json documents are read completely in memory.
+
+    Args:
+        path (str): The path to the file.
+    """
+    with open_input(path) as f:
+        first = f.readline().strip()
+
+        try:
+            document = json.loads(first) if first not in ('', '[') else None
+        except ValueError:
+            document = None
+
+        if isinstance(document, (dict, list)):
+            if _is_list_document(document):
+                yield from _list_items(document)
+                return
+
+            yield document
+
+            for line in f:
+                line = line.strip()
+
+                if line:
+                    yield json.loads(line)
+            return
+
+        if first == '[':
+            yielded = 0
+
+            try:
+                for line in f:
+                    line = line.strip().rstrip(',')
+
+                    if line and line != ']':
+                        record = json.loads(line)
+                        yielded += 1
+                        yield record
+                return
+            except ValueError:
+                # The objects are not one per line, so the whole document has to be read
+                if yielded:
+                    raise
+
+        f.seek(0)
+        yield from _list_items(json.load(f))
@@ -0,0 +1,108 @@
+import heapq
+import unicodedata
+
+from itertools import groupby
+from operator import itemgetter
+
+
+def fold(text):
+    """Returns a form of a name for fuzzy matching: in lower case and without accents, eg. 'Lim-Dûl' -> 'lim-dul'."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def trigrams(text):
+    """Returns the set of the trigrams of a name. The name is folded and padded with spaces so that the beginning
+    and the end of the name have trigrams of their own."""
+    padded = '  {} '.format(fold(text))
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, max_distance=None):
+    """Returns the number of single character insertions, deletions, substitutions and transpositions of adjacent
+    characters needed to turn one string into another. If 'max_distance' is given, the computation stops as soon as
+    the distance is known to exceed it, and max_distance + 1 is returned."""
+    if len(a) < len(b):
+        a, b = b, a
+
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+
+    previous2 = None
+    previous = list(range(len(b) + 1))
+
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+
+        previous2, previous = previous, current
+
+    return previous[-1]
+
+
+def shared_trigrams(query, names):
+    """Returns a dictionary of the given names mapped to the number of trigrams they share with a query, leaving out
+    the names which share none."""
+    query_grams = trigrams(query)
+    shared = {}
+
+    for name in names:
+        count = len(query_grams & trigrams(name))
+
+        if count:
+            shared[name] = count
+
+    return shared
+
+
+def closest(query, shared, k=5, max_distance=None):
+    """Ranks names by their similarity to a query. The names are ranked by the Dice coefficient of their trigrams and
+    the trigrams of the query, so that a part of a long name (eg. 'lim dul' of 'Lim-Dûl the Necromancer') matches it
+    better than a short name of similar length. The names with equal coefficients are ranked by their edit distance
+    to the query and by the name.
+
+    Args:
+        query (str): The name to match.
+        shared (dict): The candidate names mapped to the number of trigrams they share with the query.
+        k (int): The number of names to return.
+        max_distance (int): The largest edit distance of the returned names. By default there is no limit.
+
+    Returns:
+        list[str]: At most k names, the closest first.
+    """
+    query_size = len(trigrams(query))
+    query = fold(query)
+    size = len(query) + 1
+
+    # The names are first shortlisted with the number of their trigrams estimated by their length. The names break
+    # the ties so that the shortlist does not depend on the order of the candidates.
+    shortlist = heapq.nlargest(max(10 * k, 50), shared.items(),
+                               key=lambda item: (item[1] / (size + len(item[0]) + 1), item[0].lower()))
+    scored = sorted(((2 * count / (query_size + len(trigrams(name))), name) for name, count in shortlist),
+                    key=itemgetter(0), reverse=True)
+
+    # The edit distances are needed only for the ties and the limit, so they are measured only until k names are found
+    ranked = []
+    for _, names in groupby(scored, key=itemgetter(0)):
+        if len(ranked) >= k:
+            break
+
+        tied = []
+        for _, name in names:
+            distance = edit_distance(query, fold(name), max_distance)
+
+            if max_distance is None or distance <= max_distance:
+                tied.append((distance, name.lower(), name))
+
+        ranked.extend(sorted(tied))
+
+    return [name for _, _, name in ranked[:k]]
@@ -0,0 +1,54 @@
+import datetime
+import time
+
+from ZODB.utils import p64, u64, get_pickle_metadata
+from ZODB.TimeStamp import TimeStamp
+
+
+def tid_after(tid):
+    """Returns the smallest transaction id after a given one."""
+    return p64(u64(tid) + 1)
+
+
+def tid_from_time(when):
+    """Returns the transaction id corresponding to a given time (datetime or unix timestamp). Transactions committed
+    after the time have larger ids. Naive datetimes are in local time."""
+    if isinstance(when, datetime.datetime):
+        when = when.timestamp()
+
+    utc = time.gmtime(when)
+
+    return TimeStamp(utc.tm_year, utc.tm_mon, utc.tm_mday, utc.tm_hour, utc.tm_min, utc.tm_sec + when % 1).raw()
+
+
+def changed_oids(storage, start=None, stop=None, class_names=('PCard', 'PCardExtras')):
+    """Returns the oids of the objects of the given classes whose records were written in the transactions between
+    'start' and 'stop' (inclusive) of a storage. Only the transaction records are read, so the time taken depends on
+    the number of changes and not on the size of the database.
+
+    Args:
+        storage: A ZODB storage which supports iterating over its transactions.
+        start (bytes): The first transaction id. By default the transactions are read from the beginning.
+        stop (bytes): The last transaction id. By default the transactions are read to the end.
+        class_names (tuple): The names of the classes whose records are looked for.
+
+    Returns:
+        dict: A dictionary of sets of integer oids by the class names or None if the storage can not iterate over its
+            transactions.
+    """
+    if not hasattr(storage, 'iterator'):
+        return None
+
+    oids = dict((class_name, set()) for class_name in class_names)
+
+    for transaction_record in storage.iterator(start, stop):
+        for record in transaction_record:
+            if record.data is None:
+                continue
+
+            class_name = get_pickle_metadata(record.data)[1]
+
+            if class_name in oids:
+                oids[class_name].add(u64(record.oid))
+
+    return oids
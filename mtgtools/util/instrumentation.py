@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+
+from zope.interface import directlyProvides, providedBy
+
+COUNTERS = ('loads', 'load_bytes', 'load_seconds', 'stores', 'store_bytes', 'commits', 'commit_seconds', 'packs',
+            'pack_seconds')
+
+
+class InstrumentedStorage:
+    """A thin proxy around a ZODB storage which counts the object loads and the bytes read, the objects stored and the
+    bytes written, the commits and the packs, and the time spent on each. Everything else is passed to the wrapped
+    storage as it is, so the proxy can be given to ZODB.DB in place of the storage.
+
+    Only loads which actually reach the storage are counted, that is, the misses of the object caches of the
+    connections.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+        self._lock = threading.Lock()
+        self._commit_starts = {}
+        self.last_pack_seconds = None
+        self.reset()
+
+        directlyProvides(self, providedBy(storage))
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+    def __len__(self):
+        return len(self._storage)
+
+    def reset(self):
+        """Resets all the counters to zero."""
+        with self._lock:
+            self._counters = dict.fromkeys(COUNTERS, 0)
+
+    def counters(self, reset=False):
+        """Returns a copy of the counters as a dictionary.
+
+        Args:
+            reset (bool): If enabled, the counters are reset after reading them.
+
+        Returns:
+            dict: The counters.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+
+            if reset:
+                self._counters = dict.fromkeys(COUNTERS, 0)
+
+        return counters
+
+    def _add(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self._counters[name] += amount
+
+    def _loaded(self, result, started):
+        self._add(loads=1, load_bytes=len(result[0]) if result else 0, load_seconds=time.perf_counter() - started)
+        return result
+
+    def load(self, oid, version=''):
+        started = time.perf_counter()
+        return self._loaded(self._storage.load(oid, version), started)
+
+    def loadBefore(self, oid, tid):
+        started = time.perf_counter()
+        return self._loaded(self._storage.loadBefore(oid, tid), started)
+
+    def loadSerial(self, oid, serial):
+        started = time.perf_counter()
+        data = self._storage.loadSerial(oid, serial)
+        self._add(loads=1, load_bytes=len(data), load_seconds=time.perf_counter() - started)
+        return data
+
+    def store(self, oid, serial, data, version, transaction):
+        self._add(stores=1, store_bytes=len(data))
+        return self._storage.store(oid, serial, data, version, transaction)
+
+    def tpc_begin(self, transaction, *args):
+        self._commit_starts[id(transaction)] = time.perf_counter()
+        return self._storage.tpc_begin(transaction, *args)
+
+    def tpc_finish(self, transaction, *args):
+        result = self._storage.tpc_finish(transaction, *args)
+        started = self._commit_starts.pop(id(transaction), None)
+        self._add(commits=1, commit_seconds=time.perf_counter() - started if started is not None else 0)
+        return result
+
+    def tpc_abort(self, transaction, *args):
+        self._commit_starts.pop(id(transaction), None)
+        return self._storage.tpc_abort(transaction, *args)
+
+    def pack(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = self._storage.pack(*args, **kwargs)
+        self.last_pack_seconds = time.perf_counter() - started
+        self._add(packs=1, pack_seconds=self.last_pack_seconds)
+        return result
+
+
+def prometheus_text(metrics, prefix='mtgtools_'):
+    """Formats metrics in the Prometheus text exposition format.
+
+    Args:
+        metrics (list[tuple]): The metrics as (name, type, help, value) tuples. The value is either a number or a list
+            of (labels, number) tuples where the labels are a dictionary.
+        prefix (str): A prefix added to the names of the metrics.
+
+    Returns:
+        str: The formatted metrics.
+    """
+    lines = []
+
+    for name, metric_type, help_text, value in metrics:
+        name = prefix + name
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+
+        samples = value if isinstance(value, list) else [({}, value)]
+        for labels, sample in samples:
+            label_str = ','.join('{}="{}"'.format(key, str(label).replace('\\', '\\\\').replace('"', '\\"'))
+                                 for key, label in sorted(labels.items()))
+            lines.append('{}{} {}'.format(name, '{' + label_str + '}' if label_str else '', float(sample)))
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, metrics, prefix='mtgtools_'):
+    """Writes metrics in a Prometheus text file, eg. for the textfile collector of the node exporter. The file is
+    replaced atomically so that the collector never reads a partially written file.
+
+    Args:
+        path (str): The path of the file.
+        metrics (list[tuple]): The metrics as (name, type, help, value) tuples. See prometheus_text.
+        prefix (str): A prefix added to the names of the metrics.
+    """
+    path = str(path)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(prometheus_text(metrics, prefix))
+
+    os.replace(temp_path, path)
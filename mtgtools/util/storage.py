@@ -0,0 +1,80 @@
+import re
+
+from urllib.parse import urlparse, parse_qsl, unquote
+
+size_units = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2, 'G': 1024 ** 3, 'GB': 1024 ** 3}
+true_values = ('1', 'true', 'yes', 'on')
+
+
+def parse_size(size):
+    match = re.match(r'^\s*(\d+)\s*([KMG]?B?)\s*$', str(size), re.IGNORECASE)
+
+    if not match:
+        raise ValueError('Invalid size {}'.format(size))
+
+    return int(match.group(1)) * size_units[match.group(2).upper()]
+
+
+def parse_bool(value):
+    return str(value).lower() in true_values
+
+
+def open_storage(uri, read_only=False):
+    """Opens a ZODB storage from a given storage uri. The supported uris are:
+
+        file:///path/to/database.fs?blob_dir=/path/to/blobs&pack_keep_old=false
+        zeo://host:port?cache_size=200MB&client=worker&var=/path/to/cache_dir
+        zeo:///path/to/zeo.sock?cache_size=200MB&client=worker&var=/path/to/cache_dir
+
+    For 'file' uris, the query arguments are passed to ZODB.FileStorage.FileStorage. For 'zeo' uris, the query
+    arguments are passed to ZEO.ClientStorage.ClientStorage. Giving a 'client' name for a ZEO storage makes the client
+    cache persistent, so it stays warm between restarts. The ZEO package is needed for 'zeo' uris.
+
+    Args:
+        uri (str): The storage uri.
+        read_only (bool): If enabled, the storage is opened read-only.
+
+    Returns:
+        The opened storage.
+    """
+    parsed = urlparse(uri)
+    args = dict(parse_qsl(parsed.query))
+
+    if parse_bool(args.pop('read_only', read_only)):
+        args['read_only'] = True
+
+    if parsed.scheme == 'file':
+        import ZODB.FileStorage
+
+        for key in ('create', 'pack_gc', 'pack_keep_old'):
+            if key in args:
+                args[key] = parse_bool(args[key])
+        if 'quota' in args:
+            args['quota'] = parse_size(args['quota'])
+
+        return ZODB.FileStorage.FileStorage(unquote(parsed.netloc + parsed.path), **args)
+
+    elif parsed.scheme == 'zeo':
+        try:
+            import ZEO.ClientStorage
+        except ImportError:
+            raise ImportError('The ZEO package is needed for zeo storages. Make sure you have it installed!')
+
+        if parsed.hostname:
+            address = (parsed.hostname, parsed.port or 8100)
+        else:
+            address = unquote(parsed.path)
+
+        for key in ('cache_size',):
+            if key in args:
+                args[key] = parse_size(args[key])
+        for key in ('wait', 'shared_blob_dir'):
+            if key in args:
+                args[key] = parse_bool(args[key])
+        if 'wait_timeout' in args:
+            args['wait_timeout'] = float(args['wait_timeout'])
+
+        return ZEO.ClientStorage.ClientStorage(address, **args)
+
+    else:
+        raise ValueError('Unsupported storage uri {}. Use "file://" or "zeo://" uris.'.format(uri))
@@ -15,7 +15,6 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/EskoSalaka/mtgtools",
     packages=find_packages(exclude=("tests", )),
-    namespace_packages=['mtgtools'],
     classifiers=[
         "Programming Language :: Python :: 3.5",
         "License :: OSI Approved :: Zope Public License",
@@ -1,10 +1,27 @@
+import gzip
+import io
+import json
+import os
+import pickle
+import threading
 import unittest
 import warnings
 
+from unittest import mock
+
+import ZODB.MappingStorage
+
 from mtgtools import MtgDB
 
+from mtgtools.PCard import PCard, NUMERIC_FIELDS
 from mtgtools.PCardList import PCardList
+from mtgtools.PCountedList import PCountedList
+from mtgtools.CardListView import CardListView
+from mtgtools.PSet import PSet
 from mtgtools.PSetList import PSetList
+from mtgtools.PriceHistory import PriceHistory
+from mtgtools.SQLiteMirror import SQLiteMirror
+from mtgtools.CatalogSnapshot import CatalogSnapshot
 
 tool = MtgDB.MtgDB("testdb.fs")
 tool.scryfall_bulk_update()
@@ -72,12 +89,50 @@ testlist = other + tokens + creatures + non_basic_lands + \
 
 class TestPCardsListMethodsScryfall(unittest.TestCase):
     def test_integrity(self):
-        tool.verify_scryfall_integrity()
+        report = tool.verify_scryfall_integrity()
+
+        self.assertTrue(report.ok)
+        self.assertEqual(report.card_count, len(cards))
+        self.assertTrue(tool.verify_scryfall_integrity(verbose=False).ok)
+
+        memory_db = MtgDB.MtgDB('', storage=ZODB.MappingStorage.MappingStorage)
+
+        for pset in sets[:2]:
+            set_cards = [PCard(card.as_dict()) for card in pset]
+            memory_db.root.scryfall_sets.append(PSet({'id': pset.id, 'code': pset.code, 'name': pset.name,
+                                                      'scryfall_uri': pset.scryfall_uri,
+                                                      'card_count': pset.card_count}, cards=set_cards))
+            memory_db.root.scryfall_cards.extend(set_cards)
+
+        duplicate = memory_db.root.scryfall_cards[0]
+        memory_db.root.scryfall_cards.append(duplicate)
+        memory_db.commit()
+
+        report = memory_db.verify_scryfall_integrity(verbose=False)
+
+        self.assertFalse(report.ok)
+        self.assertEqual(report.duplicate_cards, [duplicate.id])
+
+        memory_db.verify_scryfall_integrity(repair=True, verbose=False)
+
+        self.assertTrue(memory_db.verify_scryfall_integrity(verbose=False).ok)
+
+        # Changes which are not committed yet are checked as they are
+        new_card = PCard(dict(duplicate.as_dict(), id='new_card_id'))
+        memory_db.root.scryfall_cards.append(new_card)
+        memory_db.root.scryfall_sets.where_exactly(code=new_card.set)[0].append(new_card)
+        memory_db.root.scryfall_sets.where_exactly(code=new_card.set)[0].card_count += 1
+
+        self.assertTrue(memory_db.verify_scryfall_integrity(repair=True, verbose=False).ok)
+        self.assertEqual(len(memory_db.root.scryfall_sets.where_exactly(code=new_card.set)[0].where_exactly(
+            id='new_card_id')), 1)
+        memory_db.commit()
+        memory_db.close()
 
     def test_basic_update(self):
         clean_db = MtgDB.MtgDB("clean_db.fs")
         clean_db.scryfall_bulk_update()
-        clean_db.verify_scryfall_integrity()
+        self.assertTrue(clean_db.verify_scryfall_integrity().ok)
         clean_db.close()
 
     def test_update_changed_sets(self):
@@ -119,7 +174,7 @@ class TestPCardsListMethodsScryfall(unittest.TestCase):
             for card in pset.cards:
                 self.assertEqual(card.set, pset.code)
 
-        clean_db.verify_scryfall_integrity()
+        self.assertTrue(clean_db.verify_scryfall_integrity().ok)
 
         clean_db.close()
 
@@ -152,7 +207,7 @@ class TestPCardsListMethodsScryfall(unittest.TestCase):
             for card in pset.cards:
                 self.assertEqual(card.set, pset.code)
 
-        clean_db.verify_scryfall_integrity()
+        self.assertTrue(clean_db.verify_scryfall_integrity().ok)
         clean_db.close()
 
     def test_basic(self):
@@ -336,6 +391,276 @@ class TestPCardsListMethodsScryfall(unittest.TestCase):
         self.assertEqual(len(list1), 4)
         self.assertEqual(len(list2), 4)
 
+    def test_btree_storage(self):
+        list1 = PCardList(testlist, btree=True)
+        list2 = PCardList(testlist)
+
+        self.assertEqual(len(list1), len(testlist))
+        self.assertEqual(list(list1), list(testlist))
+        self.assertEqual(list(list1[10:20]), list(testlist[10:20]))
+        self.assertEqual(list1[-1], testlist[-1])
+        self.assertEqual(len(list1.where(type_line='creature')), 54)
+
+        list1.append(creatures[7])
+        list1.insert(0, creatures[8])
+        self.assertEqual(list1[0], creatures[8])
+        self.assertEqual(list1[-1], creatures[7])
+        self.assertEqual(list1.pop(0), creatures[8])
+        self.assertEqual(len(list1), len(testlist) + 1)
+
+        list1.insert(5, creatures[9])
+        self.assertEqual(list1[5], creatures[9])
+        self.assertEqual(list1[6], testlist[5])
+        list1.remove(creatures[9])
+        self.assertEqual(list(list1[:-1]), list(testlist))
+
+        list2.use_btree_storage()
+        self.assertEqual(list(list2), list(testlist))
+        list2.use_btree_storage(False)
+        self.assertEqual(list(list2), list(testlist))
+
+    def test_counted_list(self):
+        deck = PCardList(4 * creatures[:5], 2 * creatures[5:7])
+        counted = deck.counted()
+
+        self.assertEqual(len(counted), len(deck))
+        self.assertEqual(counted.count(creatures[0]), 4)
+        self.assertEqual(counted.count(creatures[5], sideboard=True), 2)
+        self.assertEqual(counted.count(creatures[8]), 0)
+        self.assertEqual(sorted(card.id for card in counted), sorted(card.id for card in deck))
+        self.assertEqual(counted.deck_str(group_by='none').count('\n'), deck.deck_str(group_by='none').count('\n'))
+        self.assertEqual(len(counted.creatures()), len(deck.creatures()))
+        self.assertEqual(counted.converted_mana_cost(), deck.converted_mana_cost())
+
+        counted.remove(creatures[0], 3)
+        counted.add(creatures[8], 2)
+        self.assertEqual(counted.count(creatures[0]), 1)
+        self.assertEqual(counted.count(creatures[8]), 2)
+
+        difference = counted - PCardList(creatures[:2])
+        self.assertEqual(difference.count(creatures[0]), 0)
+        self.assertEqual(difference.count(creatures[1]), 3)
+        self.assertEqual(len(counted.to_card_list()), len(counted))
+
+        # Cards added one at a time are saved with the list
+        memory_db = MtgDB.MtgDB('', storage=ZODB.MappingStorage.MappingStorage)
+        memory_db.root.my_deck = PCountedList()
+        memory_db.commit()
+
+        for card in creatures:
+            memory_db.root.my_deck.append(card)
+        memory_db.commit()
+        memory_db.connection.cacheMinimize()
+
+        self.assertEqual(len(memory_db.root.my_deck), len(creatures))
+        self.assertEqual(memory_db.root.my_deck.count(creatures[0]), creatures.count(creatures[0]))
+        memory_db.close()
+
+    def test_card_state(self):
+        card = creatures[0]
+        state = card.__getstate__()
+
+        copied = PCard.__new__(PCard)
+        copied.__setstate__(state)
+        self.assertEqual(copied.__dict__, card.__dict__)
+        self.assertNotIn(None, state[1])
+
+        old_state = dict(card.__dict__, content_warning=None)
+        copied = PCard.__new__(PCard)
+        copied.__setstate__(old_state)
+        self.assertEqual(copied.name, card.name)
+        self.assertIsNone(copied.content_warning)
+        self.assertNotIn('content_warning', copied.__dict__)
+
+        self.assertIn('content_warning', card.as_dict())
+        self.assertEqual(card.api_type, 'scryfall')
+
+    def test_derived_uris(self):
+        card = creatures[0]
+
+        self.assertEqual(card.uri, 'https://api.scryfall.com/cards/{}'.format(card.id))
+        self.assertEqual(card.rulings_uri, 'https://api.scryfall.com/cards/{}/rulings'.format(card.id))
+        self.assertNotIn('uri', card.__dict__)
+        self.assertEqual(card.as_dict()['uri'], card.uri)
+        self.assertIs(card.lang, creatures[1].lang)
+
+        copied = PCard(card.as_dict())
+        copied.uri = 'https://example.com'
+        self.assertEqual(copied.uri, 'https://example.com')
+
+    def test_card_extras(self):
+        card = PCard(creatures[0].as_dict())
+
+        self.assertNotIn('legalities', card.__dict__)
+        self.assertEqual(card.legalities, creatures[0].legalities)
+        self.assertEqual(card.as_dict()['prices'], creatures[0].prices)
+
+        card.update({'prices': {'usd': '1.00'}, 'legalities': None})
+        self.assertEqual(card.prices, {'usd': '1.00'})
+        self.assertIsNone(card.legalities)
+
+        # A card saved by older versions as a plain attribute dictionary with the extras in the card itself
+        memory_db = MtgDB.MtgDB('', storage=ZODB.MappingStorage.MappingStorage)
+        with mock.patch.object(PCard, '__getstate__', PCard.as_dict):
+            memory_db.root.my_cards = PCardList([PCard(creatures[0].as_dict())])
+            memory_db.commit()
+        memory_db.connection.cacheMinimize()
+
+        old_card = memory_db.root.my_cards[0]
+        self.assertEqual(old_card.prices, creatures[0].prices)
+        old_card.update({'prices': {'usd': '7.77'}})
+        self.assertTrue(old_card._p_changed)
+        memory_db.commit()
+        memory_db.connection.cacheMinimize()
+
+        self.assertEqual(memory_db.root.my_cards[0].prices, {'usd': '7.77'})
+        self.assertEqual(memory_db.root.my_cards[0].legalities, creatures[0].legalities)
+        memory_db.close()
+
+    def test_update_unchanged_cards(self):
+        # The cards as they come from the bulk data, that is, without the numeric values of the faces
+        card_jsons = []
+        for card in creatures.unique_cards():
+            card_json = dict((key, value) for key, value in card.as_dict().items() if key not in NUMERIC_FIELDS)
+
+            if card_json.get('card_faces'):
+                card_json['card_faces'] = [dict((key, value) for key, value in face.items()
+                                                if key not in NUMERIC_FIELDS) for face in card_json['card_faces']]
+            card_jsons.append(card_json)
+
+        memory_db = MtgDB.MtgDB('', storage=ZODB.MappingStorage.MappingStorage)
+        memory_db.root.my_cards = PCardList([PCard(card_json) for card_json in card_jsons])
+        memory_db.commit()
+
+        for _ in range(2):
+            for card, card_json in zip(memory_db.root.my_cards, card_jsons):
+                card.update(card_json)
+
+            changed = [card.name for card in memory_db.root.my_cards if card._p_changed]
+            memory_db.commit()
+
+        self.assertEqual(changed, [])
+        self.assertTrue(any(card.card_faces for card in memory_db.root.my_cards))
+        self.assertFalse(any('power_num' in face for card_json in card_jsons
+                             for face in card_json.get('card_faces') or []))
+        memory_db.close()
+
+    def test_sqlite_mirror(self):
+        mirror = SQLiteMirror('testdb_mirror.sqlite', tool.connection)
+        mirror.refresh(tool.root, tool.storage)
+
+        self.assertEqual(len(mirror), len(cards))
+        self.assertEqual(mirror.refresh(tool.root, tool.storage), 0)
+        self.assertEqual(len(mirror.where_exactly(name='wild mongrel')), len(cards.where_exactly(name='wild mongrel')))
+        self.assertEqual(len(mirror.where(colors=['G'], rows=True)), len(cards.where(colors=['G'])))
+        self.assertIn('Wild Mongrel', [card.name for card in mirror.search('name:mongrel')])
+
+        mirror.close()
+
+        # Cards removed from the catalog are removed from the mirror by the incremental refresh
+        memory_db = MtgDB.MtgDB('', storage=ZODB.MappingStorage.MappingStorage)
+        memory_db.root.scryfall_cards.extend([PCard(card.as_dict()) for card in testlist.unique_cards()])
+        memory_db.commit()
+
+        if os.path.exists('testdb_mirror_memory.sqlite'):
+            os.remove('testdb_mirror_memory.sqlite')
+
+        mirror = SQLiteMirror('testdb_mirror_memory.sqlite', memory_db.connection)
+        mirror.refresh(memory_db.root, memory_db.storage)
+        removed = memory_db.root.scryfall_cards[0]
+        memory_db.root.scryfall_cards.remove(removed)
+        removed.update({'prices': {'usd': '1.00'}})
+        memory_db.commit()
+
+        self.assertEqual(mirror.refresh(memory_db.root, memory_db.storage), 0)
+        self.assertEqual(len(mirror), len(memory_db.root.scryfall_cards))
+        self.assertEqual(len(mirror.where_exactly(id=removed.id, rows=True)), 0)
+
+        # Other threads load the cards through their own connections
+        found = []
+
+        def query_mirror():
+            with memory_db.open_connection() as root:
+                mirrored = mirror.where_exactly(id=memory_db.root.scryfall_cards[0].id, root=root)
+                found.append((mirrored[0]._p_jar is root.scryfall_cards._p_jar, mirrored[0].name))
+
+        thread = threading.Thread(target=query_mirror)
+        thread.start()
+        thread.join()
+        self.assertEqual(found, [(True, memory_db.root.scryfall_cards[0].name)])
+
+        mirror.close()
+        memory_db.close()
+        os.remove('testdb_mirror_memory.sqlite')
+
+    def test_snapshot(self):
+        self.assertEqual(tool.export_snapshot('testdb.snapshot'), len(cards))
+
+        snapshot = CatalogSnapshot('testdb.snapshot')
+        mongrels = snapshot.where_exactly(name='wild mongrel')
+
+        self.assertEqual(len(snapshot), len(cards))
+        self.assertEqual(len(mongrels), len(cards.where_exactly(name='wild mongrel')))
+        self.assertEqual(snapshot.row(mongrels[0])['name'], 'Wild Mongrel')
+        self.assertEqual(snapshot.card(mongrels[0])['oracle_id'], snapshot.value(mongrels[0], 'oracle_id'))
+        self.assertEqual(len(snapshot.where(cmc=0)), len(cards.where(cmc=0)))
+        self.assertEqual(len(snapshot.where(name='ÆTHER')), len(cards.where(name='ÆTHER')))
+
+        snapshot.close()
+
+    def test_changed_cards(self):
+        self.assertEqual(tool.update_runs()[-1]['kind'], 'scryfall_bulk_update')
+
+        memory_db = MtgDB.MtgDB('', storage=ZODB.MappingStorage.MappingStorage)
+        memory_db.root.scryfall_cards.extend([PCard(card.as_dict()) for card in testlist[:5]])
+        memory_db.commit()
+
+        start = memory_db.storage.lastTransaction()
+        memory_db.root.scryfall_cards[0].update({'prices': {'usd': '123.45'}})
+        memory_db.root.scryfall_cards[1].update({'name': 'xxxyyyy'})
+        memory_db.commit()
+
+        changed = memory_db.changed_cards(start)
+
+        self.assertEqual(len(changed), 2)
+        self.assertTrue(changed.has_all(memory_db.root.scryfall_cards[:2]))
+        self.assertEqual(len(memory_db.changed_cards(start.hex(), start)), 0)
+
+        with self.assertRaises(ValueError):
+            memory_db.changed_cards(-1)
+
+        memory_db.close()
+
+    def test_ndjson_export(self):
+        output = io.StringIO()
+
+        self.assertEqual(testlist.to_ndjson(output), len(testlist))
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), len(testlist))
+        self.assertEqual(PCard(json.loads(lines[0])).name, testlist[0].name)
+
+        compressed = io.BytesIO()
+        testlist.to_ndjson(compressed, fields=['id', 'name', 'prices'], compress=True, chunk_size=3)
+        lines = gzip.decompress(compressed.getvalue()).decode('utf-8').splitlines()
+
+        self.assertEqual(len(lines), len(testlist))
+        self.assertEqual(sorted(json.loads(lines[-1])), ['id', 'name', 'prices'])
+
+    def test_bulk_load(self):
+        sets[:3].to_ndjson_shards('testdb_shards', compress=True)
+        card_count = sum(len(pset) for pset in sets[:3])
+
+        memory_db = MtgDB.MtgDB('', storage=ZODB.MappingStorage.MappingStorage)
+
+        self.assertEqual(memory_db.bulk_load('testdb_shards', chunk_size=100, verbose=False), card_count)
+        self.assertEqual(len(memory_db.root.scryfall_cards), card_count)
+        self.assertEqual(sorted(pset.code for pset in memory_db.root.scryfall_sets),
+                         sorted(pset.code for pset in sets[:3]))
+        self.assertEqual(memory_db.update_runs()[-1]['kind'], 'bulk_load')
+
+        memory_db.close()
+
     def test_filter_and_sort(self):
         self.assertEqual(len(testlist), len(testlist.sorted(lambda card: card.name)))
         self.assertEqual(len(testlist), len(testlist.sorted(lambda card: card.cmc)))
@@ -519,8 +844,10 @@ class TestPCardsListMethodsScryfall(unittest.TestCase):
             testlist.where(colors=None)
             testlist.where(colorrrrs=None)
             PCardList().where(colors=None)
+            testlist.where(text='Flying')
 
-            self.assertEqual(len(w), 4)
+            self.assertEqual(len(w), 5)
+            self.assertIn('unrecognized keyword text', str(w[-1].message))
 
     def test_sets(self):
         self.assertEqual(len(sets.where(code='aer')), 3)
@@ -584,6 +911,307 @@ class TestPCardsListMethodsScryfall(unittest.TestCase):
         print(list1.json)
         print(list1.json)
 
+    def test_price_history(self):
+        history = PriceHistory()
+        card = testlist.where_exactly(name='Wild Mongrel')[0]
+        old_prices = dict(card.prices)
+
+        self.assertEqual(history.record(testlist.unique_cards(), timestamp=1000), 48)
+        self.assertEqual(history.record(testlist.unique_cards(), timestamp=2000), 0)
+
+        card.prices = dict(old_prices, usd='1000.00')
+        self.assertEqual(history.record(testlist.unique_cards(), timestamp=3000), 1)
+        card.prices = old_prices
+
+        self.assertEqual(len(history), 3)
+        self.assertEqual(history.price_at(card.id, 2500), float(old_prices['usd']))
+        self.assertEqual(history.price_at(card.id), 1000.0)
+        self.assertEqual(len(history.history(card.id)), 3)
+        self.assertEqual(len(history.history(card.id, start=1500, end=2500)), 1)
+        self.assertEqual(history.top_movers(1000, num=1)[0][0], card.id)
+        self.assertEqual(history.moving_average(card.id, window=2)[-1][1], (float(old_prices['usd']) + 1000) / 2)
+        self.assertTrue(card.id in history.moving_averages(window=2))
+
+    def test_rulings(self):
+        self.assertTrue(len(tool.root.scryfall_rulings) > 0)
+        self.assertTrue(tool.root.scryfall_rulings.updated_at)
+
+        mongrel = cards.where_exactly(name='Wild Mongrel')[0]
+        self.assertTrue(len(mongrel.get_rulings()) > 0)
+        self.assertEqual(mongrel.get_rulings(), tool.root.scryfall_rulings.get(mongrel.oracle_id))
+        self.assertEqual(mongrel.get_rulings(), cards.where_exactly(name='Wild Mongrel')[1].get_rulings())
+
+    def test_connections(self):
+        results = []
+
+        def query():
+            with tool.open_connection() as root:
+                results.append(len(root.scryfall_cards.where_exactly(name='Wild Mongrel')))
+
+        threads = [threading.Thread(target=query) for _ in range(8)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, 8 * [len(cards.where_exactly(name='Wild Mongrel'))])
+
+        with self.assertRaises(Exception):
+            with tool.open_connection() as root:
+                root.scryfall_cards.name = 'xxxyyyy'
+                root.scryfall_cards._p_jar.transaction_manager.commit()
+
+        self.assertNotEqual(cards.name, 'xxxyyyy')
+
+    def test_storages(self):
+        memory_db = MtgDB.MtgDB('', storage=ZODB.MappingStorage.MappingStorage)
+        memory_db.root.my_cards = testlist
+        memory_db.commit()
+
+        self.assertEqual(len(memory_db.root.my_cards), len(testlist))
+        self.assertEqual(len(memory_db.root.scryfall_cards), 0)
+        memory_db.close()
+
+        file_db = MtgDB.MtgDB('file://clean_db.fs?pack_keep_old=false')
+        self.assertTrue(len(file_db.root.scryfall_cards) > 0)
+        file_db.close()
+
+        with self.assertRaises(ValueError):
+            MtgDB.MtgDB('xyz://clean_db.fs')
+
+    def test_pinned_catalog(self):
+        pinned_db = MtgDB.MtgDB("clean_db.fs", pin_catalog=True)
+        pinned_db.cache_stats(reset=True)
+
+        pinned_db.root.scryfall_cards.where(name='Wild Mongrel')
+        pinned_db.abort()
+        pinned_db.root.scryfall_cards.where(name='Wild Mongrel')
+        stats = pinned_db.cache_stats()
+
+        self.assertTrue(stats['catalog_pinned'])
+        self.assertEqual(stats['misses'], 0)
+        self.assertEqual(stats['resident_cards'], len(pinned_db.root.scryfall_cards) + len(pinned_db.root.mtgio_cards))
+        pinned_db.close()
+
+    def test_query(self):
+        self.assertEqual(len(creatures.query('t:creature')), len(creatures))
+        self.assertEqual(len(basic_lands.query('t:"basic land"')), len(basic_lands))
+        self.assertEqual(len(creatures.query('!"wild mongrel"')), 3)
+        self.assertEqual(len(creatures.query('mongrel or aquamoeba')), 6)
+        self.assertEqual(len(testlist.query('r:rare')), len(testlist.where_exactly(rarity='rare')))
+
+        indexed = PCardList(testlist)
+        indexed.create_index()
+
+        for query in ('t:creature c>=rg cmc<=3', 'o:"draw a card" -is:digital', 'c:colorless', 'id<=ur', 'r>=rare',
+                      '(s:od or s:m19) -t:creature', 'pow>tou', 'f:modern', 'year>=2015', 'cmc=2'):
+            self.assertEqual(sorted(card.id for card in indexed.query(query)),
+                             sorted(card.id for card in testlist.query(query)))
+
+        card = indexed[0]
+        indexed.remove(card)
+        indexed.append(card)
+        self.assertEqual(len(indexed.query('!"{}"'.format(card.name))), len(testlist.query('!"{}"'.format(card.name))))
+
+        indexed.clear()
+        self.assertEqual(len(indexed.query('t:creature')), 0)
+
+        with self.assertRaises(ValueError):
+            testlist.query('xyz:abc')
+
+    def test_ranges(self):
+        indexed = testlist.unique_cards().persist()
+        indexed.create_index('cmc', 'prices.usd', 'released_at')
+        unindexed = PCardList(indexed)
+
+        for args in (('cmc', 2, 4), ('prices.usd', None, 1), ('released_at', '2015-01-01')):
+            self.assertEqual(sorted(card.id for card in indexed.in_range(*args)),
+                             sorted(card.id for card in unindexed.in_range(*args)))
+            self.assertEqual(indexed.min_value(args[0]), unindexed.min_value(args[0]))
+            self.assertEqual(indexed.max_value(args[0]), unindexed.max_value(args[0]))
+            self.assertEqual([card.id for card in indexed.ordered_by(args[0], reverse=True)],
+                             [card.id for card in unindexed.ordered_by(args[0], reverse=True)])
+
+        self.assertTrue(all(2 <= card.cmc <= 4 for card in indexed.in_range('cmc', 2, 4)))
+        self.assertEqual(len(indexed.in_range('cmc', 2, 2, include_high=False)), 0)
+        self.assertEqual(sorted(card.id for card in indexed.query('cmc>=2 cmc<4 year<2015')),
+                         sorted(card.id for card in unindexed.query('cmc>=2 cmc<4 year<2015')))
+
+        cmcs = [card.cmc for card in indexed.ordered_by('cmc')]
+        self.assertEqual(cmcs, sorted(cmcs))
+
+    def test_predicates(self):
+        from mtgtools.CardQuery import Attributes
+
+        def ids(cards):
+            return [card.id for card in cards]
+
+        red = Attributes(colors='R')
+        creature = Attributes(type_line='creature')
+        cheap = Attributes(True, cmc=1)
+
+        self.assertEqual(ids(testlist.query(red & creature)), ids(testlist.where(colors='R').creatures()))
+        self.assertEqual(ids(testlist.query(red | creature)),
+                         ids(card for card in testlist if red.matches(card) or creature.matches(card)))
+        self.assertEqual(ids(testlist.query(~(red & cheap))), ids(testlist - testlist.query(red & cheap)))
+        self.assertEqual(ids(testlist.query(~~red)), ids(testlist.query(red)))
+        self.assertEqual(ids(testlist.query(red & (creature | cheap))),
+                         ids(testlist.query((red & creature) | (red & cheap))))
+        self.assertEqual(len((red & creature & cheap).nodes), 3)
+
+        groups = testlist.grouped_by_type()
+        self.assertEqual(ids(groups['creatures']), ids(testlist.creatures()))
+        self.assertEqual(ids(groups['lands']), ids(testlist.lands() - testlist.creatures()))
+        self.assertEqual(ids(groups['artifacts']),
+                         ids(testlist.artifacts() - testlist.creatures() - testlist.lands() - testlist.enchantments()))
+
+    def test_views(self):
+        view = testlist.where(type_line='creature')
+
+        self.assertIsInstance(view, CardListView)
+        self.assertIsInstance(view[0:2], CardListView)
+        self.assertIsInstance(testlist.grouped_by_type()['lands'], CardListView)
+        self.assertIsInstance(view + creatures[0], PCardList)
+        self.assertFalse(hasattr(view, '__dict__'))
+        self.assertEqual(len(view.creatures()), len(view))
+        self.assertEqual(view.deck_str(), PCardList(view).deck_str())
+
+        with self.assertRaises(TypeError):
+            pickle.dumps(view)
+
+        persisted = view.persist('creatures')
+        persisted.append(creatures[0])
+
+        self.assertIsInstance(persisted, PCardList)
+        self.assertEqual(persisted.name, 'creatures')
+        self.assertEqual(list(persisted)[:-1], list(view))
+
+    def test_early_termination(self):
+        mongrel = testlist.first(exactly=True, name='wild mongrel')
+        creature_cards = testlist.where(type_line='creature')
+
+        self.assertEqual(mongrel, testlist.where_exactly(name='wild mongrel')[0])
+        self.assertEqual(next(testlist.iter_where(exactly=True, name='wild mongrel')), mongrel)
+        self.assertIsNone(testlist.first(exactly=True, name='xxxyyyy'))
+        self.assertTrue(testlist.exists(type_line='creature'))
+        self.assertFalse(testlist.exists(exactly=True, name='xxxyyyy'))
+        self.assertEqual(testlist.count(type_line='creature'), len(creature_cards))
+        self.assertEqual(testlist.count(mongrel), testlist.cards.count(mongrel))
+        self.assertEqual(list(testlist.limit(4, type_line='creature')), list(creature_cards[0:4]))
+        self.assertEqual(list(testlist.limit(2)), list(testlist[0:2]))
+
+    def test_query_cache(self):
+        memory_db = MtgDB.MtgDB('', storage=ZODB.MappingStorage.MappingStorage)
+        memory_db.root.my_cards = PCardList([PCard(card.as_dict()) for card in testlist])
+        my_cards = memory_db.root.my_cards
+        my_cards.set_query_cache(max_entries=2)
+        memory_db.commit()
+
+        mongrels = my_cards.where_exactly(name='wild mongrel')
+        self.assertEqual(list(my_cards.where_exactly(name='wild mongrel')), list(mongrels))
+        self.assertEqual(my_cards.query_cache_stats()['hits'], 1)
+
+        # Changing the cards of a result does not change the cached result
+        my_cards.where_exactly(name='wild mongrel').cards.append(testlist[0])
+        self.assertEqual(list(my_cards.where_exactly(name='wild mongrel')), list(mongrels))
+
+        my_cards.append(mongrels[0])
+        self.assertEqual(len(my_cards.where_exactly(name='wild mongrel')), len(mongrels) + 1)
+        self.assertEqual(len(my_cards.where_exactly(name='wild mongrel')), len(mongrels) + 1)
+
+        mongrels[0].update({'name': 'xxxyyyy'})
+        memory_db.commit()
+        self.assertEqual(len(my_cards.where_exactly(name='wild mongrel')), len(mongrels) - 1)
+
+        # Changes to the cards are seen before they are committed
+        self.assertEqual(len(my_cards.where_exactly(name='xxxyyyy')), 2)
+        my_cards.where_exactly(name='forest')[0].update({'name': 'xxxyyyy'})
+        self.assertEqual(len(my_cards.where_exactly(name='xxxyyyy')), 3)
+        memory_db.commit()
+        self.assertEqual(len(my_cards.where_exactly(name='xxxyyyy')), 3)
+
+        for name in ('forest', 'island', 'swamp'):
+            my_cards.where_exactly(name=name)
+
+        stats = my_cards.query_cache_stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertTrue(stats['evictions'] > 0)
+
+        my_cards.where_exactly(name='island')[0].update({'name': 'xxxyyyy'})
+        memory_db.commit()
+        self.assertEqual(len(my_cards.where_exactly(name='xxxyyyy')), 4)
+        self.assertTrue(my_cards.query_cache_stats()['invalidations'] >= 1)
+
+        my_cards.set_query_cache(0)
+        memory_db.commit()
+        self.assertIsNone(my_cards.query_cache_stats())
+        memory_db.close()
+
+    def test_closest_names(self):
+        self.assertEqual(testlist.closest_names('wild mongrl', 1), ['Wild Mongrel'])
+        self.assertEqual(testlist.closest_names('Aquameoba', 1), ['Aquamoeba'])
+        self.assertEqual(testlist.closest_names('mistbinder', 1), ['Merfolk Mistbinder'])
+        self.assertEqual(testlist.closest_names('xxxxxxxxxxxx', 3, max_distance=2), [])
+
+        memory_db = MtgDB.MtgDB('', storage=ZODB.MappingStorage.MappingStorage)
+        memory_db.root.my_cards = PCardList([PCard(card.as_dict()) for card in testlist])
+        my_cards = memory_db.root.my_cards
+        my_cards.create_name_index()
+        memory_db.commit()
+
+        self.assertTrue(my_cards.has_name_index)
+        self.assertEqual(my_cards.indexed_fields, ['name'])
+        for query in ('wild mongrl', 'ogre taskmastr', 'midnite banshee', 'FORSET'):
+            self.assertEqual(my_cards.closest_names(query, 3), testlist.closest_names(query, 3))
+
+        for card in my_cards.where_exactly(name='aquamoeba'):
+            my_cards.remove(card)
+        self.assertNotIn('Aquamoeba', my_cards.closest_names('Aquameoba', 5))
+        my_cards.append(testlist.where_exactly(name='aquamoeba')[0])
+        self.assertEqual(my_cards.closest_names('Aquameoba', 1), ['Aquamoeba'])
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            deck = my_cards.from_str('2 Wild Mongrl\n3 Aquameoba\n1 Not A Card At All', fuzzy=True)
+        self.assertEqual(len(deck.where_exactly(name='wild mongrel')), 2)
+        self.assertEqual(len(deck.where_exactly(name='aquamoeba')), 3)
+        self.assertEqual(len(deck), 5)
+        self.assertEqual(len(caught), 3)
+        self.assertEqual(len(my_cards.from_str('2 Wild Mongrl')), 0)
+
+        my_cards.drop_name_index()
+        self.assertFalse(my_cards.has_name_index)
+        self.assertEqual(my_cards.closest_names('wild mongrl', 1), ['Wild Mongrel'])
+        memory_db.commit()
+        memory_db.close()
+
+    def test_database_stats(self):
+        memory_db = MtgDB.MtgDB('', storage=ZODB.MappingStorage.MappingStorage)
+        memory_db.stats(reset=True)
+        memory_db.root.my_cards = PCardList([PCard(card.as_dict()) for card in testlist])
+        memory_db.commit()
+        memory_db.pack()
+        stats = memory_db.stats()
+
+        self.assertEqual(stats['commits'], 1)
+        self.assertEqual(stats['packs'], 1)
+        self.assertTrue(stats['stores'] >= len(testlist))
+        self.assertTrue(stats['store_bytes'] > 0)
+        self.assertEqual(stats['last_update_run'], None)
+
+        memory_db._record_update_run('test', memory_db._run_counters())
+        self.assertEqual(memory_db.stats()['last_update_run']['stats']['commits'], 0)
+
+        memory_db.write_metrics('test_metrics.prom')
+        with open('test_metrics.prom') as file:
+            metrics = file.read()
+        os.remove('test_metrics.prom')
+
+        self.assertIn('mtgtools_storage_commits_total 2.0', metrics)
+        self.assertIn('mtgtools_last_update_run_seconds{kind="test"}', metrics)
+        memory_db.close()
+
     def test_pretty_print_and_str(self):
         cards.pprint()
         print(cards.deck_str())